@@ -0,0 +1,117 @@
+"""Microbenchmark of the WADA-SNR statistics (time, memory and accuracy)."""
+import sys
+import time
+import tracemalloc
+import warnings
+from pathlib import Path
+
+import numpy as np
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+sys.path.append(str(REPO_DIR / "wada_snr"))
+from calculate_wada_snr import wada_snr  # noqa: E402
+from wada_snr_kernel import numba, wada_stats  # noqa: E402
+
+
+def reference_stats(audio, min_val=1e-10):
+    """The statistics as computed in the original `wada_snr()` (temporaries)."""
+    audio = audio / np.max(np.abs(audio))
+    audio = np.abs(audio)
+    np.clip(audio, min_val, None, out=audio)
+    return (
+        np.mean(audio, axis=0),
+        np.mean(np.log(audio), axis=0),
+        np.sum(audio**2, axis=0),
+    )
+
+
+def synthesize(num_samples, num_channels, snr, rng):
+    """Gamma-distributed "speech" amplitudes plus Gaussian noise at `snr` dB."""
+    speech = rng.gamma(0.4, 1.0, (num_samples, num_channels))
+    speech *= rng.choice([-1.0, 1.0], speech.shape)
+    noise = rng.normal(0.0, speech.std() * 10 ** (-snr / 20), speech.shape)
+    audio = (speech + noise).astype(np.float32)
+    audio[: num_samples // 100] = 0  # leading digital silence
+    return audio[:, 0] if num_channels == 1 else audio
+
+
+def measure(fn, audio, repeats):
+    fn(audio)  # warm-up (and JIT compilation)
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn(audio)
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    fn(audio)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return float(np.median(times)), peak
+
+
+################################################################
+# Main entry
+################################################################
+def main(args):
+    rng = np.random.default_rng(args.seed)
+    num_samples = int(args.duration * args.sample_rate)
+    audio = synthesize(num_samples, args.channels, 20.0, rng)
+    nbytes = audio.nbytes
+
+    impls = {"reference": reference_stats, "numpy": lambda x: wada_stats(x, backend="numpy")}
+    if numba is not None:
+        impls["numba"] = lambda x: wada_stats(x, backend="numba")
+    else:
+        print("Numba is not installed; only the NumPy kernel is benchmarked")
+
+    print(
+        f"Signal: {args.duration:.1f} s x {args.channels} ch at {args.sample_rate} Hz "
+        f"(float32, {nbytes / 2**20:.1f} MiB)"
+    )
+    print(f"{'implementation':<16} {'time (ms)':>10} {'GiB/s':>8} {'peak alloc (MiB)':>18}")
+    base = None
+    for name, fn in impls.items():
+        t, peak = measure(fn, audio, args.repeats)
+        base = base or t
+        print(
+            f"{name:<16} {t * 1e3:>10.2f} {nbytes / t / 2**30:>8.2f} "
+            f"{peak / 2**20:>18.2f}   ({base / t:.2f}x)"
+        )
+
+    # accuracy of the final SNR against a float64 evaluation of the original code
+    errors = {"reference (float32)": [], "fused": []}
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        for _ in range(args.num_signals):
+            n = int(rng.integers(args.sample_rate // 10, num_samples + 1))
+            x = synthesize(n, args.channels, rng.uniform(-5, 60), rng)
+            exact = wada_snr(x.astype(np.float64), fused=False)
+            errors["reference (float32)"].append(abs(wada_snr(x, fused=False) - exact))
+            errors["fused"].append(abs(wada_snr(x, fused=True) - exact))
+    print(f"\nMax abs. SNR error (dB) over {args.num_signals} signals, vs. float64:")
+    for name, errs in errors.items():
+        print(f"  {name:<20} {max(errs):.2e}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--duration", type=float, default=10.0, help="Signal duration in seconds"
+    )
+    parser.add_argument("--sample_rate", type=int, default=48000, help="Sample rate")
+    parser.add_argument("--channels", type=int, default=1, help="Number of channels")
+    parser.add_argument(
+        "--repeats", type=int, default=20, help="Number of timed calls (median)"
+    )
+    parser.add_argument(
+        "--num_signals",
+        type=int,
+        default=50,
+        help="Number of random signals for the accuracy check",
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    args = parser.parse_args()
+
+    main(args)
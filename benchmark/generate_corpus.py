@@ -0,0 +1,110 @@
+from pathlib import Path
+
+import numpy as np
+import soundfile as sf
+
+
+SAMPLE_RATES = (8000, 16000, 22050, 24000, 32000, 44100, 48000)
+
+
+def synthesize_utterance(rng, duration, fs):
+    """Synthesize a speech-like signal: a few modulated harmonics plus noise.
+
+    Args:
+        rng (np.random.Generator): random number generator
+        duration (float): duration in seconds
+        fs (int): sampling rate in Hz
+    Returns:
+        audio (np.ndarray): synthesized signal (time,) in [-1, 1]
+    """
+    t = np.arange(int(duration * fs)) / fs
+    f0 = rng.uniform(90, 250) * (1 + 0.1 * np.sin(2 * np.pi * rng.uniform(0.5, 3) * t))
+    phase = 2 * np.pi * np.cumsum(f0) / fs
+    speech = sum(
+        np.sin(k * phase) / k for k in range(1, 8) if k * f0.max() < fs / 2
+    )
+    # syllable-like amplitude envelope
+    envelope = np.clip(np.sin(2 * np.pi * rng.uniform(2, 5) * t), 0, None) ** 2
+    snr = rng.uniform(-5, 30)
+    noise = rng.standard_normal(len(t))
+    noise *= np.std(speech * envelope) / (np.std(noise) * 10 ** (snr / 20) + 1e-8)
+    audio = speech * envelope + noise
+    return (0.9 * audio / (np.max(np.abs(audio)) + 1e-8)).astype(np.float32)
+
+
+def generate_corpus(
+    outdir,
+    num_utts=200,
+    min_duration=1.0,
+    max_duration=10.0,
+    sample_rates=SAMPLE_RATES,
+    seed=0,
+):
+    """Generate a synthetic multi-rate, multi-length FLAC corpus and its scp file.
+
+    Args:
+        outdir (str): output directory
+        num_utts (int): number of utterances
+        min_duration (float): minimum duration in seconds
+        max_duration (float): maximum duration in seconds
+        sample_rates (tuple): sampling rates (in Hz) to draw from
+        seed (int): random seed
+    Returns:
+        scp (Path): path to the generated scp file
+        total_duration (float): total duration of the corpus in seconds
+    """
+    rng = np.random.default_rng(seed)
+    outdir = Path(outdir)
+    (outdir / "audio").mkdir(parents=True, exist_ok=True)
+    scp = outdir / "corpus.scp"
+    total_duration = 0.0
+    with scp.open("w") as f:
+        for i in range(num_utts):
+            uid = f"fileid_{i + 1}"
+            fs = int(rng.choice(sample_rates))
+            duration = rng.uniform(min_duration, max_duration)
+            path = (outdir / "audio" / f"{uid}.flac").resolve()
+            sf.write(path, synthesize_utterance(rng, duration, fs), fs)
+            total_duration += duration
+            f.write(f"{uid} {path}\n")
+    return scp, total_duration
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--output_dir",
+        type=str,
+        required=True,
+        help="Path to the output directory for writing the corpus",
+    )
+    parser.add_argument(
+        "--num_utts", type=int, default=200, help="Number of utterances"
+    )
+    parser.add_argument(
+        "--min_duration", type=float, default=1.0, help="Minimum duration in seconds"
+    )
+    parser.add_argument(
+        "--max_duration", type=float, default=10.0, help="Maximum duration in seconds"
+    )
+    parser.add_argument(
+        "--sample_rates",
+        type=int,
+        nargs="+",
+        default=list(SAMPLE_RATES),
+        help="Sampling rates (in Hz) to draw from",
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    args = parser.parse_args()
+
+    scp, total_duration = generate_corpus(
+        args.output_dir,
+        num_utts=args.num_utts,
+        min_duration=args.min_duration,
+        max_duration=args.max_duration,
+        sample_rates=args.sample_rates,
+        seed=args.seed,
+    )
+    print(f"Generated {args.num_utts} utterances ({total_duration:.1f} s) in {scp}")
@@ -0,0 +1,99 @@
+import shutil
+import sys
+from pathlib import Path
+
+import torch
+import yaml
+
+
+STAND_IN_DIR = Path(__file__).resolve().parent / "stand_ins"
+
+VQSCORE_PARAMS = {
+    "input_dim": 257,
+    "hidden_dim": 128,
+    "codebook_size": 2048,
+    "codebook_dim": 32,
+    "num_layers": 4,
+}
+
+
+def prepare_stand_ins(workdir, seed=0):
+    """Create random-weight stand-ins for the external models in `workdir`.
+
+    The layout mirrors what the scoring scripts expect when run from `workdir`:
+        DNSMOSPro/utils.py, DNSMOSPro/model_best.pt  (TorchScript model)
+        VQscore/models/VQVAE_models.py, VQscore/config.yaml, VQscore/checkpoint.pkl
+        site-packages/{scoreq,utmosv2,wvmos}/  (to be added to PYTHONPATH)
+        torch_home/hub/tarepan_SpeechMOS_v1.2.0/  (UTMOS, with TORCH_HOME=torch_home)
+
+    Args:
+        workdir (str): working directory in which the scripts will be run
+        seed (int): random seed for initializing the model weights
+    Returns:
+        paths (dict): paths to the model files, the extra PYTHONPATH and TORCH_HOME
+    """
+    workdir = Path(workdir).resolve()
+    torch.manual_seed(seed)
+
+    # DNSMOS Pro
+    shutil.copytree(STAND_IN_DIR / "DNSMOSPro", workdir / "DNSMOSPro", dirs_exist_ok=True)
+    sys.path.insert(0, str(STAND_IN_DIR / "DNSMOSPro"))
+    from model import DNSMOSProStandIn
+
+    sys.path.pop(0)
+    dnsmos_pro_model = workdir / "DNSMOSPro" / "model_best.pt"
+    torch.jit.script(DNSMOSProStandIn().eval()).save(str(dnsmos_pro_model))
+
+    # VQscore
+    shutil.copytree(STAND_IN_DIR / "VQscore", workdir / "VQscore", dirs_exist_ok=True)
+    sys.path.insert(0, str(STAND_IN_DIR / "VQscore"))
+    from models.VQVAE_models import VQVAE_QE
+
+    sys.path.pop(0)
+    vqscore_conf = workdir / "VQscore" / "config.yaml"
+    with vqscore_conf.open("w") as f:
+        yaml.dump({"VQVAE_params": VQSCORE_PARAMS, "input_transform": "log1p"}, f)
+    vqscore_model = workdir / "VQscore" / "checkpoint.pkl"
+    state_dict = VQVAE_QE(**VQSCORE_PARAMS).state_dict()
+    torch.save({"model": {"VQVAE": state_dict}}, vqscore_model)
+
+    # SCOREQ, UTMOSv2 and WV-MOS (initialized with a fixed seed inside the
+    # stand-in packages)
+    site_packages = workdir / "site-packages"
+    for package in ("scoreq", "utmosv2", "wvmos"):
+        shutil.copytree(
+            STAND_IN_DIR / package, site_packages / package, dirs_exist_ok=True
+        )
+
+    # UTMOS (torch.hub uses the cached repo instead of downloading it)
+    torch_home = workdir / "torch_home"
+    shutil.copytree(
+        STAND_IN_DIR / "SpeechMOS",
+        torch_home / "hub" / "tarepan_SpeechMOS_v1.2.0",
+        dirs_exist_ok=True,
+    )
+
+    return {
+        "dnsmos_pro_model": dnsmos_pro_model,
+        "vqscore_conf": vqscore_conf,
+        "vqscore_model": vqscore_model,
+        "pythonpath": site_packages,
+        "torch_home": torch_home,
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--workdir",
+        type=str,
+        required=True,
+        help="Directory in which the stand-in models are created",
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    args = parser.parse_args()
+
+    for name, path in prepare_stand_ins(args.workdir, seed=args.seed).items():
+        print(f"{name}: {path}")
@@ -0,0 +1,426 @@
+import json
+import os
+import sys
+from datetime import datetime
+from pathlib import Path
+
+from generate_corpus import generate_corpus
+from prepare_stand_ins import prepare_stand_ins
+
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+sys.path.append(str(REPO_DIR / "mos"))
+from bench_utils import (  # noqa: E402
+    environment_info,
+    free_port,
+    run_commands,
+    start_server,
+    stop_server,
+)
+from manifest import read_scp  # noqa: E402
+from stage_profiler import str2bool  # noqa: E402
+
+# "parallel" indicates how the entry point is parallelized:
+#   "nj":      a single process with a process pool of `--nj` workers
+#   "nsplits": `--nsplits` concurrent processes, each handling one `--job`
+# "precisions" lists the inference precisions supported by the model (e.g. int8
+# dynamic quantization does not apply to TorchScript models)
+# "batching" indicates whether the script supports `--batch_size`
+# "metric" is the metric served by `scoring_server.py` in the streaming modes,
+# with the model options in "server_args"
+ENTRY_POINTS = {
+    "wada_snr": {
+        "script": REPO_DIR / "wada_snr" / "calculate_wada_snr.py",
+        "parallel": "nj",
+        "torch": False,
+        "metric": "WADASNR",
+    },
+    "dnsmos_pro": {
+        "script": REPO_DIR / "mos" / "calculate_nonintrusive_dnsmos_pro.py",
+        "parallel": "nsplits",
+        "torch": True,
+        "precisions": ("fp32", "bf16"),
+        "model_args": lambda p: ["--model_path", p["dnsmos_pro_model"]],
+        "metric": "DNSMOSPro",
+        "server_args": lambda p: ["--dnsmos_pro_model", p["dnsmos_pro_model"]],
+    },
+    "vqscore": {
+        "script": REPO_DIR / "mos" / "calculate_nonintrusive_vqscore.py",
+        "parallel": "nsplits",
+        "torch": True,
+        "model_args": lambda p: [
+            "--vqscore_conf",
+            p["vqscore_conf"],
+            "--vqscore_model",
+            p["vqscore_model"],
+        ],
+        "metric": "VQscore",
+        "server_args": lambda p: [
+            "--vqscore_conf",
+            p["vqscore_conf"],
+            "--vqscore_model",
+            p["vqscore_model"],
+        ],
+    },
+    "scoreq": {
+        "script": REPO_DIR / "mos" / "calculate_nonintrusive_scoreq.py",
+        "parallel": "nsplits",
+        "torch": True,
+        "batching": True,
+        "model_args": lambda p: [],
+        "metric": "SCOREQ",
+    },
+    "utmos": {
+        "script": REPO_DIR / "mos" / "calculate_nonintrusive_mos.py",
+        "parallel": "nsplits",
+        "torch": True,
+        "batching": True,
+        "model_args": lambda p: ["--metrics", "UTMOS"],
+        "metric": "UTMOS",
+    },
+    "utmosv2": {
+        "script": REPO_DIR / "mos" / "calculate_nonintrusive_mos.py",
+        "parallel": "nsplits",
+        "torch": True,
+        "batching": True,
+        "model_args": lambda p: ["--metrics", "UTMOSv2"],
+        "metric": "UTMOSv2",
+    },
+    "wvmos": {
+        "script": REPO_DIR / "mos" / "calculate_nonintrusive_mos.py",
+        "parallel": "nsplits",
+        "torch": True,
+        "batching": True,
+        "model_args": lambda p: ["--metrics", "WV_MOS"],
+        "metric": "WV_MOS",
+    },
+}
+
+
+def split_scp(scp, num_splits, outdir):
+    """Split an scp file into `num_splits` contiguous parts (as `--nsplits`)."""
+    data_pairs = read_scp(scp)
+    interval = len(data_pairs) // num_splits
+    paths = []
+    for j in range(num_splits):
+        end = len(data_pairs) if j == num_splits - 1 else (j + 1) * interval
+        paths.append(outdir / f"split{j + 1}.scp")
+        with paths[-1].open("w") as f:
+            for uid, path in data_pairs[j * interval : end]:
+                f.write(f"{uid} {path}\n")
+    return paths
+
+
+def iter_modes(name, entry, args, model_paths, scp, outdir):
+    """Yield (mode, commands, server) for each benchmarked configuration.
+
+    All commands of one mode are run concurrently. Precisions that are not
+    supported by the entry point are skipped, and batch sizes other than 1 are
+    only benchmarked for the entry points supporting `--batch_size`.
+    In the streaming modes (`--streaming true`), `server` is the command of a
+    `scoring_server.py` serving the metric of the entry point, and the commands
+    are `--nj` concurrent `scoring_client.py` processes; otherwise it is None.
+    """
+    base = [sys.executable, str(entry["script"]), "--inf_scp", str(scp)]
+    precisions = [None]
+    if entry["torch"]:
+        supported = entry.get("precisions", args.precisions)
+        precisions = [p for p in args.precisions if p in supported]
+        skipped = [p for p in args.precisions if p not in supported]
+        if skipped:
+            print(
+                f"{name:<12} skipping unsupported precisions: {', '.join(skipped)}",
+                flush=True,
+            )
+    batch_sizes = args.batch_sizes if entry.get("batching") else [1]
+    for nj in args.nj:
+        for precision in precisions:
+            for batch_size in dict.fromkeys(batch_sizes):
+                mode = f"nj={nj}"
+                if precision is not None:
+                    mode += f",precision={precision}"
+                if batch_size > 1:
+                    mode += f",batch_size={batch_size}"
+                subdir = mode.replace(",", "_").replace("=", "")
+                out = outdir / "outputs" / name / subdir
+                if entry["parallel"] == "nj":
+                    yield mode, [
+                        base
+                        + ["--output_dir", str(out), "--nj", str(nj)]
+                        + ["--chunksize", str(args.chunksize)]
+                    ], None
+                    continue
+                extra = [str(x) for x in entry["model_args"](model_paths)]
+                extra += ["--device", "cpu", "--precision", precision]
+                if batch_size > 1:
+                    extra += ["--batch_size", str(batch_size)]
+                yield mode, [
+                    base
+                    + ["--output_dir", str(out), "--nsplits", str(nj)]
+                    + ["--job", str(job)]
+                    + extra
+                    for job in range(1, nj + 1)
+                ], None
+
+    if not args.streaming:
+        return
+    for nj in args.nj:
+        for batch_size in dict.fromkeys(batch_sizes):
+            mode = f"streaming,nj={nj}"
+            if batch_size > 1:
+                mode += f",batch_size={batch_size}"
+            out = outdir / "outputs" / name / mode.replace(",", "_").replace("=", "")
+            out.mkdir(parents=True, exist_ok=True)
+            address = f"127.0.0.1:{free_port()}"
+            host, port = address.split(":")
+            server = [
+                sys.executable,
+                str(REPO_DIR / "mos" / "scoring_server.py"),
+                "--metrics",
+                entry["metric"],
+                "--device",
+                "cpu",
+                "--host",
+                host,
+                "--port",
+                port,
+                "--max_batch_size",
+                str(batch_size),
+                "--batch_size",
+                str(batch_size),
+            ]
+            server_args = entry.get("server_args", lambda p: [])(model_paths)
+            server += [str(x) for x in server_args]
+            yield mode, [
+                [
+                    sys.executable,
+                    str(REPO_DIR / "mos" / "scoring_client.py"),
+                    "--inf_scp",
+                    str(split),
+                    "--output_dir",
+                    str(out / f"client{j + 1}"),
+                    "--server",
+                    address,
+                ]
+                for j, split in enumerate(split_scp(scp, nj, out))
+            ], (server, address)
+
+
+def compare_results(results, baseline_path):
+    with open(baseline_path, "r") as f:
+        baseline = {
+            (r["entry"], r["mode"]): r for r in json.load(f)["results"]
+        }
+    print(f"\nComparison against {baseline_path}:")
+    print(f"{'entry':<12} {'mode':<24} {'audio-s/s':>20} {'peak RSS (MB)':>22}")
+    for r in results:
+        b = baseline.get((r["entry"], r["mode"]))
+        if b is None or "error" in r or "error" in b:
+            continue
+        speedup = r["audio_seconds_per_sec"] / b["audio_seconds_per_sec"]
+        print(
+            f"{r['entry']:<12} {r['mode']:<24} "
+            f"{b['audio_seconds_per_sec']:8.1f} -> {r['audio_seconds_per_sec']:8.1f} "
+            f"({speedup:5.2f}x) {b['peak_rss_mb']:8.1f} -> {r['peak_rss_mb']:8.1f}"
+        )
+
+
+################################################################
+# Main entry
+################################################################
+def main(args):
+    workdir = Path(args.workdir).resolve()
+    workdir.mkdir(parents=True, exist_ok=True)
+    (workdir / "logs").mkdir(exist_ok=True)
+
+    scp, total_duration = generate_corpus(
+        workdir / "corpus",
+        num_utts=args.num_utts,
+        min_duration=args.min_duration,
+        max_duration=args.max_duration,
+        seed=args.seed,
+    )
+    model_paths = prepare_stand_ins(workdir, seed=args.seed)
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        [str(model_paths["pythonpath"])]
+        + ([env["PYTHONPATH"]] if env.get("PYTHONPATH") else [])
+    )
+    env["TORCH_HOME"] = str(model_paths["torch_home"])
+
+    results = []
+    for name in args.entry_points:
+        entry = ENTRY_POINTS[name]
+        modes = iter_modes(name, entry, args, model_paths, scp, workdir)
+        for mode, commands, server in modes:
+            extra = {}
+            if server is not None:
+                server_log = workdir / "logs" / f"{name}.{mode}.server.log"
+                proc, startup_time = start_server(
+                    server[0], server[1], cwd=workdir, env=env, log_path=server_log
+                )
+                if proc is None:
+                    print(f"{name:<12} {mode:<24} failed, see {server_log}", flush=True)
+                    results.append(
+                        {"entry": name, "mode": mode, "error": str(server_log)}
+                    )
+                    continue
+                extra["server_startup_time"] = startup_time
+            try:
+                best = None
+                for rep in range(args.repeats):
+                    log_prefix = workdir / "logs" / f"{name}.{mode}.{rep + 1}"
+                    wall_time, peak_rss, returncodes = run_commands(
+                        commands, cwd=workdir, env=env, log_prefix=log_prefix
+                    )
+                    if any(returncodes):
+                        break
+                    if best is None or wall_time < best[0]:
+                        best = (wall_time, peak_rss)
+            finally:
+                if server is not None:
+                    extra["server_rss_mb"] = stop_server(proc)
+            if any(returncodes):
+                # e.g. an unsupported precision for the model
+                print(
+                    f"{name:<12} {mode:<24} failed, see {log_prefix}.*.log",
+                    flush=True,
+                )
+                results.append({"entry": name, "mode": mode, "error": str(log_prefix)})
+                continue
+            wall_time, peak_rss = best
+            if server is not None:
+                # the models are already loaded: the wall time only covers the
+                # clients, while the RSS also includes the server
+                peak_rss = peak_rss + [extra["server_rss_mb"]]
+            results.append(
+                {
+                    "entry": name,
+                    "mode": mode,
+                    "num_processes": len(peak_rss),
+                    "num_utts": args.num_utts,
+                    "audio_seconds": total_duration,
+                    "wall_time": wall_time,
+                    "utts_per_sec": args.num_utts / wall_time,
+                    "audio_seconds_per_sec": total_duration / wall_time,
+                    "peak_rss_mb": max(peak_rss),
+                    "total_rss_mb": sum(peak_rss),
+                    **extra,
+                }
+            )
+            print(
+                f"{name:<12} {mode:<24} {results[-1]['utts_per_sec']:8.2f} utt/s "
+                f"{results[-1]['audio_seconds_per_sec']:8.1f} audio-s/s "
+                f"{results[-1]['peak_rss_mb']:8.1f} MB",
+                flush=True,
+            )
+
+    output = Path(args.output) if args.output else workdir / "benchmark.json"
+    with output.open("w") as f:
+        json.dump(
+            {
+                "created": datetime.now().isoformat(timespec="seconds"),
+                "environment": environment_info(),
+                "corpus": {
+                    "num_utts": args.num_utts,
+                    "min_duration": args.min_duration,
+                    "max_duration": args.max_duration,
+                    "total_duration": total_duration,
+                    "seed": args.seed,
+                },
+                "results": results,
+            },
+            f,
+            indent=2,
+        )
+    print(f"Benchmark results have been written in {output}", flush=True)
+
+    if args.compare is not None:
+        compare_results(results, args.compare)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--workdir",
+        type=str,
+        required=True,
+        help="Working directory for the synthetic corpus, models and outputs",
+    )
+    parser.add_argument(
+        "--output",
+        type=str,
+        default=None,
+        help="Path to the output JSON file (default: {workdir}/benchmark.json)",
+    )
+    parser.add_argument(
+        "--compare",
+        type=str,
+        default=None,
+        help="Path to a previous benchmark JSON file to compare against",
+    )
+    parser.add_argument(
+        "--entry_points",
+        type=str,
+        nargs="+",
+        default=list(ENTRY_POINTS.keys()),
+        choices=list(ENTRY_POINTS.keys()),
+        help="Entry points to be benchmarked",
+    )
+    parser.add_argument(
+        "--nj",
+        type=int,
+        nargs="+",
+        default=[1, 4],
+        help="Numbers of parallel workers (--nj) / jobs (--nsplits) to benchmark",
+    )
+    parser.add_argument(
+        "--chunksize",
+        type=int,
+        default=10,
+        help="Number of samples in each task sent to the workers (--chunksize of "
+        "calculate_wada_snr.py, WADA-SNR only)",
+    )
+    parser.add_argument(
+        "--precisions",
+        type=str,
+        nargs="+",
+        default=["fp32"],
+        help="Inference precisions to benchmark (neural metrics only)",
+    )
+    parser.add_argument(
+        "--batch_sizes",
+        type=int,
+        nargs="+",
+        default=[1],
+        help="Batch sizes to benchmark (entry points supporting --batch_size only)",
+    )
+    parser.add_argument(
+        "--streaming",
+        type=str2bool,
+        default=False,
+        help="Also benchmark the streaming modes: a resident scoring_server.py "
+        "(fp32, micro-batches of each --batch_sizes) scoring the requests of --nj "
+        "concurrent scoring_client.py processes",
+    )
+    parser.add_argument(
+        "--repeats",
+        type=int,
+        default=1,
+        help="Number of repetitions of each run (the fastest one is reported)",
+    )
+
+    group = parser.add_argument_group("Synthetic corpus related")
+    group.add_argument("--num_utts", type=int, default=200, help="Number of utterances")
+    group.add_argument(
+        "--min_duration", type=float, default=1.0, help="Minimum duration in seconds"
+    )
+    group.add_argument(
+        "--max_duration", type=float, default=10.0, help="Maximum duration in seconds"
+    )
+    group.add_argument("--seed", type=int, default=0, help="Random seed")
+    args = parser.parse_args()
+
+    main(args)
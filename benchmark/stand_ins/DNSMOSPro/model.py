@@ -0,0 +1,21 @@
+"""Random-weight stand-in for the DNSMOS Pro TorchScript model (benchmark only)."""
+import torch
+
+
+class DNSMOSProStandIn(torch.nn.Module):
+    def __init__(self, channels=32):
+        super().__init__()
+        self.convs = torch.nn.Sequential(
+            torch.nn.Conv2d(1, channels, 3, stride=2, padding=1),
+            torch.nn.ReLU(),
+            torch.nn.Conv2d(channels, channels, 3, stride=2, padding=1),
+            torch.nn.ReLU(),
+            torch.nn.Conv2d(channels, channels, 3, stride=2, padding=1),
+            torch.nn.ReLU(),
+        )
+        self.head = torch.nn.Linear(channels, 2)
+
+    def forward(self, spec: torch.Tensor) -> torch.Tensor:
+        # spec: (batch, 1, freq, time) -> (batch, 2) [mean, variance]
+        x = self.convs(spec).mean(dim=(2, 3))
+        return self.head(x)
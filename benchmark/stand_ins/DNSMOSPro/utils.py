@@ -0,0 +1,15 @@
+"""Stand-in for `utils.py` in https://github.com/fcumlin/DNSMOSPro (benchmark only)."""
+import numpy as np
+
+
+def stft(samples, n_fft=320, hop_length=160):
+    """Log-magnitude spectrogram (freq, time) of a 16 kHz signal."""
+    samples = np.pad(samples, (n_fft // 2, n_fft // 2), mode="reflect")
+    num_frames = 1 + (len(samples) - n_fft) // hop_length
+    frames = np.lib.stride_tricks.as_strided(
+        samples,
+        shape=(num_frames, n_fft),
+        strides=(samples.strides[0] * hop_length, samples.strides[0]),
+    )
+    spec = np.abs(np.fft.rfft(frames * np.hanning(n_fft), axis=-1))
+    return np.log10(spec + 1e-8).T
@@ -0,0 +1,52 @@
+"""Random-weight stand-in for the `tarepan/SpeechMOS` torch.hub repo (benchmark only).
+
+It is copied into the torch.hub cache ($TORCH_HOME/hub/tarepan_SpeechMOS_v1.2.0),
+so that `torch.hub.load("tarepan/SpeechMOS:v1.2.0", "utmos22_strong")` loads it
+without network access. The model follows the calling convention of UTMOS:
+`model(wave, sr)` with `wave` of shape (batch, time) returns (batch,) scores.
+"""
+import numpy as np
+import soxr
+import torch
+
+dependencies = ["numpy", "soxr", "torch"]
+
+TARGET_FS = 16000
+# (kernel_size, stride) of the feature extractor convolutions
+CONV_LAYERS = ((10, 5), (8, 4), (4, 4), (4, 4))
+
+
+class UTMOSStandIn(torch.nn.Module):
+    def __init__(self, dim=768, num_layers=4):
+        super().__init__()
+        layers = []
+        in_dim = 1
+        for kernel_size, stride in CONV_LAYERS:
+            layers += [torch.nn.Conv1d(in_dim, dim, kernel_size, stride=stride)]
+            layers += [torch.nn.GELU()]
+            in_dim = dim
+        self.feature_extractor = torch.nn.Sequential(*layers)
+        self.encoder = torch.nn.Sequential(
+            *[
+                torch.nn.Sequential(
+                    torch.nn.LayerNorm(dim), torch.nn.Linear(dim, dim), torch.nn.GELU()
+                )
+                for _ in range(num_layers)
+            ]
+        )
+        self.head = torch.nn.Linear(dim, 1)
+
+    def forward(self, wave, sr):
+        if sr != TARGET_FS:
+            resampled = [
+                soxr.resample(w, sr, TARGET_FS) for w in wave.float().cpu().numpy()
+            ]
+            wave = torch.from_numpy(np.stack(resampled)).to(device=wave.device)
+        x = self.feature_extractor(wave.unsqueeze(1)).transpose(2, 1)
+        x = self.encoder(x)
+        return self.head(x).mean(dim=(1, 2)) + 3.0
+
+
+def utmos22_strong(**kwargs):
+    torch.manual_seed(0)
+    return UTMOSStandIn().eval()
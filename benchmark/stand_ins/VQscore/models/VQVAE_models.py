@@ -0,0 +1,73 @@
+"""Random-weight stand-ins for `models/VQVAE_models.py` in
+https://github.com/JasonSWFu/VQscore (benchmark only).
+
+Only the interfaces used by `calculate_nonintrusive_vqscore.py` are provided.
+"""
+import torch
+
+
+class Encoder1D(torch.nn.Module):
+    def __init__(self, input_dim, hidden_dim, codebook_dim, num_layers):
+        super().__init__()
+        layers = [torch.nn.Conv1d(input_dim, hidden_dim, 3, padding=1), torch.nn.ReLU()]
+        for _ in range(num_layers - 1):
+            layers += [torch.nn.Conv1d(hidden_dim, hidden_dim, 3, padding=1), torch.nn.ReLU()]
+        layers.append(torch.nn.Conv1d(hidden_dim, codebook_dim, 1))
+        self.layers = torch.nn.Sequential(*layers)
+
+    def forward(self, x):
+        # (batch, time, freq) -> (batch, codebook_dim, time)
+        return self.layers(x.transpose(2, 1))
+
+
+class Decoder1D(torch.nn.Module):
+    def __init__(self, input_dim, hidden_dim, codebook_dim):
+        super().__init__()
+        self.layers = torch.nn.Sequential(
+            torch.nn.Linear(codebook_dim, hidden_dim),
+            torch.nn.ReLU(),
+            torch.nn.Linear(hidden_dim, input_dim),
+        )
+
+    def forward(self, zq):
+        # (batch, time, codebook_dim) -> (batch, time, freq)
+        return self.layers(zq)
+
+
+class Quantizer(torch.nn.Module):
+    def __init__(self, codebook_size, codebook_dim):
+        super().__init__()
+        self.codebook = torch.nn.Parameter(torch.randn(codebook_size, codebook_dim))
+
+    def forward(self, z, stochastic=False, update=False):
+        # (batch, codebook_dim, time) -> (batch, time, codebook_dim)
+        z = z.transpose(2, 1)
+        distance = torch.cdist(z, self.codebook[None].expand(z.size(0), -1, -1))
+        indices = distance.argmin(dim=-1)
+        zq = self.codebook[indices]
+        vqloss = torch.mean((zq - z) ** 2)
+        return zq, indices, vqloss, distance
+
+
+class VQVAE_QE(torch.nn.Module):
+    def __init__(
+        self,
+        input_dim=257,
+        hidden_dim=128,
+        codebook_size=2048,
+        codebook_dim=32,
+        num_layers=4,
+        **kwargs,
+    ):
+        super().__init__()
+        self.CNN_1D_encoder = Encoder1D(input_dim, hidden_dim, codebook_dim, num_layers)
+        self.quantizer = Quantizer(codebook_size, codebook_dim)
+        self.CNN_1D_decoder = Decoder1D(input_dim, hidden_dim, codebook_dim)
+
+    def forward(self, x):
+        z = self.CNN_1D_encoder(x)
+        zq, indices, vqloss, distance = self.quantizer(z)
+        return self.CNN_1D_decoder(zq), zq, z
+
+
+VQVAE_SE = VQVAE_QE
@@ -0,0 +1,127 @@
+"""Random-weight stand-in for the `scoreq` package (benchmark only).
+
+The module layout follows scoreq 0.0.1 (`Scoreq.model` is a `MosPredictor`
+wrapping a `TripletModel` in "nr" mode, and a `TripletModel` in "ref" mode), so
+that the batched embedding path of `calculate_nonintrusive_scoreq.py` can be
+exercised. Only the interfaces used by that script are provided.
+"""
+import numpy as np
+import soundfile as sf
+import soxr
+import torch
+
+
+TARGET_FS = 16000
+# (kernel_size, stride) of the feature extractor convolutions
+CONV_LAYERS = ((10, 5), (8, 4), (4, 4), (4, 4))
+
+
+class FeedForwardBlock(torch.nn.Module):
+    def __init__(self, dim):
+        super().__init__()
+        self.norm = torch.nn.LayerNorm(dim)
+        self.fc1 = torch.nn.Linear(dim, 4 * dim)
+        self.fc2 = torch.nn.Linear(4 * dim, dim)
+
+    def forward(self, x):
+        return x + self.fc2(torch.nn.functional.gelu(self.fc1(self.norm(x))))
+
+
+class SSLStandIn(torch.nn.Module):
+    """Strided conv feature extractor + MLP blocks, roughly shaped like wav2vec.
+
+    Follows the fairseq calling convention:
+    ssl_model(source, padding_mask=None, mask=False, features_only=True)
+    -> {"x": (batch, frames, dim), "padding_mask": (batch, frames) or None}
+    """
+
+    def __init__(self, dim=768, num_layers=4):
+        super().__init__()
+        layers = []
+        in_dim = 1
+        for kernel_size, stride in CONV_LAYERS:
+            layers += [torch.nn.Conv1d(in_dim, dim, kernel_size, stride=stride)]
+            layers += [torch.nn.GELU()]
+            in_dim = dim
+        self.feature_extractor = torch.nn.Sequential(*layers)
+        self.encoder = torch.nn.Sequential(
+            *[FeedForwardBlock(dim) for _ in range(num_layers)]
+        )
+
+    def forward(self, source, padding_mask=None, mask=False, features_only=True):
+        x = self.feature_extractor(source.unsqueeze(1)).transpose(2, 1)
+        x = self.encoder(x)
+        if padding_mask is not None:
+            lengths = (~padding_mask).sum(dim=1)
+            for kernel_size, stride in CONV_LAYERS:
+                lengths = torch.div(lengths - kernel_size, stride, rounding_mode="floor")
+                lengths = lengths + 1
+            frames = torch.arange(x.size(1), device=x.device)
+            padding_mask = frames[None, :] >= lengths[:, None]
+        return {"x": x, "padding_mask": padding_mask}
+
+
+class TripletModel(torch.nn.Module):
+    def __init__(self, ssl_model, ssl_out_dim=768, emb_dim=256):
+        super().__init__()
+        self.ssl_model = ssl_model
+        self.embedding_layer = torch.nn.Sequential(
+            torch.nn.ReLU(), torch.nn.Linear(ssl_out_dim, emb_dim)
+        )
+
+    def forward(self, wav, phead=False):
+        wav = wav.squeeze(1)
+        x = self.ssl_model(wav, mask=False, features_only=True)["x"]
+        x = torch.mean(x, 1)
+        if phead:
+            x = self.embedding_layer(x)
+        return torch.nn.functional.normalize(x, dim=1)
+
+
+class MosPredictor(torch.nn.Module):
+    def __init__(self, pt_model, emb_dim=768):
+        super().__init__()
+        self.pt_model = pt_model
+        self.mos_layer = torch.nn.Linear(emb_dim, 1)
+
+    def forward(self, wav):
+        x = self.pt_model(wav, phead=False)
+        return self.mos_layer(x)
+
+
+class Scoreq:
+    def __init__(self, device=None, data_domain="natural", mode="nr"):
+        torch.manual_seed(0)
+        self.data_domain = data_domain
+        self.mode = mode
+        self.DEVICE = device or "cpu"
+        pt_model = TripletModel(SSLStandIn())
+        model = MosPredictor(pt_model) if mode == "nr" else pt_model
+        self.model = model.to(self.DEVICE).eval()
+
+    def load_processing(self, filepath, target_sr=TARGET_FS):
+        wave, fs = sf.read(filepath, dtype="float32", always_2d=True)
+        wave = wave.mean(axis=1)
+        if fs != target_sr:
+            wave = soxr.resample(wave, fs, target_sr)
+        return torch.from_numpy(wave).unsqueeze(0)
+
+    def predict(self, test_path, ref_path=None):
+        if self.mode == "nr":
+            return self.nr_scoreq(test_path)
+        return self.ref_scoreq(test_path, ref_path)
+
+    def nr_scoreq(self, test_path):
+        wave = self.load_processing(test_path).to(self.DEVICE)
+        with torch.no_grad():
+            pred_mos = self.model(wave).item()
+        return np.round(pred_mos, 4)
+
+    def ref_scoreq(self, test_path, ref_path):
+        test_wave = self.load_processing(test_path).to(self.DEVICE)
+        ref_wave = self.load_processing(ref_path).to(self.DEVICE)
+        with torch.no_grad():
+            test_emb = self.model(test_wave)
+            ref_emb = self.model(ref_wave)
+            distance = torch.cdist(test_emb, ref_emb).item()
+        return distance
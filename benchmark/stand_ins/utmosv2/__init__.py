@@ -0,0 +1,77 @@
+"""Random-weight stand-in for the `utmosv2` package (benchmark only).
+
+Only `create_model(...)` and `model.predict(...)` (with `input_path` or with a
+batch of signals in `data`) are provided. As in UTMOSv2, each signal is
+resampled to 16 kHz and tiled or cropped to a fixed duration.
+"""
+import numpy as np
+import soundfile as sf
+import soxr
+import torch
+
+
+TARGET_FS = 16000
+NUM_SAMPLES = 3 * TARGET_FS
+
+
+class UTMOSv2StandIn(torch.nn.Module):
+    def __init__(self, channels=64, n_fft=512, hop_length=128):
+        super().__init__()
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        self.convs = torch.nn.Sequential(
+            torch.nn.Conv2d(1, channels, 3, stride=2, padding=1),
+            torch.nn.ReLU(),
+            torch.nn.Conv2d(channels, channels, 3, stride=2, padding=1),
+            torch.nn.ReLU(),
+            torch.nn.Conv2d(channels, channels, 3, stride=2, padding=1),
+            torch.nn.ReLU(),
+        )
+        self.head = torch.nn.Linear(channels, 1)
+
+    def forward(self, x):
+        spec = torch.stft(
+            x,
+            self.n_fft,
+            hop_length=self.hop_length,
+            window=torch.hann_window(self.n_fft, device=x.device),
+            return_complex=True,
+        )
+        spec = torch.log1p(spec.abs()).unsqueeze(1)
+        return self.head(self.convs(spec).mean(dim=(2, 3))).squeeze(-1) + 3.0
+
+    @staticmethod
+    def _fix_length(wave):
+        if len(wave) < NUM_SAMPLES:
+            wave = np.tile(wave, NUM_SAMPLES // max(len(wave), 1) + 1)
+        return wave[:NUM_SAMPLES]
+
+    @torch.no_grad()
+    def predict(
+        self,
+        input_path=None,
+        data=None,
+        sr=TARGET_FS,
+        device="cpu",
+        batch_size=16,
+        verbose=True,
+    ):
+        if input_path is not None:
+            wave, sr = sf.read(input_path, dtype="float32", always_2d=True)
+            waves = [wave.mean(axis=1)]
+        else:
+            waves = list(np.asarray(data, dtype=np.float32).reshape(len(data), -1))
+        if sr != TARGET_FS:
+            waves = [soxr.resample(w, sr, TARGET_FS) for w in waves]
+        batch = np.stack([self._fix_length(w) for w in waves])
+        scores = []
+        for i in range(0, len(batch), batch_size):
+            x = torch.from_numpy(batch[i : i + batch_size]).to(device=device)
+            scores.append(self(x).cpu().numpy())
+        scores = np.concatenate(scores)
+        return float(scores[0]) if input_path is not None else scores
+
+
+def create_model(pretrained=True, checkpoint_path=None, device="cpu"):
+    torch.manual_seed(0)
+    return UTMOSv2StandIn().to(device).eval()
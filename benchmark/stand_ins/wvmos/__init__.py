@@ -0,0 +1,93 @@
+"""Random-weight stand-in for the `wvmos` package (benchmark only).
+
+The model mirrors the attributes of `wvmos.WVMOS` used by the batched path of
+`calculate_nonintrusive_mos.py` (`processor`, `encoder` with its `config`,
+`dense` and `cuda_flag`), and `calculate_one` follows the original.
+"""
+from types import SimpleNamespace
+
+import numpy as np
+import soundfile as sf
+import soxr
+import torch
+
+
+TARGET_FS = 16000
+
+
+class ProcessorStandIn:
+    """Zero-mean and unit-variance normalization, as the Wav2Vec2 processor."""
+
+    def __call__(self, wave, return_tensors="np", sampling_rate=TARGET_FS, **kwargs):
+        wave = np.asarray(wave, dtype=np.float32)
+        wave = (wave - wave.mean()) / np.sqrt(wave.var() + 1e-7)
+        values = wave[None]
+        if return_tensors == "pt":
+            values = torch.from_numpy(values)
+        return SimpleNamespace(input_values=values)
+
+
+class EncoderStandIn(torch.nn.Module):
+    """Wav2Vec2-like conv feature encoder (with group norm) and MLP blocks."""
+
+    def __init__(self, conv_dim=256, dim=768, num_layers=4):
+        super().__init__()
+        self.config = SimpleNamespace(
+            conv_kernel=(10, 3, 3, 3, 3, 2, 2), conv_stride=(5, 2, 2, 2, 2, 2, 2)
+        )
+        layers = []
+        in_dim = 1
+        for i, (kernel, stride) in enumerate(
+            zip(self.config.conv_kernel, self.config.conv_stride)
+        ):
+            layers += [torch.nn.Conv1d(in_dim, conv_dim, kernel, stride=stride)]
+            if i == 0:
+                layers += [torch.nn.GroupNorm(conv_dim, conv_dim)]
+            layers += [torch.nn.GELU()]
+            in_dim = conv_dim
+        self.feature_extractor = torch.nn.Sequential(*layers)
+        self.projection = torch.nn.Linear(conv_dim, dim)
+        self.layers = torch.nn.Sequential(
+            *[
+                torch.nn.Sequential(
+                    torch.nn.LayerNorm(dim), torch.nn.Linear(dim, dim), torch.nn.GELU()
+                )
+                for _ in range(num_layers)
+            ]
+        )
+
+    def forward(self, x, attention_mask=None):
+        x = self.feature_extractor(x.unsqueeze(1)).transpose(2, 1)
+        return {"last_hidden_state": self.layers(self.projection(x))}
+
+
+class WVMOSStandIn(torch.nn.Module):
+    def __init__(self, cuda=False):
+        super().__init__()
+        self.encoder = EncoderStandIn()
+        self.dense = torch.nn.Sequential(
+            torch.nn.Linear(768, 128), torch.nn.ReLU(), torch.nn.Linear(128, 1)
+        )
+        self.processor = ProcessorStandIn()
+        self.cuda_flag = cuda
+
+    def forward(self, x):
+        x = self.encoder(x)["last_hidden_state"]
+        return self.dense(x).mean(dim=[1, 2], keepdims=True)
+
+    def calculate_one(self, path):
+        wave, sr = sf.read(path, dtype="float32", always_2d=True)
+        wave = wave.mean(axis=1)
+        if sr != TARGET_FS:
+            wave = soxr.resample(wave, sr, TARGET_FS)
+        x = self.processor(wave, return_tensors="pt").input_values
+        if self.cuda_flag:
+            x = x.cuda()
+        with torch.no_grad():
+            return self.forward(x).mean().cpu().item()
+
+
+def get_wvmos(cuda=True):
+    torch.manual_seed(0)
+    model = WVMOSStandIn(cuda=cuda).eval()
+    return model.cuda() if cuda else model
@@ -0,0 +1,330 @@
+import itertools
+import json
+import os
+import random
+import sys
+from datetime import datetime
+from pathlib import Path
+
+import soundfile as sf
+from tqdm.contrib.concurrent import thread_map
+
+from bench_utils import environment_info, run_commands
+from manifest import add_input_arguments, get_data_pairs, is_manifest, read_manifest
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+
+
+# "parallel" indicates how the script is parallelized (see benchmark/run_benchmark.py)
+#   "nj":      a single process with a process pool of `--nj` workers
+#   "nsplits": `--nsplits` concurrent processes, each handling one `--job`
+SCRIPTS = {
+    "dnsmos_pro": {
+        "script": REPO_DIR / "mos" / "calculate_nonintrusive_dnsmos_pro.py",
+        "parallel": "nsplits",
+        "batch": False,
+    },
+    "vqscore": {
+        "script": REPO_DIR / "mos" / "calculate_nonintrusive_vqscore.py",
+        "parallel": "nsplits",
+        "batch": False,
+    },
+    "scoreq": {
+        "script": REPO_DIR / "mos" / "calculate_nonintrusive_scoreq.py",
+        "parallel": "nsplits",
+        "batch": True,
+    },
+    "mos": {
+        "script": REPO_DIR / "mos" / "calculate_nonintrusive_mos.py",
+        "parallel": "nsplits",
+        "batch": True,
+    },
+    "wada_snr": {
+        "script": REPO_DIR / "wada_snr" / "calculate_wada_snr.py",
+        "parallel": "nj",
+        "batch": False,
+    },
+}
+
+
+def default_grid(values, upper):
+    """Powers of 2 up to `upper` (and `upper` itself) if `values` is not given."""
+    if values:
+        return sorted(set(values))
+    grid = [2**i for i in range(upper.bit_length()) if 2**i <= upper]
+    return sorted(set(grid + [upper]))
+
+
+def wada_chunksize(num_samples, nj):
+    """Chunk size giving each worker ~4 chunks (bounded to [1, 100])."""
+    return max(1, min(100, num_samples // (nj * 4)))
+
+
+def iter_trials(entry, args, num_samples):
+    """Yield the settings {"procs", "num_threads", "batch_size"} of each trial."""
+    cpu_count = os.cpu_count()
+    procs = [p for p in default_grid(args.procs, cpu_count) if p <= num_samples]
+    if entry["parallel"] == "nj":
+        # the workers are single-threaded numpy processes
+        threads, batch_sizes = [None], [None]
+    else:
+        threads = default_grid(args.num_threads, min(cpu_count, 8))
+        batch_sizes = sorted(set(args.batch_sizes)) if entry["batch"] else [None]
+    for p, t, b in itertools.product(procs, threads, batch_sizes):
+        if p * (t or 1) > args.max_threads:
+            continue
+        yield {"procs": p, "num_threads": t, "batch_size": b}
+
+
+def trial_commands(entry, settings, scp, outdir, extra_args):
+    base = [sys.executable, str(entry["script"]), "--inf_scp", str(scp)]
+    base += ["--output_dir", str(outdir), "--profile", "true"]
+    base += ["--profile_trace", "true"]
+    p = settings["procs"]
+    if entry["parallel"] == "nj":
+        num_samples = sum(1 for _ in open(scp))
+        return [
+            base
+            + ["--nj", str(p), "--chunksize", str(wada_chunksize(num_samples, p))]
+            + extra_args
+        ]
+    opts = ["--num_threads", str(settings["num_threads"])]
+    if settings["batch_size"] is not None:
+        opts += ["--batch_size", str(settings["batch_size"])]
+    return [
+        base + ["--nsplits", str(p), "--job", str(job)] + opts + extra_args
+        for job in range(1, p + 1)
+    ]
+
+
+def processing_span(outdir):
+    """Time span (in seconds) covered by the profiled stages of all processes.
+
+    Unlike the wall time, this excludes the interpreter startup and model loading,
+    which are amortized on a full-size input.
+    """
+    start, end = float("inf"), 0.0
+    for path in Path(outdir).glob("profile_trace*.json"):
+        with path.open("r") as f:
+            for event in json.load(f)["traceEvents"]:
+                start = min(start, event["ts"])
+                end = max(end, event["ts"] + event["dur"])
+    return (end - start) / 1e6 if end > start else None
+
+
+def sample_inputs(args):
+    """Draw a random subset of the input and get the duration of each sample.
+
+    Returns:
+        num_total (int): number of samples in the whole input
+        sample (list): list of (uid, path, duration)
+    """
+    if args.manifest is not None and is_manifest(args.manifest):
+        rows = read_manifest(args.manifest)
+        items = [(r["uid"], r["path"], r["duration"]) for r in rows]
+        num_total = len(items)
+        items = random.Random(args.seed).sample(items, min(args.num_samples, num_total))
+        return num_total, items
+    data_pairs = get_data_pairs(args)
+    num_total = len(data_pairs)
+    data_pairs = random.Random(args.seed).sample(
+        data_pairs, min(args.num_samples, num_total)
+    )
+    durations = thread_map(
+        lambda pair: sf.info(pair[1]).duration, data_pairs, max_workers=16
+    )
+    return num_total, [(uid, p, d) for (uid, p), d in zip(data_pairs, durations)]
+
+
+################################################################
+# Main entry
+################################################################
+def main(args):
+    entry = SCRIPTS[args.script]
+    workdir = Path(args.workdir).resolve()
+    (workdir / "logs").mkdir(parents=True, exist_ok=True)
+    num_total, sample = sample_inputs(args)
+    scp = workdir / "sample.scp"
+    with scp.open("w") as f:
+        for uid, audio_path, _ in sample:
+            f.write(f"{uid} {Path(audio_path).resolve()}\n")
+    audio_seconds = sum(d for _, _, d in sample)
+    print(
+        f"Tuning {entry['script'].name} on {len(sample)}/{num_total} samples "
+        f"({audio_seconds:.1f} s of audio)",
+        flush=True,
+    )
+    extra_args = args.script_args
+    if extra_args and extra_args[0] == "--":
+        extra_args = extra_args[1:]
+
+    trials = []
+    for settings in iter_trials(entry, args, len(sample)):
+        name = ",".join(f"{k}={v}" for k, v in settings.items() if v is not None)
+        outdir = workdir / "outputs" / name.replace(",", "_").replace("=", "")
+        commands = trial_commands(entry, settings, scp, outdir, extra_args)
+        log_prefix = workdir / "logs" / name
+        wall_time, peak_rss, returncodes = run_commands(
+            commands, cwd=os.getcwd(), env=dict(os.environ), log_prefix=log_prefix
+        )
+        trial = {"settings": settings}
+        if any(returncodes):
+            print(f"{name:<40} failed, see {log_prefix}.*.log", flush=True)
+            trial["error"] = str(log_prefix)
+            trials.append(trial)
+            continue
+        span = processing_span(outdir) or wall_time
+        trial.update(
+            {
+                "wall_time": wall_time,
+                "processing_time": span,
+                "audio_seconds_per_sec": audio_seconds / span,
+                "audio_seconds_per_sec_wall": audio_seconds / wall_time,
+                "total_rss_mb": sum(peak_rss),
+            }
+        )
+        trials.append(trial)
+        print(
+            f"{name:<40} {trial['audio_seconds_per_sec']:9.1f} audio-s/s "
+            f"({trial['audio_seconds_per_sec_wall']:7.1f} incl. startup) "
+            f"{trial['total_rss_mb']:9.1f} MB",
+            flush=True,
+        )
+
+    key = "audio_seconds_per_sec" if args.objective == "steady" else (
+        "audio_seconds_per_sec_wall"
+    )
+    candidates = [
+        t
+        for t in trials
+        if "error" not in t
+        and (args.max_memory_mb is None or t["total_rss_mb"] <= args.max_memory_mb)
+    ]
+    if not candidates:
+        raise RuntimeError(f"No successful trial within the limits, see {workdir}")
+    best = max(candidates, key=lambda t: t[key])["settings"]
+
+    if entry["parallel"] == "nj":
+        config_args = {
+            "nj": best["procs"],
+            "chunksize": wada_chunksize(num_total, best["procs"]),
+        }
+        launch = {}
+    else:
+        config_args = {"num_threads": best["num_threads"]}
+        if best["batch_size"] is not None:
+            config_args["batch_size"] = best["batch_size"]
+        launch = {"nsplits": best["procs"]}
+    config = {
+        "script": entry["script"].name,
+        "args": config_args,
+        "launch": launch,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "environment": environment_info(),
+        "objective": args.objective,
+        "sample": {
+            "num_samples": len(sample),
+            "num_total": num_total,
+            "audio_seconds": audio_seconds,
+            "seed": args.seed,
+        },
+        "trials": trials,
+    }
+    output = Path(args.output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with output.open("w") as f:
+        json.dump(config, f, indent=2)
+    print(
+        f"Recommended: {config_args}"
+        + (f", launched as {launch}" if launch else "")
+        + f"\nThe configuration has been written in {output}; "
+        f"use it with `{entry['script'].name} --tuned_config {output}`",
+        flush=True,
+    )
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Run short trials of a scoring script on a sample of the input "
+        "with different numbers of processes, torch threads and batch sizes, and "
+        "write the best configuration (loadable with --tuned_config). "
+        "Options after '--' are passed to the scoring script, e.g. model paths."
+    )
+    parser.add_argument(
+        "--script",
+        type=str,
+        required=True,
+        choices=list(SCRIPTS.keys()),
+        help="Scoring script to be tuned",
+    )
+    add_input_arguments(parser)
+    parser.add_argument(
+        "--output",
+        type=str,
+        required=True,
+        help="Path to the output configuration (JSON)",
+    )
+    parser.add_argument(
+        "--workdir",
+        type=str,
+        default="exp/autotune",
+        help="Working directory for the sampled scp, trial outputs and logs",
+    )
+    parser.add_argument(
+        "--num_samples",
+        type=int,
+        default=100,
+        help="Number of randomly sampled inputs used in each trial",
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+
+    group = parser.add_argument_group("Search space related")
+    group.add_argument(
+        "--procs",
+        type=int,
+        nargs="+",
+        default=None,
+        help="Numbers of processes to try (--nsplits jobs, or --nj workers for "
+        "WADA-SNR) (default: powers of 2 up to the number of CPUs)",
+    )
+    group.add_argument(
+        "--num_threads",
+        type=int,
+        nargs="+",
+        default=None,
+        help="Numbers of torch threads per process to try (default: powers of 2 "
+        "up to 8)",
+    )
+    group.add_argument(
+        "--batch_sizes",
+        type=int,
+        nargs="+",
+        default=[1, 8],
+        help="Batch sizes to try (only for the scripts supporting --batch_size)",
+    )
+    group.add_argument(
+        "--max_threads",
+        type=int,
+        default=os.cpu_count(),
+        help="Skip the settings where processes x threads exceeds this number",
+    )
+    group.add_argument(
+        "--max_memory_mb",
+        type=float,
+        default=None,
+        help="Only recommend the settings whose total peak RSS is below this limit",
+    )
+    group.add_argument(
+        "--objective",
+        type=str,
+        default="steady",
+        choices=("steady", "wall"),
+        help="'steady': throughput excluding the startup and model loading "
+        "(for large inputs), 'wall': throughput including them",
+    )
+    parser.add_argument("script_args", nargs=argparse.REMAINDER)
+    args = parser.parse_args()
+
+    main(args)
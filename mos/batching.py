@@ -0,0 +1,118 @@
+import json
+
+import numpy as np
+
+from precision import compare_scores, report_deviation
+
+
+def length_buckets(lengths, batch_size, max_pad_ratio=0.05, keys=None):
+    """Group sample indices into batches of similar lengths.
+
+    Samples are sorted by length, and consecutive samples are put into the same
+    batch as long as none of them needs more than `max_pad_ratio` of its padded
+    length as padding. Zero-padding changes the output of models that pool over
+    time, so `max_pad_ratio` bounds the deviation from unbatched inference
+    (`max_pad_ratio=0` only batches samples of identical lengths).
+
+    Args:
+        lengths (list): length of each sample
+        batch_size (int): maximum number of samples in a batch
+        max_pad_ratio (float): maximum ratio of padding in a padded sample
+        keys (list): samples with different keys (e.g. sampling rates) are never
+            put into the same batch (optional)
+    Returns:
+        batches (list): list of lists of sample indices
+    """
+    if keys is None:
+        keys = [0] * len(lengths)
+    order = sorted(range(len(lengths)), key=lambda i: (keys[i], lengths[i]))
+    batches = []
+    for i in order:
+        if batches:
+            batch = batches[-1]
+            first = batch[0]
+            if (
+                len(batch) < batch_size
+                and keys[first] == keys[i]
+                and lengths[first] >= (1 - max_pad_ratio) * lengths[i]
+            ):
+                batch.append(i)
+                continue
+        batches.append([i])
+    return batches
+
+
+def pad_batch(waves):
+    """Zero-pad a list of 1-D signals at the end into an array (batch, time)."""
+    batch = np.zeros((len(waves), max(len(w) for w in waves)), dtype=np.float32)
+    for i, w in enumerate(waves):
+        batch[i, : len(w)] = w
+    return batch
+
+
+def check_batching(
+    score_one_fn,
+    score_batch_fn,
+    data_pairs,
+    num_samples=16,
+    max_abs_dev=0.05,
+    on_fail="warn",
+    report_path=None,
+):
+    """Score a reference subset without and with batching and compare them.
+
+    Args:
+        score_one_fn (Callable): score_one_fn(data_pair) -> {metric: value}
+        score_batch_fn (Callable): score_batch_fn(data_pairs) -> list of
+            (uid, {metric: value}) in the order of `data_pairs`
+        data_pairs (list): list of (uid, path) pairs, the first `num_samples`
+            of which are used as the reference subset
+        num_samples (int): number of reference samples
+        max_abs_dev (float): maximum tolerated absolute deviation of any score
+        on_fail (str): "warn" or "error" when the deviation exceeds `max_abs_dev`
+        report_path (str): path for writing the report (optional)
+    Returns:
+        report (dict): see `precision.compare_scores`
+    """
+    subset = data_pairs[:num_samples]
+    if not subset:
+        return {}
+    ref_scores = [score_one_fn(pair) for pair in subset]
+    test_scores = [score for _, score in score_batch_fn(subset)]
+    report = compare_scores(ref_scores, test_scores)
+    if report_path is not None:
+        with open(report_path, "w") as f:
+            json.dump({"metrics": report}, f, indent=2)
+    report_deviation(
+        report,
+        "batched vs unbatched",
+        max_abs_dev=max_abs_dev,
+        on_fail=on_fail,
+        hint="use a lower '--max_pad_ratio' or '--batch_size 1'",
+    )
+    return report
+
+
+def add_batching_check_arguments(parser):
+    group = parser.add_argument_group("Batching check related")
+    group.add_argument(
+        "--batch_check_num",
+        type=int,
+        default=16,
+        help="Number of samples scored both without and with batching (if "
+        "--batch_size > 1) for checking the deviation. Use 0 to skip the check",
+    )
+    group.add_argument(
+        "--batch_max_dev",
+        type=float,
+        default=0.05,
+        help="Maximum tolerated absolute deviation from the unbatched scores",
+    )
+    group.add_argument(
+        "--batch_on_fail",
+        type=str,
+        default="warn",
+        choices=("warn", "error"),
+        help="Whether to warn or abort if the deviation exceeds the threshold",
+    )
+    return group
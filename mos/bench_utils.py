@@ -0,0 +1,138 @@
+"""Running timed commands and recording the environment of benchmarks.
+
+Shared by benchmark/run_benchmark.py and autotune.py.
+"""
+import os
+import platform
+import signal
+import socket
+import subprocess
+import time
+from pathlib import Path
+
+import torch
+
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+
+
+def _read_hwm(pid):
+    """Peak resident set size (VmHWM) of a process in MB, 0 if it has exited."""
+    try:
+        with open(f"/proc/{pid}/status", "r") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+
+def _children(pid):
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children", "r") as f:
+            return [int(x) for x in f.read().split()]
+    except OSError:
+        return []
+
+
+def run_commands(commands, cwd, env, log_prefix, interval=0.05):
+    """Run commands concurrently and measure the wall time and peak RSS of each.
+
+    The peak RSS is sampled from /proc every `interval` seconds, and includes the
+    worker processes spawned by each command. (`ru_maxrss` cannot be used, as the
+    kernel carries over the high-water mark of the forking parent.)
+
+    Returns:
+        wall_time (float): seconds until the last process finished
+        peak_rss (list): peak RSS of each process (and its workers) in MB
+        returncodes (list): return code of each process
+    """
+    start = time.perf_counter()
+    procs, logs = [], []
+    for i, cmd in enumerate(commands):
+        logs.append(open(f"{log_prefix}.{i + 1}.log", "w"))
+        procs.append(
+            subprocess.Popen(cmd, cwd=cwd, env=env, stdout=logs[-1], stderr=logs[-1])
+        )
+    worker_hwm = [{} for _ in procs]
+    peak_rss = [0.0] * len(procs)
+    while any(proc.poll() is None for proc in procs):
+        for i, proc in enumerate(procs):
+            if proc.returncode is not None:
+                continue
+            for pid in _children(proc.pid):
+                worker_hwm[i][pid] = max(worker_hwm[i].get(pid, 0.0), _read_hwm(pid))
+            peak_rss[i] = max(
+                peak_rss[i], _read_hwm(proc.pid) + sum(worker_hwm[i].values())
+            )
+        time.sleep(interval)
+    wall_time = time.perf_counter() - start
+    for log in logs:
+        log.close()
+    return wall_time, peak_rss, [proc.returncode for proc in procs]
+
+
+def free_port():
+    """A free TCP port on localhost (for starting a server on it)."""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(cmd, address, cwd, env, log_path, timeout=600.0, interval=0.2):
+    """Start a `scoring_server.py` command and wait until it answers /health.
+
+    Returns:
+        proc (subprocess.Popen): the server process, or None if it exited (or
+            did not answer within `timeout` seconds); its output is in `log_path`
+        startup_time (float): seconds until the server was ready
+    """
+    from scoring_client import request
+
+    start = time.perf_counter()
+    with open(log_path, "w") as log:
+        proc = subprocess.Popen(cmd, cwd=cwd, env=env, stdout=log, stderr=log)
+    while proc.poll() is None and time.perf_counter() - start < timeout:
+        try:
+            request(address, "GET", "/health", timeout=interval)
+            return proc, time.perf_counter() - start
+        except OSError:
+            time.sleep(interval)
+    stop_server(proc)
+    return None, time.perf_counter() - start
+
+
+def stop_server(proc):
+    """Stop a server started by `start_server`.
+
+    Returns:
+        peak_rss (float): peak RSS of the server process in MB
+    """
+    peak_rss = _read_hwm(proc.pid)
+    if proc.poll() is None:
+        proc.send_signal(signal.SIGINT)
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+    return peak_rss
+
+
+def environment_info():
+    try:
+        commit = subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], cwd=REPO_DIR, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "torch": torch.__version__,
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "omp_num_threads": os.environ.get("OMP_NUM_THREADS"),
+    }
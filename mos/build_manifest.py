@@ -0,0 +1,192 @@
+from collections import Counter
+from pathlib import Path
+
+import soundfile as sf
+from tqdm.contrib.concurrent import thread_map
+
+from manifest import read_scp, unsafe_manifest_fields, write_manifest
+from stage_profiler import str2bool
+
+
+def escape_tsv(value):
+    return value.replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n")
+
+
+def probe(data_pair):
+    """Read the header of an audio file.
+
+    Returns:
+        row (dict): manifest row (see manifest.MANIFEST_FIELDS), or None
+        error (str): description of the error, or None
+    """
+    uid, audio_path = data_pair
+    try:
+        info = sf.info(audio_path)
+    except Exception as e:
+        return None, f"unreadable: {type(e).__name__}: {e}".replace("\n", " ")
+    row = {
+        "uid": uid,
+        "path": audio_path,
+        "sample_rate": info.samplerate,
+        "channels": info.channels,
+        "frames": info.frames,
+        "duration": f"{info.frames / info.samplerate:.4f}",
+    }
+    return row, None
+
+
+def validate(row, args):
+    """Check a manifest row against the expectations of the scoring scripts.
+
+    Returns:
+        problems (list): descriptions of the problems found (empty if none)
+    """
+    problems = []
+    if args.channels is not None and row["channels"] != args.channels:
+        problems.append(f"{row['channels']} channels (expected {args.channels})")
+    if args.sample_rates and row["sample_rate"] not in args.sample_rates:
+        problems.append(f"unexpected sample rate {row['sample_rate']} Hz")
+    if row["frames"] == 0:
+        problems.append("empty audio")
+    elif float(row["duration"]) < args.min_duration:
+        problems.append(f"shorter than {args.min_duration}s ({row['duration']}s)")
+    if args.max_duration is not None and float(row["duration"]) > args.max_duration:
+        problems.append(f"longer than {args.max_duration}s ({row['duration']}s)")
+    return problems
+
+
+################################################################
+# Main entry
+################################################################
+def main(args):
+    data_pairs = read_scp(args.inf_scp)
+    if args.resolve_paths:
+        data_pairs = [(uid, str(Path(p).resolve())) for uid, p in data_pairs]
+    results = thread_map(
+        probe, data_pairs, max_workers=args.nj, chunksize=args.chunksize
+    )
+
+    rows, problems = [], []
+    duplicates = {uid for uid, n in Counter(uid for uid, _ in data_pairs).items() if n > 1}
+    for (uid, audio_path), (row, error) in zip(data_pairs, results):
+        errors = [error] if error is not None else validate(row, args)
+        if uid in duplicates:
+            errors.append("duplicate uid")
+        unsafe = row is not None and unsafe_manifest_fields(row)
+        if unsafe:
+            errors.append(f"tab or line break in the {', '.join(unsafe)}")
+        if errors:
+            problems.append((uid, audio_path, "; ".join(errors)))
+        # rows that would corrupt the TSV manifest are never kept
+        if row is not None and not unsafe and (not errors or args.keep_invalid):
+            rows.append(row)
+
+    write_manifest(rows, args.output)
+    print(f"Wrote {len(rows)}/{len(data_pairs)} samples to {args.output}", flush=True)
+    if problems:
+        problems_path = Path(args.output).with_suffix(".problems.tsv")
+        with problems_path.open("w") as f:
+            f.write("uid\tpath\tproblem\n")
+            for problem in problems:
+                f.write("\t".join(map(escape_tsv, problem)) + "\n")
+        print(f"Found problems in {len(problems)} samples:", flush=True)
+        for uid, audio_path, problem in problems[: args.show_problems]:
+            print(f"  {uid} ({audio_path}): {problem}", flush=True)
+        if len(problems) > args.show_problems:
+            print(f"  ... (see {problems_path} for the full list)", flush=True)
+        if args.strict:
+            raise SystemExit(1)
+    else:
+        print("No problems found", flush=True)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Read the headers of all audio files in an scp file in parallel, "
+        "report problems, and write a manifest accepted by all scoring scripts "
+        "(--manifest)"
+    )
+    parser.add_argument(
+        "--inf_scp",
+        type=str,
+        required=True,
+        help="Path to the scp file containing the audio files",
+    )
+    parser.add_argument(
+        "--output",
+        type=str,
+        required=True,
+        help="Path to the output manifest (TSV). Problems are written to "
+        "*.problems.tsv next to it.",
+    )
+    parser.add_argument(
+        "--nj",
+        type=int,
+        default=16,
+        help="Number of threads for reading the headers",
+    )
+    parser.add_argument(
+        "--chunksize",
+        type=int,
+        default=64,
+        help="Chunk size used in thread_map",
+    )
+    parser.add_argument(
+        "--resolve_paths",
+        type=str2bool,
+        default=False,
+        help="Whether to write absolute paths into the manifest",
+    )
+
+    group = parser.add_argument_group("Validation related")
+    group.add_argument(
+        "--channels",
+        type=int,
+        default=1,
+        help="Expected number of channels (all scripts except WADA-SNR expect "
+        "mono signals). Set to -1 to disable the check.",
+    )
+    group.add_argument(
+        "--sample_rates",
+        type=int,
+        nargs="*",
+        default=[8000, 16000, 22050, 24000, 32000, 44100, 48000],
+        help="Expected sample rates (empty to disable the check)",
+    )
+    group.add_argument(
+        "--min_duration",
+        type=float,
+        default=0.1,
+        help="Minimum duration in seconds",
+    )
+    group.add_argument(
+        "--max_duration",
+        type=float,
+        default=None,
+        help="Maximum duration in seconds (default: no limit)",
+    )
+    group.add_argument(
+        "--keep_invalid",
+        type=str2bool,
+        default=False,
+        help="Whether to keep the readable samples with problems in the manifest",
+    )
+    group.add_argument(
+        "--strict",
+        type=str2bool,
+        default=False,
+        help="Whether to exit with an error code if any problem is found",
+    )
+    group.add_argument(
+        "--show_problems",
+        type=int,
+        default=20,
+        help="Maximum number of problems printed",
+    )
+    args = parser.parse_args()
+    if args.channels == -1:
+        args.channels = None
+
+    main(args)
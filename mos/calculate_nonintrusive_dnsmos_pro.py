@@ -7,6 +7,13 @@ import sys
 import torch
 from tqdm import tqdm
 
+from manifest import add_input_arguments, get_data_pairs
+from precision import add_precision_arguments, precision_context, prepare_precision
+from progressive import ProgressiveEvaluation, add_progressive_arguments
+from stage_profiler import add_profiler_arguments, profiler, str2bool, write_profile
+from telemetry import add_telemetry_arguments, create_telemetry
+from tuned_config import add_tuned_config_arguments, apply_tuned_config
+
 # git clone https://github.com/fcumlin/DNSMOSPro
 dnsmos_pro_dir = "./DNSMOSPro"
 sys.path.append(dnsmos_pro_dir)
@@ -17,16 +24,6 @@ METRICS = ("DNSMOSPro",)
 TARGET_FS = 16000
 
 
-def str2bool(value: str) -> bool:
-    val = value.lower()
-    if val in ('y', 'yes', 't', 'true', 'on', '1'):
-        return True
-    elif val in ('n', 'no', 'f', 'false', 'off', '0'):
-        return False
-    else:
-        raise ValueError("invalid truth value %r" % (val,))
-
-
 ################################################################
 # Definition of metrics
 ################################################################
@@ -47,12 +44,16 @@ def dnsmos_pro_metric(model, audio, fs=16000, device="cpu"):
         mos_score (float): predicted MOS value between [1, 5]
     """
     if fs != TARGET_FS:
-        audio = soxr.resample(audio, fs, TARGET_FS)
+        with profiler.stage("resample"):
+            audio = soxr.resample(audio, fs, TARGET_FS)
         fs = TARGET_FS
     with torch.no_grad():
-        spec = torch.FloatTensor(utils.stft(audio)).to(device=device)
-        prediction = model(spec[None, None, ..., ])
-    mean = prediction[:, 0].cpu().item()
+        with profiler.stage("stft"):
+            spec = torch.FloatTensor(utils.stft(audio)).to(device=device)
+        with profiler.stage("forward"):
+            prediction = model(spec[None, None, ..., ])
+    with profiler.stage("sync"):
+        mean = prediction[:, 0].float().cpu().item()
     # variance = prediction[:, 1].cpu().item()
     return mean
 
@@ -61,11 +62,10 @@ def dnsmos_pro_metric(model, audio, fs=16000, device="cpu"):
 # Main entry
 ################################################################
 def main(args):
-    data_pairs = []
-    with open(args.inf_scp, "r") as f:
-        for line in f:
-            uid, audio_path = line.strip().split()
-            data_pairs.append((uid, audio_path))
+    if args.num_threads is not None:
+        torch.set_num_threads(args.num_threads)
+
+    data_pairs = get_data_pairs(args)
 
     size = len(data_pairs)
     assert 1 <= args.job <= args.nsplits <= size
@@ -81,35 +81,61 @@ def main(args):
 
     outdir = Path(args.output_dir)
     outdir.mkdir(parents=True, exist_ok=True)
+    progressive = ProgressiveEvaluation(args, data_pairs, METRICS, outdir, suffix)
     writers = {
-        metric: (outdir / f"{metric}{suffix}.scp").open("w") for metric in METRICS
+        metric: (outdir / f"{metric}{suffix}.scp").open(progressive.writer_mode)
+        for metric in METRICS
     }
 
     model = torch.jit.load(args.model_path, map_location=torch.device(args.device))
     model.eval()
-    ret = []
-    for uid, inf_audio in tqdm(data_pairs):
-        _, score = process_one_pair((uid, inf_audio), model=model, device=args.device)
-        ret.append((uid, score))
-        for metric, value in score.items():
-            writers[metric].write(f"{uid} {value}\n")
+    model = prepare_precision(
+        {"DNSMOSPro": model},
+        lambda pair, models: process_one_pair(
+            pair, model=models["DNSMOSPro"], device=args.device
+        )[1],
+        progressive.pending,
+        args,
+        report_path=outdir / f"precision_calibration{suffix}.json",
+    )["DNSMOSPro"]
+    if args.profile:
+        profiler.enable()
+    telemetry = create_telemetry(args, progressive.pending, suffix)
+    ret = list(progressive.scored)
+    with precision_context(args.precision, args.device), telemetry:
+        for uid, inf_audio in tqdm(progressive.pending):
+            _, score, duration = process_one_pair(
+                (uid, inf_audio), model=model, device=args.device, return_duration=True
+            )
+            ret.append((uid, score))
+            with profiler.stage("write"):
+                for metric, value in score.items():
+                    writers[metric].write(f"{uid} {value}\n")
+            telemetry.update(uid, score, duration=duration)
+            if progressive.update(uid, score):
+                break
 
     for metric in METRICS:
         writers[metric].close()
+    progressive.finish(outdir, suffix)
+    if args.profile:
+        write_profile(profiler.drain(), outdir, suffix, trace=args.profile_trace)
 
     if args.nsplits == args.job == 1:
         with (outdir / "RESULTS.txt").open("w") as f:
             for metric in METRICS:
-                mean_score = np.nanmean([score[metric] for uid, score in ret])
+                mean_score = progressive.mean(metric, ret)
                 f.write(f"{metric}: {mean_score:.4f}\n")
         print(
             f"Overall results have been written in {outdir / 'RESULTS.txt'}", flush=True
         )
 
 
-def process_one_pair(data_pair, model=None, device="cpu"):
+def process_one_pair(data_pair, model=None, device="cpu", return_duration=False):
     uid, inf_path = data_pair
-    inf, fs = sf.read(inf_path, dtype="float32")
+    profiler.uid = uid
+    with profiler.stage("read"):
+        inf, fs = sf.read(inf_path, dtype="float32")
     assert inf.ndim == 1, inf.shape
 
     scores = {}
@@ -121,6 +147,8 @@ def process_one_pair(data_pair, model=None, device="cpu"):
         else:
             raise NotImplementedError(metric)
 
+    if return_duration:
+        return uid, scores, len(inf) / fs
     return uid, scores
 
 
@@ -128,12 +156,7 @@ if __name__ == "__main__":
     import argparse
 
     parser = argparse.ArgumentParser()
-    parser.add_argument(
-        "--inf_scp",
-        type=str,
-        required=True,
-        help="Path to the scp file containing enhanced signals",
-    )
+    add_input_arguments(parser)
     parser.add_argument(
         "--output_dir",
         type=str,
@@ -166,6 +189,12 @@ if __name__ == "__main__":
         default="DNSMOSPro/runs/NISQA/model_best.pt",
         help="Path to the pretrained DNSMOS Pro model.",
     )
+    add_precision_arguments(parser)
+    add_profiler_arguments(parser)
+    add_progressive_arguments(parser)
+    add_telemetry_arguments(parser)
+    add_tuned_config_arguments(parser)
     args = parser.parse_args()
+    args = apply_tuned_config(parser, args)
 
     main(args)
@@ -1,34 +1,43 @@
 from pathlib import Path
 from pickle import UnpicklingError
 
-import librosa
 import numpy as np
+import soundfile as sf
+import soxr
 import torch
-import utmosv2  # https://github.com/sarulab-speech/UTMOSv2
 from tqdm import tqdm
-from wvmos import get_wvmos  # https://github.com/AndreevP/wvmos
+
+from batching import (
+    add_batching_check_arguments,
+    check_batching,
+    length_buckets,
+    pad_batch,
+)
+from manifest import add_input_arguments, get_data_pairs
+from precision import add_precision_arguments, precision_context, prepare_precision
+from progressive import ProgressiveEvaluation, add_progressive_arguments
+from stage_profiler import add_profiler_arguments, profiler, str2bool, write_profile
+from telemetry import add_telemetry_arguments, create_telemetry
+from tuned_config import add_tuned_config_arguments, apply_tuned_config
 
 # https://huggingface.co/spaces/sarulab-speech/UTMOSv2/tree/main/models
 utmosv2_dir = "./UTMOSv2"
 
 
 METRICS = ("UTMOS", "UTMOSv2", "WV_MOS")
-
-
-def str2bool(value: str) -> bool:
-    val = value.lower()
-    if val in ('y', 'yes', 't', 'true', 'on', '1'):
-        return True
-    elif val in ('n', 'no', 'f', 'false', 'off', '0'):
-        return False
-    else:
-        raise ValueError("invalid truth value %r" % (val,))
+WVMOS_FS = 16000
+# keyword argument of `process_one_pair` for the model of each metric
+MODEL_KEYS = {
+    "UTMOS": "utmos_model",
+    "UTMOSv2": "utmos_v2_model",
+    "WV_MOS": "wvmos_model",
+}
 
 
 ################################################################
 # Definition of metrics
 ################################################################
-def utmos_metric(model, audio_path):
+def utmos_metric(model, audio_path, return_duration=False):
     """Calculate the UTMOS metric.
 
     Reference:
@@ -40,16 +49,26 @@ def utmos_metric(model, audio_path):
     Args:
         model (torch.nn.Module): UTMOS model
         audio_path: path to the enhanced signal
+        return_duration (bool): whether to also return the duration of the signal
     Returns:
         dnsmos (float): UTMOS value between [1, 5]
+        duration (float): duration in seconds (only with `return_duration=True`)
     """
-    wave, sr = librosa.load(audio_path, sr=None, mono=True)
-    wave = torch.from_numpy(wave).unsqueeze(0).to(device=model.device)
-    utmos_score = model(wave, sr)
-    return float(utmos_score.cpu().item())
+    import librosa
+
+    with profiler.stage("UTMOS/read"):
+        wave, sr = librosa.load(audio_path, sr=None, mono=True)
+        wave = torch.from_numpy(wave).unsqueeze(0).to(device=model.device)
+    with profiler.stage("UTMOS/forward"):
+        utmos_score = model(wave, sr)
+    with profiler.stage("UTMOS/sync"):
+        utmos_score = float(utmos_score.float().cpu().item())
+    if return_duration:
+        return utmos_score, wave.shape[-1] / sr
+    return utmos_score
 
 
-def utmos_v2_metric(model, audio_path):
+def utmos_v2_metric(model, audio_path, device="cpu"):
     """Calculate the UTMOS v2 metric.
 
     Reference:
@@ -62,10 +81,13 @@ def utmos_v2_metric(model, audio_path):
     Args:
         model (torch.nn.Module): UTMOS v2 model
         audio_path: path to the enhanced signal
+        device (str): device for running inference
     Returns:
         dnsmos (float): UTMOS v2 value between [1, 5]
     """
-    utmos_v2_score = model.predict(input_path=audio_path)
+    # file reading, resampling and forward all happen inside the library
+    with profiler.stage("UTMOSv2/predict"):
+        utmos_v2_score = model.predict(input_path=audio_path, device=device)
     return utmos_v2_score
 
 
@@ -83,19 +105,247 @@ def wvmos_metric(model, audio_path):
     Returns:
         dnsmos (float): UTMOS value between [1, 5]
     """
-    wvmos_score = model.calculate_one(audio_path)
+    # file reading, resampling and forward all happen inside the library
+    with profiler.stage("WV_MOS/predict"):
+        wvmos_score = model.calculate_one(audio_path)
     return float(wvmos_score)
 
 
+################################################################
+# Batched variants (audio loading and preprocessing done here)
+################################################################
+def load_audio(audio_path):
+    """Load a (mono-mixed) signal in float32, as `librosa.load(sr=None)` does."""
+    audio, fs = sf.read(audio_path, dtype="float32")
+    if audio.ndim > 1:
+        audio = audio.mean(axis=1)
+    return audio, fs
+
+
+def utmos_metric_batch(model, waves, sr):
+    """Calculate the UTMOS metric for a batch of signals sharing the same rate.
+
+    Args:
+        model (torch.nn.Module): UTMOS model
+        waves (List[np.ndarray]): enhanced signals (time,) of similar lengths
+        sr (int): sampling rate in Hz
+    Returns:
+        utmos_scores (List[float]): UTMOS values between [1, 5]
+    """
+    batch = torch.from_numpy(pad_batch(waves)).to(device=model.device)
+    with profiler.stage("UTMOS/forward"):
+        utmos_scores = model(batch, sr)
+    with profiler.stage("UTMOS/sync"):
+        return utmos_scores.float().cpu().view(-1).tolist()
+
+
+def utmos_v2_metric_batch(model, waves, sr, device="cpu"):
+    """Calculate the UTMOS v2 metric for a batch of signals of the same length.
+
+    UTMOSv2 tiles or crops each signal to a fixed duration internally, so that
+    zero-padding would change its input: only signals of identical lengths and
+    rates are batched (see `process_batch`).
+
+    Args:
+        model (torch.nn.Module): UTMOS v2 model
+        waves (List[np.ndarray]): enhanced signals (time,) of the same length
+        sr (int): sampling rate in Hz
+        device (str): device for running inference
+    Returns:
+        utmos_v2_scores (List[float]): UTMOS v2 values between [1, 5]
+    """
+    assert len({len(w) for w in waves}) == 1, "UTMOSv2 batches must not be padded"
+    batch = torch.from_numpy(np.stack(waves))
+    with profiler.stage("UTMOSv2/predict"):
+        utmos_v2_scores = model.predict(
+            data=batch, sr=sr, device=device, batch_size=len(waves), verbose=False
+        )
+    return np.atleast_1d(np.asarray(utmos_v2_scores, dtype=np.float64)).tolist()
+
+
+def wvmos_num_frames(model, length):
+    """Number of Wav2Vec2 frames of a signal (see `conv_kernel`/`conv_stride`)."""
+    config = model.encoder.config
+    for kernel, stride in zip(config.conv_kernel, config.conv_stride):
+        length = (length - kernel) // stride + 1
+    return length
+
+
+def wvmos_metric_batch(model, waves):
+    """Calculate the WV-MOS metric for a batch of 16 kHz signals.
+
+    This follows `model.calculate_one()` on each signal: each signal is
+    normalized by the Wav2Vec2 processor on its own before zero-padding, the
+    padded frames are masked in the self-attention, and the frame scores are
+    only averaged over the frames of the signal. The remaining deviation from
+    unbatched inference comes from the convolutional feature encoder (whose
+    group normalization sees the padding), and is bounded by `max_pad_ratio`.
+
+    Args:
+        model (torch.nn.Module): WV-MOS model
+        waves (List[np.ndarray]): enhanced signals (time,) of similar lengths
+    Returns:
+        wvmos_scores (List[float]): WV-MOS values
+    """
+    normalized = [
+        model.processor(w, return_tensors="np", sampling_rate=WVMOS_FS)
+        .input_values[0]
+        .astype(np.float32)
+        for w in waves
+    ]
+    x = torch.from_numpy(pad_batch(normalized))
+    mask = torch.zeros(x.shape, dtype=torch.long)
+    for i, w in enumerate(waves):
+        mask[i, : len(w)] = 1
+    num_frames = torch.tensor([wvmos_num_frames(model, len(w)) for w in waves])
+    if model.cuda_flag:
+        x, mask, num_frames = x.cuda(), mask.cuda(), num_frames.cuda()
+    with profiler.stage("WV_MOS/forward"):
+        hidden = model.encoder(x, attention_mask=mask)["last_hidden_state"]
+        frame_scores = model.dense(hidden).squeeze(-1)  # (batch, frames)
+        frames = torch.arange(frame_scores.shape[1], device=x.device)
+        valid = frames[None, :] < num_frames[:, None]
+        wvmos_scores = (frame_scores * valid).sum(dim=1) / num_frames
+    with profiler.stage("WV_MOS/sync"):
+        return wvmos_scores.float().cpu().view(-1).tolist()
+
+
+@torch.no_grad()
+def process_batch(
+    data_pairs,
+    metrics=METRICS,
+    device="cpu",
+    batch_size=16,
+    max_pad_ratio=0.05,
+    utmos_model=None,
+    utmos_v2_model=None,
+    wvmos_model=None,
+    return_durations=False,
+):
+    """Batched counterpart of `process_one_pair`.
+
+    Each file is read once, and the samples are bucketed by sampling rate and
+    length (see `batching.length_buckets`) before running each model on batches.
+    UTMOSv2 only batches samples of identical lengths.
+
+    Returns:
+        ret (list): [(uid, {metric: value}), ...] in the order of `data_pairs`
+        durations (list): duration of each sample in seconds (only returned with
+            `return_durations=True`)
+    """
+    waves, rates = [], []
+    for uid, inf_path in data_pairs:
+        profiler.uid = uid
+        with profiler.stage("read"):
+            audio, fs = load_audio(inf_path)
+        waves.append(audio)
+        rates.append(fs)
+    profiler.uid = None
+
+    scores = [{} for _ in data_pairs]
+    lengths = [len(w) for w in waves]
+    for metric in metrics:
+        if metric == "WV_MOS":
+            with profiler.stage("WV_MOS/resample"):
+                waves_16k = [
+                    w if fs == WVMOS_FS else soxr.resample(w, fs, WVMOS_FS)
+                    for w, fs in zip(waves, rates)
+                ]
+            buckets = length_buckets(
+                [len(w) for w in waves_16k], batch_size, max_pad_ratio
+            )
+        elif metric == "UTMOSv2":
+            buckets = length_buckets(lengths, batch_size, 0.0, keys=rates)
+        else:
+            buckets = length_buckets(lengths, batch_size, max_pad_ratio, keys=rates)
+
+        for idx in buckets:
+            if metric == "UTMOS":
+                values = utmos_metric_batch(
+                    utmos_model, [waves[i] for i in idx], rates[idx[0]]
+                )
+            elif metric == "UTMOSv2":
+                values = utmos_v2_metric_batch(
+                    utmos_v2_model,
+                    [waves[i] for i in idx],
+                    rates[idx[0]],
+                    device=device,
+                )
+            elif metric == "WV_MOS":
+                values = wvmos_metric_batch(wvmos_model, [waves_16k[i] for i in idx])
+            else:
+                raise NotImplementedError(metric)
+            for i, value in zip(idx, values):
+                scores[i][metric] = value
+
+    ret = [(uid, score) for (uid, _), score in zip(data_pairs, scores)]
+    if return_durations:
+        return ret, [len(w) / fs for w, fs in zip(waves, rates)]
+    return ret
+
+
+################################################################
+# Model loading (the libraries are only imported when needed)
+################################################################
+def load_utmos_model(tag="utmos22_strong", device="cpu"):
+    model = torch.hub.load("tarepan/SpeechMOS:v1.2.0", tag, trust_repo=True)
+    model = model.to(device=device)
+    model.device = device
+    return model
+
+
+def load_utmos_v2_model(device="cpu"):
+    import utmosv2  # https://github.com/sarulab-speech/UTMOSv2
+
+    try:
+        return utmosv2.create_model(
+            pretrained=True,
+            checkpoint_path=f"{utmosv2_dir}/models/fusion_stage3/fold0_s42_best_model.pth",
+            device=device,
+        )
+    except UnpicklingError:
+        print(
+            "Failed to load UTMOSv2 model. Please make sure you have downloaded the "
+            f"models in '{utmosv2_dir}/models/fusion_stage3/' from\n"
+            f"   https://huggingface.co/spaces/sarulab-speech/UTMOSv2/tree/main/models/"
+        )
+        raise
+
+
+def load_wvmos_model(device="cpu"):
+    from wvmos import get_wvmos  # https://github.com/AndreevP/wvmos
+
+    return get_wvmos(cuda=str(device).startswith("cuda"))
+
+
+def load_models(metrics, args):
+    """Load the models of the selected metrics only.
+
+    Returns:
+        models (dict): keyword arguments of `process_one_pair` for the models
+    """
+    models = {}
+    for metric in metrics:
+        if metric == "UTMOS":
+            model = load_utmos_model(args.utmos_tag, device=args.device)
+        elif metric == "UTMOSv2":
+            model = load_utmos_v2_model(device=args.device)
+        elif metric == "WV_MOS":
+            model = load_wvmos_model(device=args.device)
+        else:
+            raise NotImplementedError(metric)
+        models[MODEL_KEYS[metric]] = model
+    return models
+
+
 ################################################################
 # Main entry
 ################################################################
 def main(args):
-    data_pairs = []
-    with open(args.inf_scp, "r") as f:
-        for line in f:
-            uid, audio_path = line.strip().split()
-            data_pairs.append((uid, audio_path))
+    if args.num_threads is not None:
+        torch.set_num_threads(args.num_threads)
+
+    data_pairs = get_data_pairs(args)
 
     size = len(data_pairs)
     assert 1 <= args.job <= args.nsplits <= size
@@ -111,47 +361,96 @@ def main(args):
 
     outdir = Path(args.output_dir)
     outdir.mkdir(parents=True, exist_ok=True)
+    progressive = ProgressiveEvaluation(args, data_pairs, args.metrics, outdir, suffix)
     writers = {
-        metric: (outdir / f"{metric}{suffix}.scp").open("w") for metric in METRICS
+        metric: (outdir / f"{metric}{suffix}.scp").open(progressive.writer_mode)
+        for metric in args.metrics
     }
 
-    utmos_model = torch.hub.load(
-        "tarepan/SpeechMOS:v1.2.0", args.utmos_tag, trust_repo=True
-    ).to(device=args.device)
-    utmos_model.device = args.device
-
-    try:
-        utmos_v2_model = utmosv2.create_model(
-            pretrained=True,
-            checkpoint_path=f"{utmosv2_dir}/models/fusion_stage3/fold0_s42_best_model.pth",
-        )
-    except UnpicklingError:
-        print(
-            "Failed to load UTMOSv2 model. Please make sure you have downloaded the "
-            f"models in '{utmosv2_dir}/models/fusion_stage3/' from\n"
-            f"   https://huggingface.co/spaces/sarulab-speech/UTMOSv2/tree/main/models/"
-        )
-        raise
-    wvmos_model = get_wvmos(cuda=True)
-    ret = []
-    for uid, inf_audio in tqdm(data_pairs):
-        _, score = process_one_pair(
-            (uid, inf_audio),
-            utmos_model=utmos_model,
-            utmos_v2_model=utmos_v2_model,
-            wvmos_model=wvmos_model,
-        )
-        ret.append((uid, score))
-        for metric, value in score.items():
-            writers[metric].write(f"{uid} {value}\n")
-
-    for metric in METRICS:
+    models = prepare_precision(
+        load_models(args.metrics, args),
+        lambda pair, models: process_one_pair(
+            pair, metrics=args.metrics, device=args.device, **models
+        )[1],
+        progressive.pending,
+        args,
+        report_path=outdir / f"precision_calibration{suffix}.json",
+    )
+    if args.batch_size > 1 and args.batch_check_num > 0:
+        with precision_context(args.precision, args.device):
+            check_batching(
+                lambda pair: process_one_pair(
+                    pair, metrics=args.metrics, device=args.device, **models
+                )[1],
+                lambda pairs: process_batch(
+                    pairs,
+                    metrics=args.metrics,
+                    device=args.device,
+                    batch_size=args.batch_size,
+                    max_pad_ratio=args.max_pad_ratio,
+                    **models,
+                ),
+                progressive.pending,
+                num_samples=args.batch_check_num,
+                max_abs_dev=args.batch_max_dev,
+                on_fail=args.batch_on_fail,
+                report_path=outdir / f"batching_check{suffix}.json",
+            )
+    if args.profile:
+        profiler.enable()
+    telemetry = create_telemetry(args, progressive.pending, suffix)
+    ret = list(progressive.scored)
+    with precision_context(args.precision, args.device), telemetry:
+        if args.batch_size > 1:
+            # samples are bucketed within windows of `bucket_window` batches
+            window = args.batch_size * args.bucket_window
+            for i in tqdm(range(0, len(progressive.pending), window), unit="window"):
+                batch_ret, durations = process_batch(
+                    progressive.pending[i : i + window],
+                    metrics=args.metrics,
+                    device=args.device,
+                    batch_size=args.batch_size,
+                    max_pad_ratio=args.max_pad_ratio,
+                    return_durations=True,
+                    **models,
+                )
+                ret.extend(batch_ret)
+                stop = False
+                with profiler.stage("write"):
+                    for (uid, score), duration in zip(batch_ret, durations):
+                        for metric, value in score.items():
+                            writers[metric].write(f"{uid} {value}\n")
+                        telemetry.update(uid, score, duration=duration)
+                        stop = progressive.update(uid, score) or stop
+                if stop:
+                    break
+        else:
+            for uid, inf_audio in tqdm(progressive.pending):
+                _, score, duration = process_one_pair(
+                    (uid, inf_audio),
+                    metrics=args.metrics,
+                    device=args.device,
+                    return_duration=True,
+                    **models,
+                )
+                ret.append((uid, score))
+                with profiler.stage("write"):
+                    for metric, value in score.items():
+                        writers[metric].write(f"{uid} {value}\n")
+                telemetry.update(uid, score, duration=duration)
+                if progressive.update(uid, score):
+                    break
+
+    for metric in args.metrics:
         writers[metric].close()
+    progressive.finish(outdir, suffix)
+    if args.profile:
+        write_profile(profiler.drain(), outdir, suffix, trace=args.profile_trace)
 
     if args.nsplits == args.job == 1:
         with (outdir / "RESULTS.txt").open("w") as f:
-            for metric in METRICS:
-                mean_score = np.nanmean([score[metric] for uid, score in ret])
+            for metric in args.metrics:
+                mean_score = progressive.mean(metric, ret)
                 f.write(f"{metric}: {mean_score:.4f}\n")
         print(
             f"Overall results have been written in {outdir / 'RESULTS.txt'}", flush=True
@@ -160,21 +459,34 @@ def main(args):
 
 @torch.no_grad()
 def process_one_pair(
-    data_pair, utmos_model=None, utmos_v2_model=None, wvmos_model=None
+    data_pair,
+    metrics=METRICS,
+    device="cpu",
+    utmos_model=None,
+    utmos_v2_model=None,
+    wvmos_model=None,
+    return_duration=False,
 ):
     uid, inf_path = data_pair
+    profiler.uid = uid
 
     scores = {}
-    for metric in METRICS:
+    # only known if the audio is read here (UTMOSv2 and WV-MOS read it internally)
+    duration = None
+    for metric in metrics:
         if metric == "UTMOS":
-            scores[metric] = utmos_metric(utmos_model, inf_path)
+            scores[metric], duration = utmos_metric(
+                utmos_model, inf_path, return_duration=True
+            )
         elif metric == "UTMOSv2":
-            scores[metric] = utmos_v2_metric(utmos_v2_model, inf_path)
+            scores[metric] = utmos_v2_metric(utmos_v2_model, inf_path, device=device)
         elif metric == "WV_MOS":
             scores[metric] = wvmos_metric(wvmos_model, inf_path)
         else:
             raise NotImplementedError(metric)
 
+    if return_duration:
+        return uid, scores, duration
     return uid, scores
 
 
@@ -182,12 +494,7 @@ if __name__ == "__main__":
     import argparse
 
     parser = argparse.ArgumentParser()
-    parser.add_argument(
-        "--inf_scp",
-        type=str,
-        required=True,
-        help="Path to the scp file containing enhanced signals",
-    )
+    add_input_arguments(parser)
     parser.add_argument(
         "--output_dir",
         type=str,
@@ -213,6 +520,38 @@ if __name__ == "__main__":
         help="Index of the current node (starting from 1)",
     )
 
+    parser.add_argument(
+        "--metrics",
+        type=str,
+        nargs="+",
+        default=list(METRICS),
+        choices=METRICS,
+        help="Metrics to be calculated. Only the selected models are loaded",
+    )
+
+    group = parser.add_argument_group("Batching related")
+    group.add_argument(
+        "--batch_size",
+        type=int,
+        default=1,
+        help="Number of samples in each batch. If > 1, the audio loading and "
+        "preprocessing are done in this script and each model runs on batches",
+    )
+    group.add_argument(
+        "--max_pad_ratio",
+        type=float,
+        default=0.05,
+        help="Maximum ratio of zero-padding allowed for any sample in a batch. "
+        "Use 0 to only batch samples of identical lengths (exact scores)",
+    )
+    group.add_argument(
+        "--bucket_window",
+        type=int,
+        default=16,
+        help="Number of batches within which samples are sorted by length",
+    )
+    add_batching_check_arguments(parser)
+
     group = parser.add_argument_group("MOS model related")
     group.add_argument(
         "--utmos_tag",
@@ -220,6 +559,12 @@ if __name__ == "__main__":
         default="utmos22_strong",
         help="Tag of the UTMOS model to be used",
     )
+    add_precision_arguments(parser)
+    add_profiler_arguments(parser)
+    add_progressive_arguments(parser)
+    add_telemetry_arguments(parser)
+    add_tuned_config_arguments(parser)
     args = parser.parse_args()
+    args = apply_tuned_config(parser, args)
 
     main(args)
@@ -1,3 +1,6 @@
+import copy
+import importlib.metadata
+import warnings
 from pathlib import Path
 
 import numpy as np
@@ -5,15 +8,36 @@ import scoreq  # pip install scoreq
 import torch
 from tqdm import tqdm
 
+from batching import (
+    add_batching_check_arguments,
+    check_batching,
+    length_buckets,
+    pad_batch,
+)
+from embedding_cache import EmbeddingCache, audio_hash
+from manifest import add_input_arguments, get_data_pairs, load_data_pairs
+from precision import add_precision_arguments, precision_context, prepare_precision
+from progressive import ProgressiveEvaluation, add_progressive_arguments
+from stage_profiler import add_profiler_arguments, profiler, write_profile
+from telemetry import add_telemetry_arguments, create_telemetry
+from tuned_config import add_tuned_config_arguments, apply_tuned_config
+
 
 METRICS = ("SCOREQ",)
+REF_METRICS = ("SCOREQ_ref",)
 TARGET_FS = 16000
+EMBEDDING_DIM = 768
+# The batched path reuses the internals of this scoreq version: `Scoreq.model`
+# (a `MosPredictor` or `TripletModel` wrapping the fairseq wav2vec model),
+# `Scoreq.load_processing` and `Scoreq.DEVICE`. Other versions (e.g. the ONNX
+# based scoreq>=1.0) fall back to `Scoreq.predict`.
+SCOREQ_VERSION = "0.0.1"
 
 
 ################################################################
 # Definition of metrics
 ################################################################
-def scoreq_metric(model, audio_path):
+def scoreq_metric(model, audio_path, ref_path=None):
     """Calculate the SCOREQ metric.
 
     Reference:
@@ -24,24 +48,168 @@ def scoreq_metric(model, audio_path):
     Args:
         model (torch.nn.Module): SCOREQ model
         audio_path: path to the enhanced signal
+        ref_path: path to the reference signal (only used in the "ref" mode)
     Returns:
-        pred_mos (float): predicted MOS value between [1, 5]
+        pred_mos (float): predicted MOS value between [1, 5] in the "nr" mode,
+            or the distance to the reference in the "ref" mode (lower is better)
     """
-    with torch.no_grad():
-        pred_mos = model.predict(test_path=audio_path, ref_path=None)
+    # file reading, resampling and forward all happen inside the library
+    with torch.no_grad(), profiler.stage("predict"):
+        pred_mos = model.predict(test_path=audio_path, ref_path=ref_path)
 
     return pred_mos
 
 
+def supports_batching(model):
+    """Whether the batched path applies to the loaded SCOREQ model.
+
+    Returns:
+        supported (bool)
+        reason (str): why the batched path does not apply (if not supported)
+    """
+    try:
+        version = importlib.metadata.version("scoreq")
+    except importlib.metadata.PackageNotFoundError:
+        version = None  # not installed as a distribution (e.g. a source checkout)
+    if version is not None and version != SCOREQ_VERSION:
+        return False, f"scoreq {version} is installed (expected {SCOREQ_VERSION})"
+    network = getattr(model, "model", None)
+    if model.mode == "nr":
+        if not hasattr(network, "mos_layer"):
+            return False, "Scoreq.model.mos_layer is missing"
+        network = getattr(network, "pt_model", None)
+    for attr in ("load_processing", "DEVICE"):
+        if not hasattr(model, attr):
+            return False, f"Scoreq.{attr} is missing"
+    if not hasattr(network, "ssl_model"):
+        return False, "the wav2vec model (ssl_model) is missing"
+    return True, None
+
+
+def scoreq_embedding_batch(model, waves):
+    """Extract the SCOREQ embeddings of a batch of signals in one forward.
+
+    This follows `TripletModel.forward(wav, phead=False)` of scoreq, except that
+    the padded frames are excluded from the mean pooling over time.
+
+    Args:
+        model (scoreq.Scoreq): SCOREQ model
+        waves (list): list of 1-D torch.Tensor signals sampled at 16 kHz
+    Returns:
+        embeddings (np.ndarray): L2-normalized embeddings (batch, 768)
+    """
+    triplet_model = model.model.pt_model if model.mode == "nr" else model.model
+    with profiler.stage("pad"):
+        lengths = torch.tensor([len(w) for w in waves])
+        batch = torch.from_numpy(pad_batch([w.numpy() for w in waves]))
+        padding_mask = None
+        if lengths.min() < lengths.max():
+            padding_mask = torch.arange(batch.size(1))[None, :] >= lengths[:, None]
+            padding_mask = padding_mask.to(model.DEVICE)
+        batch = batch.to(model.DEVICE)
+    with torch.no_grad(), profiler.stage("forward"):
+        res = triplet_model.ssl_model(
+            batch, padding_mask=padding_mask, mask=False, features_only=True
+        )
+        x = res["x"]
+        if res.get("padding_mask") is not None:
+            valid = (~res["padding_mask"]).unsqueeze(-1).to(x.dtype)
+            x = (x * valid).sum(dim=1) / valid.sum(dim=1).clamp(min=1)
+        else:
+            x = x.mean(dim=1)
+        x = torch.nn.functional.normalize(x, dim=1)
+    with profiler.stage("sync"):
+        return x.float().cpu().numpy()
+
+
+def scoreq_embeddings(
+    model, items, batch_size, max_pad_ratio, cache=None, durations=None
+):
+    """Get the embeddings of (uid, path) items, from `cache` when available.
+
+    Args:
+        model (scoreq.Scoreq): SCOREQ model
+        items (list): list of (uid, path) of the signals to be embedded
+        batch_size (int): maximum number of signals in each forward
+        max_pad_ratio (float): maximum ratio of zero-padding in a batch
+        cache (EmbeddingCache): persistent embedding store (optional)
+        durations (dict): filled with {(uid, path): seconds} of the signals
+            read here, i.e. not found in `cache` (optional)
+    Returns:
+        embeddings (dict): {(uid, path): np.ndarray (768,)}
+    """
+    embeddings, missing, keys = {}, [], []
+    for uid, path in dict.fromkeys(items):
+        if cache is not None:
+            profiler.uid = uid
+            with profiler.stage("hash"):
+                digest = audio_hash(path)
+            emb = cache.get(uid, digest)
+            if emb is not None:
+                embeddings[(uid, path)] = emb
+                continue
+            keys.append((uid, digest))
+        missing.append((uid, path))
+    if not missing:
+        return embeddings
+
+    waves = []
+    for uid, path in missing:
+        profiler.uid = uid
+        with profiler.stage("read"):
+            # same loading and resampling as in `model.predict`
+            waves.append(model.load_processing(path)[0])
+        if durations is not None:
+            # `load_processing` resamples to 16 kHz
+            durations[(uid, path)] = len(waves[-1]) / 16000
+    batches = length_buckets([len(w) for w in waves], batch_size, max_pad_ratio)
+    new_embs = np.zeros((len(missing), EMBEDDING_DIM), dtype=np.float32)
+    for indices in batches:
+        profiler.uid = missing[indices[0]][0]
+        new_embs[indices] = scoreq_embedding_batch(model, [waves[i] for i in indices])
+    if cache is not None:
+        with profiler.stage("cache"):
+            cache.put_many(keys, new_embs)
+    for item, emb in zip(missing, new_embs):
+        embeddings[item] = emb
+    return embeddings
+
+
+def scoreq_metric_batch(model, audio_paths, ref_paths=None, **kwargs):
+    """Calculate the SCOREQ metric of a batch of signals from their embeddings.
+
+    Args:
+        model (scoreq.Scoreq): SCOREQ model
+        audio_paths (list): list of (uid, path) of the enhanced signals
+        ref_paths (list): list of (uid, path) of the corresponding reference
+            signals (only used in the "ref" mode)
+        **kwargs: see `scoreq_embeddings`
+    Returns:
+        scores (list): predicted MOS values ("nr" mode) or distances to the
+            references ("ref" mode)
+    """
+    items = list(audio_paths) + (list(ref_paths) if model.mode == "ref" else [])
+    embeddings = scoreq_embeddings(model, items, **kwargs)
+    test_emb = torch.from_numpy(np.stack([embeddings[p] for p in audio_paths]))
+    with torch.no_grad(), profiler.stage("head"):
+        if model.mode == "nr":
+            pred = model.model.mos_layer(test_emb.to(model.DEVICE))
+            # `model.predict` rounds the MOS to 4 decimals
+            return np.round(pred[:, 0].double().cpu().numpy(), 4).tolist()
+        ref_emb = torch.from_numpy(np.stack([embeddings[p] for p in ref_paths]))
+        # same distance as `model.predict` (torch.cdist of each pair)
+        dist = torch.cdist(test_emb.unsqueeze(1), ref_emb.unsqueeze(1))
+        return dist.view(-1).tolist()
+
+
 ################################################################
 # Main entry
 ################################################################
 def main(args):
-    data_pairs = []
-    with open(args.inf_scp, "r") as f:
-        for line in f:
-            uid, audio_path = line.strip().split()
-            data_pairs.append((uid, audio_path))
+    if args.num_threads is not None:
+        torch.set_num_threads(args.num_threads)
+
+    data_pairs = get_data_pairs(args)
 
     size = len(data_pairs)
     assert 1 <= args.job <= args.nsplits <= size
@@ -55,59 +223,188 @@ def main(args):
     )
     suffix = "" if args.nsplits == args.job == 1 else f".{args.job}"
 
+    ref_paths = None
+    metrics = METRICS
+    if args.mode == "ref":
+        assert args.ref_scp is not None, "--ref_scp is required in the 'ref' mode"
+        ref_paths = dict(load_data_pairs(args.ref_scp))
+        metrics = REF_METRICS
+
     outdir = Path(args.output_dir)
     outdir.mkdir(parents=True, exist_ok=True)
+    progressive = ProgressiveEvaluation(args, data_pairs, metrics, outdir, suffix)
     writers = {
-        metric: (outdir / f"{metric}{suffix}.scp").open("w") for metric in METRICS
+        metric: (outdir / f"{metric}{suffix}.scp").open(progressive.writer_mode)
+        for metric in metrics
     }
 
     # The models will be downloaded to ./pt-models/ for the first time
     # https://dl.fbaipublicfiles.com/fairseq/wav2vec/wav2vec_small.pt
     # https://zenodo.org/records/13860326/files/adapt_nr_telephone.pt
-    model = scoreq.Scoreq(device=args.device, data_domain="natural", mode="nr")
-    ret = []
-    for uid, inf_audio in tqdm(data_pairs):
-        _, score = process_one_pair((uid, inf_audio), model=model)
-        ret.append((uid, score))
-        for metric, value in score.items():
-            writers[metric].write(f"{uid} {value}\n")
-
-    for metric in METRICS:
+    model = scoreq.Scoreq(
+        device=args.device, data_domain=args.data_domain, mode=args.mode
+    )
+    model.model = prepare_precision(
+        {"SCOREQ": model.model},
+        lambda pair, models: process_one_pair(
+            pair, model=with_network(model, models["SCOREQ"]), ref_paths=ref_paths
+        )[1],
+        progressive.pending,
+        args,
+        report_path=outdir / f"precision_calibration{suffix}.json",
+    )["SCOREQ"]
+    batched = args.batch_size > 1 or args.embedding_cache is not None
+    if batched:
+        supported, reason = supports_batching(model)
+        if not supported:
+            warnings.warn(
+                f"The batched SCOREQ path is not supported ({reason}); "
+                "--batch_size and --embedding_cache are ignored and each file is "
+                "scored with Scoreq.predict"
+            )
+            batched = False
+    if batched and args.batch_check_num > 0:
+        # compare with the reference implementation (`Scoreq.predict`)
+        with precision_context(args.precision, args.device):
+            check_batching(
+                lambda pair: process_one_pair(
+                    pair, model=model, ref_paths=ref_paths
+                )[1],
+                lambda pairs: process_batch(
+                    pairs,
+                    model=model,
+                    ref_paths=ref_paths,
+                    batch_size=args.batch_size,
+                    max_pad_ratio=args.max_pad_ratio,
+                ),
+                progressive.pending,
+                num_samples=args.batch_check_num,
+                max_abs_dev=args.batch_max_dev,
+                on_fail=args.batch_on_fail,
+                report_path=outdir / f"batching_check{suffix}.json",
+            )
+    cache = None
+    if batched and args.embedding_cache is not None:
+        # embeddings depend on the model (and its precision)
+        cache_dir = Path(args.embedding_cache) / "_".join(
+            (args.data_domain, args.mode, args.precision)
+        )
+        cache = EmbeddingCache(cache_dir, EMBEDDING_DIM)
+        print(f"Using {len(cache)} cached embeddings in {cache_dir}", flush=True)
+    if args.profile:
+        profiler.enable()
+    telemetry = create_telemetry(args, progressive.pending, suffix)
+    ret = list(progressive.scored)
+    with precision_context(args.precision, args.device), telemetry:
+        if not batched:
+            for uid, inf_audio in tqdm(progressive.pending):
+                _, score = process_one_pair(
+                    (uid, inf_audio), model=model, ref_paths=ref_paths
+                )
+                ret.append((uid, score))
+                with profiler.stage("write"):
+                    for metric, value in score.items():
+                        writers[metric].write(f"{uid} {value}\n")
+                # the audio is read inside `Scoreq.predict`: the telemetry
+                # reads the duration from the header
+                telemetry.update(uid, score)
+                if progressive.update(uid, score):
+                    break
+        else:
+            # a window of several batches is loaded at a time for length bucketing
+            window = args.batch_size * args.bucket_window
+            for i in tqdm(range(0, len(progressive.pending), window), unit="window"):
+                results, durations = process_batch(
+                    progressive.pending[i : i + window],
+                    model=model,
+                    ref_paths=ref_paths,
+                    batch_size=args.batch_size,
+                    max_pad_ratio=args.max_pad_ratio,
+                    cache=cache,
+                    return_durations=True,
+                )
+                ret.extend(results)
+                stop = False
+                with profiler.stage("write"):
+                    for (uid, score), duration in zip(results, durations):
+                        for metric, value in score.items():
+                            writers[metric].write(f"{uid} {value}\n")
+                        telemetry.update(uid, score, duration=duration)
+                        stop = progressive.update(uid, score) or stop
+                if stop:
+                    break
+
+    for metric in metrics:
         writers[metric].close()
+    progressive.finish(outdir, suffix)
+    if args.profile:
+        write_profile(profiler.drain(), outdir, suffix, trace=args.profile_trace)
 
     if args.nsplits == args.job == 1:
         with (outdir / "RESULTS.txt").open("w") as f:
-            for metric in METRICS:
-                mean_score = np.nanmean([score[metric] for uid, score in ret])
+            for metric in metrics:
+                mean_score = progressive.mean(metric, ret)
                 f.write(f"{metric}: {mean_score:.4f}\n")
         print(
             f"Overall results have been written in {outdir / 'RESULTS.txt'}", flush=True
         )
 
 
-def process_one_pair(data_pair, model=None):
+def with_network(model, network):
+    """Return a shallow copy of the SCOREQ wrapper using another network."""
+    model = copy.copy(model)
+    model.model = network
+    return model
+
+
+def process_one_pair(data_pair, model=None, ref_paths=None):
     uid, inf_path = data_pair
+    profiler.uid = uid
 
     scores = {}
-    for metric in METRICS:
-        if metric == "SCOREQ":
-            scores[metric] = scoreq_metric(model, inf_path)
-        else:
-            raise NotImplementedError(metric)
+    if model.mode == "nr":
+        for metric in METRICS:
+            if metric == "SCOREQ":
+                scores[metric] = scoreq_metric(model, inf_path)
+            else:
+                raise NotImplementedError(metric)
+    else:
+        for metric in REF_METRICS:
+            if metric == "SCOREQ_ref":
+                scores[metric] = scoreq_metric(model, inf_path, ref_paths[uid])
+            else:
+                raise NotImplementedError(metric)
 
     return uid, scores
 
 
+def process_batch(
+    data_pairs, model=None, ref_paths=None, return_durations=False, **kwargs
+):
+    """Batched version of `process_one_pair` (see `scoreq_embeddings` for kwargs).
+
+    Returns:
+        ret (list): list of (uid, scores) in the same order as `data_pairs`
+        durations (list): duration in seconds of each signal, None if its
+            embedding was cached (only returned with `return_durations=True`)
+    """
+    durations = {} if return_durations else None
+    refs = None
+    if model.mode == "ref":
+        refs = [(uid, ref_paths[uid]) for uid, _ in data_pairs]
+    values = scoreq_metric_batch(model, data_pairs, refs, durations=durations, **kwargs)
+    metric = METRICS[0] if model.mode == "nr" else REF_METRICS[0]
+    ret = [(uid, {metric: value}) for (uid, _), value in zip(data_pairs, values)]
+    if return_durations:
+        return ret, [durations.get(tuple(pair)) for pair in data_pairs]
+    return ret
+
+
 if __name__ == "__main__":
     import argparse
 
     parser = argparse.ArgumentParser()
-    parser.add_argument(
-        "--inf_scp",
-        type=str,
-        required=True,
-        help="Path to the scp file containing enhanced signals",
-    )
+    add_input_arguments(parser)
     parser.add_argument(
         "--output_dir",
         type=str,
@@ -132,6 +429,66 @@ if __name__ == "__main__":
         default=1,
         help="Index of the current node (starting from 1)",
     )
+
+    group = parser.add_argument_group("SCOREQ related")
+    group.add_argument(
+        "--mode",
+        type=str,
+        default="nr",
+        choices=("nr", "ref"),
+        help="'nr': no-reference MOS (SCOREQ), "
+        "'ref': distance to the reference signal (SCOREQ_ref, lower is better)",
+    )
+    group.add_argument(
+        "--ref_scp",
+        type=str,
+        default=None,
+        help="Path to the scp file (or manifest) containing reference signals "
+        "(for --mode ref)",
+    )
+    group.add_argument(
+        "--data_domain",
+        type=str,
+        default="natural",
+        choices=("natural", "synthetic"),
+        help="Domain of the SCOREQ model",
+    )
+
+    group = parser.add_argument_group("Batching and caching related")
+    group.add_argument(
+        "--batch_size",
+        type=int,
+        default=1,
+        help="Number of signals in each forward (with --batch_size 1 and no "
+        "--embedding_cache, each file is scored with `Scoreq.predict`)",
+    )
+    group.add_argument(
+        "--max_pad_ratio",
+        type=float,
+        default=0.05,
+        help="Maximum ratio of zero-padding allowed for any sample in a batch",
+    )
+    group.add_argument(
+        "--bucket_window",
+        type=int,
+        default=16,
+        help="Number of batches loaded at a time for grouping samples by length",
+    )
+    group.add_argument(
+        "--embedding_cache",
+        type=str,
+        default=None,
+        help="Directory for persisting the SCOREQ embeddings, keyed by uid and "
+        "audio hash. Cached embeddings are reused across runs, e.g. for the "
+        "reference signals shared by all systems in the 'ref' mode.",
+    )
+    add_batching_check_arguments(parser)
+    add_precision_arguments(parser)
+    add_profiler_arguments(parser)
+    add_progressive_arguments(parser)
+    add_telemetry_arguments(parser)
+    add_tuned_config_arguments(parser)
     args = parser.parse_args()
+    args = apply_tuned_config(parser, args)
 
     main(args)
@@ -8,6 +8,13 @@ import sys
 import torch
 from tqdm import tqdm
 
+from manifest import add_input_arguments, get_data_pairs
+from precision import add_precision_arguments, precision_context, prepare_precision
+from progressive import ProgressiveEvaluation, add_progressive_arguments
+from stage_profiler import add_profiler_arguments, profiler, write_profile
+from telemetry import add_telemetry_arguments, create_telemetry
+from tuned_config import add_tuned_config_arguments, apply_tuned_config
+
 # git clone https://github.com/JasonSWFu/VQscore
 vqscore_dir = "./VQscore"
 sys.path.append(vqscore_dir)
@@ -74,33 +81,50 @@ def vqscore_metric(model, audio, fs=16000, hop_size=256, device="cpu"):
         vqscore (float): predicted VQScore value between [-1.0, 1.0]
     """
     if fs != TARGET_FS:
-        audio = soxr.resample(audio, fs, TARGET_FS)
+        with profiler.stage("resample"):
+            audio = soxr.resample(audio, fs, TARGET_FS)
         fs = TARGET_FS
     with torch.no_grad():
-        audio = torch.from_numpy(audio).to(device=device).unsqueeze(0)
-        SP_input = stft_magnitude(audio, hop_size=hop_size)
-        if model.input_transform == "log1p":
-            SP_input = torch.log1p(SP_input)
-        z = model.CNN_1D_encoder(SP_input)
-        zq, indices, vqloss, distance = model.quantizer(
-            z, stochastic=False, update=False
-        )
-        SP_output = model.CNN_1D_decoder(zq)
-
-        VQScore_cos_z = cos_similarity(z.transpose(2, 1).cpu(), zq.cpu()).numpy()
+        with profiler.stage("stft"):
+            audio = torch.from_numpy(audio).to(device=device).unsqueeze(0)
+            SP_input = stft_magnitude(audio, hop_size=hop_size)
+            if model.input_transform == "log1p":
+                SP_input = torch.log1p(SP_input)
+        with profiler.stage("forward"):
+            z = model.CNN_1D_encoder(SP_input)
+            zq, indices, vqloss, distance = model.quantizer(
+                z, stochastic=False, update=False
+            )
+            SP_output = model.CNN_1D_decoder(zq)
+
+        with profiler.stage("sync"):
+            VQScore_cos_z = cos_similarity(
+                z.transpose(2, 1).float().cpu(), zq.float().cpu()
+            ).numpy()
 
     return VQScore_cos_z
 
 
+def load_model(conf_path, model_path, device="cpu"):
+    """Load the pretrained VQVAE_QE model used for VQscore."""
+    with open(conf_path, "r") as f:
+        config = yaml.load(f, Loader=yaml.FullLoader)
+    if device.startswith("cuda"):
+        torch.backends.cudnn.benchmark = True
+    model = VQVAE_QE(**config["VQVAE_params"]).to(device=device).eval()
+    model.load_state_dict(torch.load(model_path)["model"]["VQVAE"])
+    model.input_transform = config["input_transform"]
+    return model
+
+
 ################################################################
 # Main entry
 ################################################################
 def main(args):
-    data_pairs = []
-    with open(args.inf_scp, "r") as f:
-        for line in f:
-            uid, audio_path = line.strip().split()
-            data_pairs.append((uid, audio_path))
+    if args.num_threads is not None:
+        torch.set_num_threads(args.num_threads)
+
+    data_pairs = get_data_pairs(args)
 
     size = len(data_pairs)
     assert 1 <= args.job <= args.nsplits <= size
@@ -116,40 +140,60 @@ def main(args):
 
     outdir = Path(args.output_dir)
     outdir.mkdir(parents=True, exist_ok=True)
+    progressive = ProgressiveEvaluation(args, data_pairs, METRICS, outdir, suffix)
     writers = {
-        metric: (outdir / f"{metric}{suffix}.scp").open("w") for metric in METRICS
+        metric: (outdir / f"{metric}{suffix}.scp").open(progressive.writer_mode)
+        for metric in METRICS
     }
 
-    with open(args.vqscore_conf, "r") as f:
-        config = yaml.load(f, Loader=yaml.FullLoader)
-    if args.device.startswith("cuda"):
-        torch.backends.cudnn.benchmark = True
-    model = VQVAE_QE(**config["VQVAE_params"]).to(device=args.device).eval()
-    model.load_state_dict(torch.load(args.vqscore_model)["model"]["VQVAE"])
-    model.input_transform = config["input_transform"]
-    ret = []
-    for uid, inf_audio in tqdm(data_pairs):
-        _, score = process_one_pair((uid, inf_audio), model=model, device=args.device)
-        ret.append((uid, score))
-        for metric, value in score.items():
-            writers[metric].write(f"{uid} {value}\n")
+    model = load_model(args.vqscore_conf, args.vqscore_model, device=args.device)
+    model = prepare_precision(
+        {"VQscore": model},
+        lambda pair, models: process_one_pair(
+            pair, model=models["VQscore"], device=args.device
+        )[1],
+        progressive.pending,
+        args,
+        report_path=outdir / f"precision_calibration{suffix}.json",
+    )["VQscore"]
+    if args.profile:
+        profiler.enable()
+    telemetry = create_telemetry(args, progressive.pending, suffix)
+    ret = list(progressive.scored)
+    with precision_context(args.precision, args.device), telemetry:
+        for uid, inf_audio in tqdm(progressive.pending):
+            _, score, duration = process_one_pair(
+                (uid, inf_audio), model=model, device=args.device, return_duration=True
+            )
+            ret.append((uid, score))
+            with profiler.stage("write"):
+                for metric, value in score.items():
+                    writers[metric].write(f"{uid} {value}\n")
+            telemetry.update(uid, score, duration=duration)
+            if progressive.update(uid, score):
+                break
 
     for metric in METRICS:
         writers[metric].close()
+    progressive.finish(outdir, suffix)
+    if args.profile:
+        write_profile(profiler.drain(), outdir, suffix, trace=args.profile_trace)
 
     if args.nsplits == args.job == 1:
         with (outdir / "RESULTS.txt").open("w") as f:
             for metric in METRICS:
-                mean_score = np.nanmean([score[metric] for uid, score in ret])
+                mean_score = progressive.mean(metric, ret)
                 f.write(f"{metric}: {mean_score:.4f}\n")
         print(
             f"Overall results have been written in {outdir / 'RESULTS.txt'}", flush=True
         )
 
 
-def process_one_pair(data_pair, model=None, device="cpu"):
+def process_one_pair(data_pair, model=None, device="cpu", return_duration=False):
     uid, inf_path = data_pair
-    inf, fs = sf.read(inf_path, dtype="float32")
+    profiler.uid = uid
+    with profiler.stage("read"):
+        inf, fs = sf.read(inf_path, dtype="float32")
     assert inf.ndim == 1, inf.shape
 
     scores = {}
@@ -161,6 +205,8 @@ def process_one_pair(data_pair, model=None, device="cpu"):
         else:
             raise NotImplementedError(metric)
 
+    if return_duration:
+        return uid, scores, len(inf) / fs
     return uid, scores
 
 
@@ -168,12 +214,7 @@ if __name__ == "__main__":
     import argparse
 
     parser = argparse.ArgumentParser()
-    parser.add_argument(
-        "--inf_scp",
-        type=str,
-        required=True,
-        help="Path to the scp file containing enhanced signals",
-    )
+    add_input_arguments(parser)
     parser.add_argument(
         "--output_dir",
         type=str,
@@ -214,6 +255,12 @@ if __name__ == "__main__":
         "Librispeech_clean_github/checkpoint-dnsmos_ovr_CC=0.835.pkl",
         help="Path to the pretrained VQscore model.",
     )
+    add_precision_arguments(parser)
+    add_profiler_arguments(parser)
+    add_progressive_arguments(parser)
+    add_telemetry_arguments(parser)
+    add_tuned_config_arguments(parser)
     args = parser.parse_args()
+    args = apply_tuned_config(parser, args)
 
     main(args)
@@ -0,0 +1,112 @@
+import fcntl
+import hashlib
+import json
+from pathlib import Path
+
+import numpy as np
+
+
+def audio_hash(path, chunk_size=1 << 20):
+    """Hash of the audio file content (independent of its path)."""
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class EmbeddingCache:
+    """Append-only, memory-mapped store of fixed-size embeddings.
+
+    Embeddings are keyed by (uid, audio hash), so that re-encoded or modified
+    files are not mistaken for cached ones, and shared files (e.g. the same clean
+    reference used for many systems) are embedded only once.
+
+    Layout of `cache_dir`:
+        meta.json       {"dim": ..., "dtype": ...}
+        embeddings.bin  raw (num_rows, dim) array, memory-mapped for reading
+        index.tsv       "<uid>\\t<audio hash>\\t<row>" per line
+
+    Appending is guarded by a file lock, so that parallel jobs (e.g. `--nsplits`)
+    can share the same cache.
+
+    Args:
+        cache_dir (str): directory of the cache
+        dim (int): embedding dimension
+        dtype (str): data type of the stored embeddings
+    """
+
+    def __init__(self, cache_dir, dim, dtype="float32"):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.dim = dim
+        self.dtype = np.dtype(dtype)
+        meta = {"dim": dim, "dtype": self.dtype.name}
+        meta_path = self.cache_dir / "meta.json"
+        if meta_path.exists():
+            with meta_path.open("r") as f:
+                stored = json.load(f)
+            if stored != meta:
+                raise ValueError(
+                    f"Embedding cache {cache_dir} was created with {stored}, "
+                    f"which does not match {meta}"
+                )
+        else:
+            with meta_path.open("w") as f:
+                json.dump(meta, f)
+        self.data_path = self.cache_dir / "embeddings.bin"
+        self.index_path = self.cache_dir / "index.tsv"
+        self.data_path.touch()
+        self.index_path.touch()
+        self.index = {}
+        self._mmap = None
+        self._index_offset = 0
+        self._refresh()
+
+    def _refresh(self):
+        """Read the index entries appended (possibly by other jobs) since last time."""
+        with self.index_path.open("r") as f:
+            f.seek(self._index_offset)
+            for line in f:
+                if not line.endswith("\n"):
+                    break
+                uid, digest, row = line.rstrip("\n").split("\t")
+                self.index[(uid, digest)] = int(row)
+                self._index_offset += len(line.encode("utf-8"))
+        num_rows = self.data_path.stat().st_size // (self.dim * self.dtype.itemsize)
+        if num_rows and (self._mmap is None or len(self._mmap) < num_rows):
+            self._mmap = np.memmap(
+                self.data_path, dtype=self.dtype, mode="r", shape=(num_rows, self.dim)
+            )
+
+    def __len__(self):
+        return len(self.index)
+
+    def get(self, uid, digest):
+        """Return the cached embedding (dim,) or None."""
+        row = self.index.get((uid, digest))
+        if row is None:
+            return None
+        if self._mmap is None or row >= len(self._mmap):
+            self._refresh()
+        return np.asarray(self._mmap[row])
+
+    def put_many(self, keys, embeddings):
+        """Append embeddings (N, dim) for the given (uid, digest) keys."""
+        embeddings = np.ascontiguousarray(embeddings, dtype=self.dtype)
+        assert embeddings.shape == (len(keys), self.dim), embeddings.shape
+        with self.index_path.open("a") as index_f:
+            fcntl.flock(index_f, fcntl.LOCK_EX)
+            try:
+                with self.data_path.open("ab") as data_f:
+                    start = data_f.tell() // (self.dim * self.dtype.itemsize)
+                    data_f.write(embeddings.tobytes())
+                lines = []
+                for i, (uid, digest) in enumerate(keys):
+                    self.index[(uid, digest)] = start + i
+                    lines.append(f"{uid}\t{digest}\t{start + i}\n")
+                index_f.write("".join(lines))
+                index_f.flush()
+            finally:
+                fcntl.flock(index_f, fcntl.LOCK_UN)
+        self._refresh()
@@ -0,0 +1,266 @@
+import multiprocessing as mp
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import numpy as np
+from tqdm import tqdm
+
+from manifest import load_data_pairs
+from metric_registry import METRICS, METRIC_TO_MODEL, add_model_arguments, load_scorer
+
+
+def read_team_manifest(manifest_path):
+    """Read a manifest of systems, with one "<team> <path to scp>" per line.
+
+    Each scp file may also be an audio manifest built by `build_manifest.py`.
+
+    Returns:
+        systems (dict): {team: [(uid, audio_path), ...]} in the manifest order
+    """
+    systems = {}
+    with open(manifest_path, "r") as f:
+        for line in f:
+            if not line.strip() or line.startswith("#"):
+                continue
+            team, scp_path = line.strip().split(maxsplit=1)
+            assert team not in systems, f"Duplicate team in {manifest_path}: {team}"
+            systems[team] = load_data_pairs(scp_path)
+    return systems
+
+
+def build_uid_index(systems):
+    """Union of the uids of all systems, in order of first appearance."""
+    uids = {}
+    for data_pairs in systems.values():
+        for uid, _ in data_pairs:
+            uids.setdefault(uid, len(uids))
+    return uids
+
+
+def load_cube(cube_dir):
+    """Load the outputs of this script.
+
+    Returns:
+        scores (np.ndarray): (num_teams, num_uids, num_metrics), NaN where missing
+        teams (list): team names (first axis)
+        uids (list): utterance ids (second axis)
+        metrics (list): metric names (third axis)
+    """
+    cube_dir = Path(cube_dir)
+    scores = np.load(cube_dir / "scores.npy", mmap_mode="r")
+    teams, uids, metrics = (
+        (cube_dir / f"{name}.txt").read_text().splitlines()
+        for name in ("teams", "uids", "metrics")
+    )
+    assert scores.shape == (len(teams), len(uids), len(metrics)), scores.shape
+    return scores, teams, uids, metrics
+
+
+################################################################
+# Scoring of (team, uid) items with one model
+################################################################
+# model loaded by the current (worker) process: {model_name: Scorer}
+_loaded_scorer = {}
+
+
+def get_scorer(model_name, args, loader=load_scorer):
+    """Load `model_name`, or reuse it if it was loaded by the previous call.
+
+    Only one model is kept per process, so that a worker switching to another
+    model releases the previous one.
+    """
+    if model_name not in _loaded_scorer:
+        _loaded_scorer.clear()
+        if args.num_threads is not None:
+            import torch
+
+            torch.set_num_threads(args.num_threads)
+        _loaded_scorer[model_name] = loader(model_name, args)
+    return _loaded_scorer[model_name]
+
+
+def system_items(systems, uid_index):
+    """All (team index, uid index, (uid, path)) items of the systems."""
+    return [
+        (t, uid_index[uid], (uid, path))
+        for t, data_pairs in enumerate(systems.values())
+        for uid, path in data_pairs
+    ]
+
+
+def score_model(
+    model_name, metrics, systems, uid_index, args, loader=load_scorer, progress=True
+):
+    """Load `model_name` once and score the samples of all systems with it.
+
+    Args:
+        loader (Callable): loader(model_name, args) -> Scorer (see `load_scorer`)
+        progress (bool): whether to show a progress bar
+    Returns:
+        model_name (str): same as the input
+        scores (np.ndarray): (num_teams, num_uids, len(metrics)), NaN where missing
+        elapsed (float): wall time in seconds (including the model loading)
+    """
+    start = time.perf_counter()
+    scorer = get_scorer(model_name, args, loader=loader)
+    items = system_items(systems, uid_index)
+    scores = np.full((len(systems), len(uid_index), len(metrics)), np.nan)
+    chunks = range(0, len(items), args.chunk_size)
+    for i in tqdm(chunks, desc=model_name) if progress else chunks:
+        chunk = items[i : i + args.chunk_size]
+        batch_scores = scorer.score_batch([pair for _, _, pair in chunk])
+        for (t, u, _), score in zip(chunk, batch_scores):
+            scores[t, u] = [score[metric] for metric in metrics]
+    return model_name, scores, time.perf_counter() - start
+
+
+def score_systems(metrics, systems, uid_index, args, loader=load_scorer):
+    """Score the samples of all systems with all metrics.
+
+    The metrics are grouped by model, and each model is loaded exactly once:
+    with `args.nj > 1`, the models are scored in parallel, each in a single
+    task of a worker process.
+
+    Returns:
+        scores (np.ndarray): (num_teams, num_uids, len(metrics)), NaN where missing
+    """
+    # group the metrics by model, so that each model is loaded only once
+    model_metrics = {}
+    for metric in metrics:
+        model_metrics.setdefault(METRIC_TO_MODEL[metric], []).append(metric)
+    print(
+        f"Scoring {len(systems)} systems x {len(uid_index)} samples with "
+        f"{', '.join(model_metrics.keys())} ({args.nj} workers)",
+        flush=True,
+    )
+
+    cube = np.full((len(systems), len(uid_index), len(metrics)), np.nan)
+    metric_index = {metric: i for i, metric in enumerate(metrics)}
+
+    def collect(name, scores, elapsed):
+        for j, metric in enumerate(model_metrics[name]):
+            cube[:, :, metric_index[metric]] = scores[:, :, j]
+        print(f"Finished {name} in {elapsed:.1f}s", flush=True)
+
+    if args.nj == 1:
+        for name, names in model_metrics.items():
+            collect(*score_model(name, names, systems, uid_index, args, loader))
+    else:
+        # "spawn" avoids inheriting the state of torch / CUDA in the workers
+        with ProcessPoolExecutor(
+            max_workers=min(args.nj, len(model_metrics)),
+            mp_context=mp.get_context("spawn"),
+        ) as executor:
+            futures = [
+                executor.submit(
+                    score_model, name, names, systems, uid_index, args, loader, False
+                )
+                for name, names in model_metrics.items()
+            ]
+            for future in tqdm(as_completed(futures), total=len(futures), unit="model"):
+                collect(*future.result())
+    return cube
+
+
+################################################################
+# Main entry
+################################################################
+def main(args):
+    systems = read_team_manifest(args.manifest)
+    uid_index = build_uid_index(systems)
+    teams = list(systems.keys())
+    for team, data_pairs in systems.items():
+        if len(data_pairs) != len(uid_index):
+            print(
+                f"[Warning] {team} has {len(data_pairs)}/{len(uid_index)} samples; "
+                "the missing ones are set to NaN",
+                flush=True,
+            )
+
+    cube = score_systems(args.metrics, systems, uid_index, args)
+
+    outdir = Path(args.output_dir)
+    outdir.mkdir(parents=True, exist_ok=True)
+    np.save(outdir / "scores.npy", cube.astype(np.float32))
+    for name, values in (
+        ("teams", teams),
+        ("uids", uid_index.keys()),
+        ("metrics", args.metrics),
+    ):
+        with (outdir / f"{name}.txt").open("w") as f:
+            for value in values:
+                f.write(f"{value}\n")
+
+    with (outdir / "RESULTS.txt").open("w") as f:
+        f.write("\t".join(["team"] + list(args.metrics)) + "\n")
+        for t, team in enumerate(teams):
+            means = np.nanmean(cube[t], axis=0)
+            f.write("\t".join([team] + [f"{v:.4f}" for v in means]) + "\n")
+    print(
+        f"Scores {cube.shape} (team x uid x metric) have been written in "
+        f"{outdir / 'scores.npy'}, and the mean scores in {outdir / 'RESULTS.txt'}",
+        flush=True,
+    )
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Score the enhanced samples of several systems with several "
+        "metrics, and save all scores in a single (team x uid x metric) array"
+    )
+    parser.add_argument(
+        "--manifest",
+        type=str,
+        required=True,
+        help="Path to the manifest of systems, containing one "
+        "'<team> <path to the scp file of enhanced signals>' per line",
+    )
+    parser.add_argument(
+        "--output_dir",
+        type=str,
+        required=True,
+        help="Path to the output directory for writing scores.npy, teams.txt, "
+        "uids.txt, metrics.txt and RESULTS.txt",
+    )
+    parser.add_argument(
+        "--metrics",
+        type=str,
+        nargs="+",
+        default=["DNSMOSPro", "VQscore", "SCOREQ", "UTMOS", "WADASNR"],
+        choices=METRICS,
+        help="Metrics to be calculated",
+    )
+    parser.add_argument(
+        "--device",
+        type=str,
+        default="cpu",
+        help="Device for running the models",
+    )
+    parser.add_argument(
+        "--nj",
+        type=int,
+        default=1,
+        help="Number of worker processes. The models are scored in parallel, "
+        "each by a single worker so that it is loaded only once (so at most one "
+        "worker per model is used).",
+    )
+    parser.add_argument(
+        "--num_threads",
+        type=int,
+        default=None,
+        help="Number of threads used by torch in each worker (default: torch's "
+        "default)",
+    )
+    parser.add_argument(
+        "--chunk_size",
+        type=int,
+        default=64,
+        help="Number of samples passed to a model at a time",
+    )
+    add_model_arguments(parser)
+    args = parser.parse_args()
+
+    main(args)
@@ -0,0 +1,127 @@
+"""Reading scp files and audio manifests.
+
+A manifest (built by `build_manifest.py`) is a TSV file with a header line and
+the audio header information of each sample:
+
+    uid  path  sample_rate  channels  frames  duration
+
+All entry points accept either an scp file (`--inf_scp`) or a manifest
+(`--manifest`), and `load_data_pairs` auto-detects the format of a file.
+"""
+import csv
+from pathlib import Path
+
+
+MANIFEST_FIELDS = ("uid", "path", "sample_rate", "channels", "frames", "duration")
+
+
+def read_scp(scp_path):
+    """Read an scp file with one "<uid> <path>" per line.
+
+    The uid and the path are separated by the first run of whitespace, and the
+    path is the rest of the line, so it may contain spaces (trailing ones are
+    kept, but leading ones are part of the separator).
+
+    Returns:
+        data_pairs (list): list of (uid, path)
+    """
+    data_pairs = []
+    uid_lines = {}
+    with open(scp_path, "r") as f:
+        for lineno, line in enumerate(f, 1):
+            # only the line break is removed (also of CRLF files)
+            line = line.rstrip("\r\n")
+            if not line.strip():
+                continue
+            fields = line.split(maxsplit=1)
+            if len(fields) != 2:
+                raise ValueError(
+                    f"{scp_path}:{lineno}: expected '<uid> <path>', got {line!r}"
+                )
+            uid, audio_path = fields
+            if uid in uid_lines:
+                raise ValueError(
+                    f"{scp_path}:{lineno}: duplicate uid {uid!r} (first on line "
+                    f"{uid_lines[uid]})"
+                )
+            uid_lines[uid] = lineno
+            data_pairs.append((uid, audio_path))
+    return data_pairs
+
+
+def is_manifest(path):
+    with open(path, "r") as f:
+        return f.readline().rstrip("\n").split("\t") == list(MANIFEST_FIELDS)
+
+
+def read_manifest(manifest_path):
+    """Read a manifest written by `write_manifest`.
+
+    Returns:
+        rows (list): list of dicts with the keys in MANIFEST_FIELDS
+    """
+    rows = []
+    with open(manifest_path, "r", newline="") as f:
+        reader = csv.DictReader(f, delimiter="\t", quoting=csv.QUOTE_NONE)
+        assert tuple(reader.fieldnames) == MANIFEST_FIELDS, reader.fieldnames
+        for row in reader:
+            row["sample_rate"] = int(row["sample_rate"])
+            row["channels"] = int(row["channels"])
+            row["frames"] = int(row["frames"])
+            row["duration"] = float(row["duration"])
+            rows.append(row)
+    return rows
+
+
+def unsafe_manifest_fields(row):
+    """Fields of a manifest row that cannot be written in the TSV format.
+
+    Tabs and line breaks are not escaped in the manifest (it is read with
+    `csv.QUOTE_NONE`), so uids or paths containing them would corrupt it.
+    """
+    return [k for k in MANIFEST_FIELDS if any(c in str(row[k]) for c in "\t\r\n")]
+
+
+def write_manifest(rows, manifest_path):
+    for row in rows:
+        unsafe = unsafe_manifest_fields(row)
+        if unsafe:
+            raise ValueError(
+                f"Tab or line break in the {', '.join(unsafe)} of {row['uid']!r}"
+            )
+    Path(manifest_path).parent.mkdir(parents=True, exist_ok=True)
+    with open(manifest_path, "w") as f:
+        f.write("\t".join(MANIFEST_FIELDS) + "\n")
+        for row in rows:
+            f.write("\t".join(str(row[k]) for k in MANIFEST_FIELDS) + "\n")
+
+
+def load_data_pairs(path):
+    """Read (uid, path) pairs from either an scp file or a manifest."""
+    if is_manifest(path):
+        return [(row["uid"], row["path"]) for row in read_manifest(path)]
+    return read_scp(path)
+
+
+def get_data_pairs(args):
+    """Read the (uid, path) pairs given by `--inf_scp` or `--manifest`."""
+    return load_data_pairs(args.inf_scp if args.manifest is None else args.manifest)
+
+
+def add_input_arguments(parser):
+    """Add the mutually exclusive `--inf_scp` and `--manifest` options."""
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument(
+        "--inf_scp",
+        type=str,
+        default=None,
+        help="Path to the scp file containing enhanced signals",
+    )
+    group.add_argument(
+        "--manifest",
+        type=str,
+        default=None,
+        help="Path to the manifest of enhanced signals built by build_manifest.py "
+        "(instead of --inf_scp)",
+    )
+    return group
@@ -0,0 +1,246 @@
+"""Loading models once and scoring lists of (uid, path) pairs for each metric.
+
+This is shared by the tools that keep several metric models in one process
+(e.g. `scoring_server.py`). The scoring itself is delegated to the
+`process_one_pair` function of the corresponding `calculate_*.py` script, whose
+module (and thus third-party dependencies) is only imported when selected.
+"""
+import math
+import sys
+import warnings
+from functools import partial
+from pathlib import Path
+
+from batching import add_batching_check_arguments, check_batching
+
+
+WADA_SNR_DIR = Path(__file__).resolve().parent.parent / "wada_snr"
+
+# metric -> name of the model (group) that computes it
+METRIC_TO_MODEL = {
+    "DNSMOSPro": "DNSMOSPro",
+    "VQscore": "VQscore",
+    "SCOREQ": "SCOREQ",
+    "UTMOS": "UTMOS",
+    "UTMOSv2": "UTMOSv2",
+    "WV_MOS": "WV_MOS",
+    "WADASNR": "WADASNR",
+}
+METRICS = tuple(METRIC_TO_MODEL.keys())
+
+
+class Scorer:
+    """A loaded model that scores batches of (uid, path) pairs.
+
+    Args:
+        metrics (tuple): names of the metrics produced by this scorer
+        process_fn (Callable): process_fn(data_pair) -> (uid, {metric: value})
+        batch_fn (Callable): batch_fn(data_pairs) -> [{metric: value}, ...]
+            (optional, falls back to calling `process_fn` on each pair)
+    """
+
+    def __init__(self, metrics, process_fn, batch_fn=None):
+        self.metrics = tuple(metrics)
+        self.process_fn = process_fn
+        self.batch_fn = batch_fn
+
+    def score_batch(self, data_pairs):
+        if self.batch_fn is not None:
+            scores = self.batch_fn(data_pairs)
+        else:
+            scores = [self.process_fn(pair)[1] for pair in data_pairs]
+        # e.g. WADA-SNR returns None when it cannot estimate the SNR
+        return [
+            {k: math.nan if v is None else float(v) for k, v in score.items()}
+            for score in scores
+        ]
+
+
+def checked_batch_fn(process_fn, process_batch, args):
+    """Batch function of a Scorer, checked against `process_fn` on its first call.
+
+    As in the scripts, the first `args.batch_check_num` samples of the first
+    batch are scored both without and with batching (see `check_batching`).
+
+    Args:
+        process_fn (Callable): process_fn(data_pair) -> (uid, {metric: value})
+        process_batch (Callable): process_batch(data_pairs) -> list of
+            (uid, {metric: value})
+        args (argparse.Namespace): parsed arguments (see `add_model_arguments`)
+    Returns:
+        batch_fn (Callable): batch_fn(data_pairs) -> [{metric: value}, ...]
+    """
+    checked = args.batch_check_num <= 0
+
+    def batch_fn(data_pairs):
+        nonlocal checked
+        if not checked:
+            checked = True
+            check_batching(
+                lambda pair: process_fn(pair)[1],
+                process_batch,
+                data_pairs,
+                num_samples=args.batch_check_num,
+                max_abs_dev=args.batch_max_dev,
+                on_fail=args.batch_on_fail,
+            )
+        return [score for _, score in process_batch(data_pairs)]
+
+    return batch_fn
+
+
+def load_scorer(model_name, args):
+    """Load the model `model_name` (see METRIC_TO_MODEL) with the options in `args`.
+
+    Args:
+        model_name (str): name of the model
+        args (argparse.Namespace): parsed arguments (see `add_model_arguments`)
+    Returns:
+        scorer (Scorer)
+    """
+    if model_name == "DNSMOSPro":
+        import torch
+
+        import calculate_nonintrusive_dnsmos_pro as m
+
+        model = torch.jit.load(
+            args.dnsmos_pro_model, map_location=torch.device(args.device)
+        ).eval()
+        return Scorer(
+            m.METRICS, partial(m.process_one_pair, model=model, device=args.device)
+        )
+    elif model_name == "VQscore":
+        import calculate_nonintrusive_vqscore as m
+
+        model = m.load_model(args.vqscore_conf, args.vqscore_model, device=args.device)
+        return Scorer(
+            m.METRICS, partial(m.process_one_pair, model=model, device=args.device)
+        )
+    elif model_name == "SCOREQ":
+        import calculate_nonintrusive_scoreq as m
+
+        # only the no-reference mode, as there are no reference signals here
+        model = m.scoreq.Scoreq(
+            device=args.device, data_domain=args.scoreq_data_domain, mode="nr"
+        )
+        process_fn = partial(m.process_one_pair, model=model)
+        batch_fn = None
+        if args.batch_size > 1:
+            supported, reason = m.supports_batching(model)
+            if supported:
+                batch_fn = checked_batch_fn(
+                    process_fn,
+                    partial(
+                        m.process_batch,
+                        model=model,
+                        batch_size=args.batch_size,
+                        max_pad_ratio=args.max_pad_ratio,
+                    ),
+                    args,
+                )
+            else:
+                warnings.warn(
+                    f"The batched SCOREQ path is not supported ({reason}); "
+                    "--batch_size is ignored and each file is scored with "
+                    "Scoreq.predict"
+                )
+        return Scorer(m.METRICS, process_fn, batch_fn=batch_fn)
+    elif model_name in ("UTMOS", "UTMOSv2", "WV_MOS"):
+        import calculate_nonintrusive_mos as m
+
+        models = m.load_models([model_name], args)
+        process_fn = partial(
+            m.process_one_pair,
+            metrics=(model_name,),
+            device=args.device,
+            **models,
+        )
+        batch_fn = None
+        if args.batch_size > 1:
+            batch_fn = checked_batch_fn(
+                process_fn,
+                partial(
+                    m.process_batch,
+                    metrics=(model_name,),
+                    device=args.device,
+                    batch_size=args.batch_size,
+                    max_pad_ratio=args.max_pad_ratio,
+                    **models,
+                ),
+                args,
+            )
+        return Scorer((model_name,), process_fn, batch_fn=batch_fn)
+    elif model_name == "WADASNR":
+        sys.path.append(str(WADA_SNR_DIR))
+        import calculate_wada_snr as m
+
+        return Scorer(m.METRICS, m.process_one_pair)
+    else:
+        raise NotImplementedError(model_name)
+
+
+def load_scorers(metrics, args):
+    """Load each model needed for `metrics` once.
+
+    Returns:
+        scorers (dict): {model_name: Scorer}
+    """
+    scorers = {}
+    for metric in metrics:
+        model_name = METRIC_TO_MODEL[metric]
+        if model_name not in scorers:
+            scorers[model_name] = load_scorer(model_name, args)
+    return scorers
+
+
+def add_model_arguments(parser):
+    """Add the model options of all metrics (same defaults as the scripts)."""
+    group = parser.add_argument_group("Model related")
+    group.add_argument(
+        "--dnsmos_pro_model",
+        type=str,
+        default="DNSMOSPro/runs/NISQA/model_best.pt",
+        help="Path to the pretrained DNSMOS Pro model.",
+    )
+    group.add_argument(
+        "--vqscore_conf",
+        type=str,
+        default="VQscore/config/QE_cbook_size_2048_1_32_IN_input_encoder_z_"
+        "Librispeech_clean_github.yaml",
+        help="Path to the VQscore model configuration.",
+    )
+    group.add_argument(
+        "--vqscore_model",
+        type=str,
+        default="VQscore/exp/QE_cbook_size_2048_1_32_IN_input_encoder_z_"
+        "Librispeech_clean_github/checkpoint-dnsmos_ovr_CC=0.835.pkl",
+        help="Path to the pretrained VQscore model.",
+    )
+    group.add_argument(
+        "--utmos_tag",
+        type=str,
+        default="utmos22_strong",
+        help="Tag of the UTMOS model to be used",
+    )
+    group.add_argument(
+        "--scoreq_data_domain",
+        type=str,
+        default="natural",
+        choices=("natural", "synthetic"),
+        help="Domain of the SCOREQ model (only the no-reference mode is available)",
+    )
+    group.add_argument(
+        "--batch_size",
+        type=int,
+        default=1,
+        help="Number of samples in each model forward, for the metrics that "
+        "support batched inference (SCOREQ, UTMOS, UTMOSv2, WV-MOS)",
+    )
+    group.add_argument(
+        "--max_pad_ratio",
+        type=float,
+        default=0.05,
+        help="Maximum ratio of zero-padding allowed for any sample in a batch",
+    )
+    add_batching_check_arguments(parser)
+    return group
@@ -0,0 +1,264 @@
+import contextlib
+import copy
+import json
+import warnings
+
+import numpy as np
+import torch
+
+
+PRECISIONS = ("fp32", "int8", "bf16")
+
+
+################################################################
+# Reduced-precision inference
+################################################################
+def reduce_precision(model, precision, device="cpu"):
+    """Return a copy of `model` prepared for the given inference precision.
+
+    Args:
+        model (torch.nn.Module): fp32 model (left untouched); other objects are
+            returned as they are
+        precision (str): one of PRECISIONS
+        device (str): device on which the model runs
+    Returns:
+        model (torch.nn.Module): model to be used for inference
+    """
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unsupported precision: {precision}")
+    if precision != "int8":
+        # bf16 only changes the autocast context (see `precision_context`)
+        return model
+
+    if not str(device).startswith("cpu"):
+        raise ValueError("int8 dynamic quantization only runs on CPU")
+    if not isinstance(model, torch.nn.Module):
+        # e.g. a wrapper object that only runs the network inside its methods
+        warnings.warn(
+            f"{type(model).__name__} is not a torch.nn.Module, int8 dynamic "
+            "quantization is skipped and it runs in fp32"
+        )
+        return model
+    if isinstance(model, torch.jit.ScriptModule):
+        raise ValueError(
+            "int8 dynamic quantization is not supported for TorchScript models, "
+            "please use '--precision bf16' instead"
+        )
+    # Only nn.Linear (and RNN) layers have dynamically quantized kernels in PyTorch;
+    # convolutions keep running in fp32.
+    qmodel = torch.ao.quantization.quantize_dynamic(
+        copy.deepcopy(model), {torch.nn.Linear}, dtype=torch.qint8
+    )
+    num_quantized = sum(
+        1
+        for m in qmodel.modules()
+        if isinstance(m, torch.ao.nn.quantized.dynamic.Linear)
+    )
+    if num_quantized == 0:
+        warnings.warn(
+            f"No quantizable layers were found in {type(model).__name__}, "
+            "int8 inference will be identical to fp32"
+        )
+    return qmodel
+
+
+def precision_context(precision, device="cpu"):
+    """Context manager for running inference in the given precision."""
+    if precision == "bf16":
+        device_type = "cuda" if str(device).startswith("cuda") else "cpu"
+        return torch.autocast(device_type=device_type, dtype=torch.bfloat16)
+    return contextlib.nullcontext()
+
+
+################################################################
+# Accuracy guardrails
+################################################################
+def rankdata(x):
+    """Rank the values in `x` (starting from 1), averaging the ranks of ties."""
+    x = np.asarray(x)
+    order = np.argsort(x, kind="mergesort")
+    ranks = np.empty(len(x), dtype=np.float64)
+    ranks[order] = np.arange(1, len(x) + 1)
+    _, inv, counts = np.unique(x, return_inverse=True, return_counts=True)
+    sums = np.bincount(inv, weights=ranks)
+    return sums[inv] / counts[inv]
+
+
+def spearman_correlation(x, y):
+    x, y = np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)
+    if len(x) < 2:
+        return float("nan")
+    rx, ry = rankdata(x), rankdata(y)
+    rx -= rx.mean()
+    ry -= ry.mean()
+    denom = np.sqrt(np.sum(rx**2) * np.sum(ry**2))
+    return float(np.sum(rx * ry) / denom) if denom > 0 else float("nan")
+
+
+def compare_scores(ref_scores, test_scores):
+    """Compare per-utterance scores computed in fp32 and in reduced precision.
+
+    Args:
+        ref_scores (list): list of {metric: value} dicts obtained in fp32
+        test_scores (list): list of {metric: value} dicts in reduced precision
+    Returns:
+        report (dict): {metric: {"max_abs_dev", "mean_abs_dev", "srcc", "num"}}
+    """
+    report = {}
+    for metric in ref_scores[0].keys():
+        ref = np.array([float(s[metric]) for s in ref_scores])
+        test = np.array([float(s[metric]) for s in test_scores])
+        valid = ~(np.isnan(ref) | np.isnan(test))
+        dev = np.abs(ref[valid] - test[valid])
+        report[metric] = {
+            "num": int(valid.sum()),
+            "max_abs_dev": float(dev.max()) if len(dev) else float("nan"),
+            "mean_abs_dev": float(dev.mean()) if len(dev) else float("nan"),
+            "srcc": spearman_correlation(ref[valid], test[valid]),
+        }
+    return report
+
+
+def check_precision(
+    score_fn,
+    data_pairs,
+    precision,
+    num_samples=16,
+    max_abs_dev=0.1,
+    on_fail="warn",
+    report_path=None,
+):
+    """Score a reference subset in fp32 and in reduced precision and compare them.
+
+    Args:
+        score_fn (Callable): score_fn(data_pair, reduced: bool) -> {metric: value}
+        data_pairs (list): list of (uid, path) pairs, the first `num_samples`
+            of which are used as the reference subset
+        precision (str): reduced precision being checked
+        num_samples (int): number of reference samples
+        max_abs_dev (float): maximum tolerated absolute deviation of any score
+        on_fail (str): "warn" or "error" when the deviation exceeds `max_abs_dev`
+        report_path (str): path for writing the calibration report (optional)
+    Returns:
+        report (dict): see `compare_scores`
+    """
+    subset = data_pairs[:num_samples]
+    if not subset:
+        print(f"[{precision} vs fp32] No sample to check", flush=True)
+        return {}
+    ref_scores = [score_fn(pair, False) for pair in subset]
+    test_scores = [score_fn(pair, True) for pair in subset]
+    report = compare_scores(ref_scores, test_scores)
+    if report_path is not None:
+        with open(report_path, "w") as f:
+            json.dump({"precision": precision, "metrics": report}, f, indent=2)
+    report_deviation(
+        report,
+        f"{precision} vs fp32",
+        max_abs_dev=max_abs_dev,
+        on_fail=on_fail,
+        hint="use '--precision fp32' instead",
+    )
+    return report
+
+
+def report_deviation(report, label, max_abs_dev=0.1, on_fail="warn", hint=None):
+    """Print a `compare_scores` report, and warn or abort on large deviations.
+
+    Args:
+        report (dict): see `compare_scores`
+        label (str): what is compared (e.g. "bf16 vs fp32")
+        max_abs_dev (float): maximum tolerated absolute deviation of any score
+        on_fail (str): "warn" or "error" when the deviation exceeds `max_abs_dev`
+        hint (str): suggestion appended to the error message (optional)
+    """
+    failed = []
+    for metric, stats in report.items():
+        print(
+            f"[{label}] {metric}: "
+            f"max_abs_dev={stats['max_abs_dev']:.4f}, "
+            f"mean_abs_dev={stats['mean_abs_dev']:.4f}, "
+            f"SRCC={stats['srcc']:.4f} (n={stats['num']})",
+            flush=True,
+        )
+        if not stats["max_abs_dev"] <= max_abs_dev:
+            failed.append(metric)
+    if failed:
+        msg = (
+            f"[{label}] the scores deviate by more than {max_abs_dev} "
+            f"for {', '.join(failed)}"
+        )
+        if on_fail == "error":
+            raise RuntimeError(msg + (f" ({hint})" if hint else ""))
+        warnings.warn(msg)
+
+
+def prepare_precision(models, process_fn, data_pairs, args, report_path=None):
+    """Prepare the models for `args.precision` and check the deviation from fp32.
+
+    Args:
+        models (dict): {name: torch.nn.Module} fp32 models
+        process_fn (Callable): process_fn(data_pair, models) -> {metric: value}
+        data_pairs (list): list of (uid, path) pairs to be scored (the samples
+            already scored by a resumed run are not scored again for the check)
+        args (argparse.Namespace): parsed arguments (see `add_precision_arguments`)
+        report_path (str): path for writing the calibration report (optional)
+    Returns:
+        models (dict): {name: torch.nn.Module} models to be used for inference
+    """
+    if args.precision == "fp32":
+        return models
+    reduced = {
+        name: reduce_precision(model, args.precision, device=args.device)
+        for name, model in models.items()
+    }
+
+    def score_fn(data_pair, use_reduced):
+        if use_reduced:
+            with precision_context(args.precision, args.device):
+                return process_fn(data_pair, reduced)
+        return process_fn(data_pair, models)
+
+    check_precision(
+        score_fn,
+        data_pairs,
+        args.precision,
+        num_samples=args.precision_calib_num,
+        max_abs_dev=args.precision_max_dev,
+        on_fail=args.precision_on_fail,
+        report_path=report_path,
+    )
+    return reduced
+
+
+def add_precision_arguments(parser):
+    group = parser.add_argument_group("Inference precision related")
+    group.add_argument(
+        "--precision",
+        type=str,
+        default="fp32",
+        choices=PRECISIONS,
+        help="Inference precision. 'int8' applies dynamic quantization to Linear "
+        "layers (CPU only), 'bf16' enables autocast",
+    )
+    group.add_argument(
+        "--precision_calib_num",
+        type=int,
+        default=16,
+        help="Number of samples scored in both fp32 and reduced precision for "
+        "checking the deviation",
+    )
+    group.add_argument(
+        "--precision_max_dev",
+        type=float,
+        default=0.1,
+        help="Maximum tolerated absolute deviation from the fp32 scores",
+    )
+    group.add_argument(
+        "--precision_on_fail",
+        type=str,
+        default="warn",
+        choices=("warn", "error"),
+        help="Whether to warn or abort if the deviation exceeds the threshold",
+    )
+    return group
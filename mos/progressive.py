@@ -0,0 +1,411 @@
+"""Progressive (sampled) evaluation with early stopping, and resuming.
+
+In the progressive mode, the samples are scored in a seeded random order,
+optionally stratified by duration or by uid prefix (e.g. the dataset), and the
+corpus-level mean of each metric is estimated along with a confidence interval.
+Scoring stops once the half-width of the interval is below `--tolerance` for
+all metrics, or once the budget (number of samples or time) is exhausted.
+
+Stratified sampling visits the strata proportionally to their sizes, and the
+mean is estimated as sum_h W_h * mean_h, where W_h is the share of stratum h
+(of size N_h, with n_h samples scored so far), and
+
+
+    Var = sum_h W_h^2 * (1 - n_h / N_h) * s_h^2 / n_h
+
+(the finite population correction makes the interval vanish once all samples
+are scored).
+
+With `--resume true`, the samples already in the output scp files are not
+scored again and new scores are appended, so that a partial (e.g. progressive)
+run can be resumed into a full run. In the progressive mode, the resumed samples
+that are not a prefix of the (seeded) order, e.g. the first samples of an
+interrupted non-progressive run, are not a random sample of their stratum; they
+are put in separate, fully scored strata so that the estimate stays unbiased.
+"""
+import json
+import math
+import os
+import random
+import time
+from pathlib import Path
+from statistics import NormalDist
+
+import numpy as np
+import soundfile as sf
+from tqdm.contrib.concurrent import thread_map
+
+from manifest import is_manifest, read_manifest
+from stage_profiler import str2bool
+
+
+def read_scored(outdir, metrics, suffix=""):
+    """Read the scores in existing `{metric}{suffix}.scp` files.
+
+    Only the samples with a (complete) line in the files of all metrics count,
+    and the files are rewritten without the other lines, so that new scores can
+    be appended. If none of the files exists, nothing is scored yet; if only
+    some of them exist (e.g. a metric was added), no file is modified and a
+    FileNotFoundError is raised.
+
+    Returns:
+        scored (dict): {uid: {metric: value}}
+    """
+    paths = {metric: Path(outdir) / f"{metric}{suffix}.scp" for metric in metrics}
+    missing = [metric for metric, path in paths.items() if not path.exists()]
+    if len(missing) == len(paths):
+        return {}
+    if missing:
+        raise FileNotFoundError(
+            f"Cannot resume: {', '.join(str(paths[m]) for m in missing)} not found "
+            "while the files of the other metrics exist. Resume with the metrics "
+            "of the previous run, or remove its output files to start over."
+        )
+    values = {}
+    for metric, path in paths.items():
+        values[metric] = {}
+        with path.open("r") as f:
+            for line in f:
+                # the last line may be truncated if the previous run was killed
+                if not line.endswith("\n") or len(line.split()) != 2:
+                    continue
+                uid, value = line.split()
+                values[metric][uid] = value
+    uids = set.intersection(*(set(v.keys()) for v in values.values()))
+    scored = {}
+    for metric, path in paths.items():
+        tmp_path = path.with_name(f".{path.name}.tmp")
+        with tmp_path.open("w") as f:
+            for uid, value in values[metric].items():
+                if uid in uids:
+                    f.write(f"{uid} {value}\n")
+                    # the scripts write None for samples that cannot be scored
+                    value = math.nan if value == "None" else float(value)
+                    scored.setdefault(uid, {})[metric] = value
+        os.replace(tmp_path, path)
+    return scored
+
+
+def assign_strata(data_pairs, args):
+    """Stratum of each sample according to `--stratify`.
+
+    Returns:
+        strata (list): stratum name of each pair in `data_pairs`
+    """
+    if args.stratify == "none":
+        return ["all"] * len(data_pairs)
+    if args.stratify == "prefix":
+        return [uid.split(args.prefix_delimiter, 1)[0] for uid, _ in data_pairs]
+    # "duration": quantile bins of the durations
+    if args.manifest is not None and is_manifest(args.manifest):
+        durations = {r["uid"]: r["duration"] for r in read_manifest(args.manifest)}
+        durations = [durations[uid] for uid, _ in data_pairs]
+    else:
+        durations = thread_map(
+            lambda pair: sf.info(pair[1]).duration,
+            data_pairs,
+            max_workers=16,
+            desc="Reading durations",
+        )
+    edges = np.quantile(durations, np.linspace(0, 1, args.num_strata + 1)[1:-1])
+    # many samples of the same duration give equal quantiles (i.e. empty strata)
+    edges = np.unique(edges)
+    bins = np.searchsorted(edges, durations, side="right")
+    bounds = [""] + [f"{e:.2f}s" for e in edges] + [""]
+    names = [f"[{lo}, {hi})" for lo, hi in zip(bounds[:-1], bounds[1:])]
+    return [names[b] for b in bins]
+
+
+def progressive_order(indices, strata, seed=0):
+    """Seeded random order in which each prefix covers the strata proportionally.
+
+    The samples of each stratum are shuffled, and the j-th sample of a stratum
+    of size n is placed at the position (j + 0.5) / n.
+    """
+    rng = random.Random(seed)
+    groups = {}
+    for i in indices:
+        groups.setdefault(strata[i], []).append(i)
+    keys = []
+    for h, (_, members) in enumerate(sorted(groups.items())):
+        rng.shuffle(members)
+        for j, i in enumerate(members):
+            keys.append(((j + 0.5) / len(members), h, i))
+    return [i for _, _, i in sorted(keys)]
+
+
+class _Stratum:
+    __slots__ = ("size", "visited", "n", "mean", "m2")
+
+    def __init__(self, size):
+        self.size = size
+        self.visited = 0  # scored samples, including NaN scores
+        self.n = 0  # non-NaN scores
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, x):
+        self.visited += 1
+        if x is None or math.isnan(x):
+            return
+        # Welford's online update
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (x - self.mean)
+
+
+class ProgressiveEvaluation:
+    """Order of the samples, resumed scores and early stopping of one job.
+
+    Args:
+        args (argparse.Namespace): see `add_progressive_arguments`
+        data_pairs (list): (uid, path) pairs of this job
+        metrics (list): names of the metrics
+        outdir (Path): output directory (for resuming)
+        suffix (str): suffix of the output files of this job
+    """
+
+    def __init__(self, args, data_pairs, metrics, outdir, suffix=""):
+        self.enabled = args.progressive
+        self.metrics = list(metrics)
+        self.tolerance = args.tolerance
+        self.z = NormalDist().inv_cdf(0.5 + args.confidence / 2)
+        self.confidence = args.confidence
+        self.min_samples = args.min_samples
+        self.budget_samples = args.budget_samples
+        self.budget_seconds = args.budget_seconds
+        self.stratify = args.stratify
+        self.start_time = time.perf_counter()
+        self.num_new = 0
+        self.num_total = len(data_pairs)
+        self.stop_reason = None
+
+        # samples scored by a previous run
+        self.scored = []
+        if args.resume:
+            previous = read_scored(outdir, self.metrics, suffix)
+            self.scored = [
+                (uid, previous[uid]) for uid, _ in data_pairs if uid in previous
+            ]
+            print(
+                f"Resuming: {len(self.scored)}/{len(data_pairs)} samples are "
+                "already scored",
+                flush=True,
+            )
+        self.writer_mode = "a" if args.resume else "w"
+        done = {uid for uid, _ in self.scored}
+        pending = [i for i, (uid, _) in enumerate(data_pairs) if uid not in done]
+
+        self.strata = {}
+        if self.enabled:
+            names = assign_strata(data_pairs, args)
+            # the order of all samples, so that the samples scored by a previous
+            # progressive run (with the same seed) are a prefix of it
+            order = progressive_order(range(len(data_pairs)), names, seed=args.seed)
+            num_prefix = 0
+            while num_prefix < len(order) and data_pairs[order[num_prefix]][0] in done:
+                num_prefix += 1
+            census = done & {data_pairs[i][0] for i in order[num_prefix:]}
+            if census:
+                print(
+                    f"[Warning] {len(census)} resumed samples are not in the "
+                    "progressive order (e.g. scored by a non-progressive run); they "
+                    "form separate fully scored strata in the estimate",
+                    flush=True,
+                )
+                names = [
+                    f"{h} (resumed)" if uid in census else h
+                    for (uid, _), h in zip(data_pairs, names)
+                ]
+            self.uid_stratum = {uid: h for (uid, _), h in zip(data_pairs, names)}
+            sizes = {}
+            for h in names:
+                sizes[h] = sizes.get(h, 0) + 1
+            self.strata = {
+                metric: {h: _Stratum(n) for h, n in sizes.items()}
+                for metric in self.metrics
+            }
+            pending = [i for i in order if data_pairs[i][0] not in done]
+            for uid, score in self.scored:
+                self.add(uid, score)
+        self.pending = [data_pairs[i] for i in pending]
+
+    def add(self, uid, score):
+        h = self.uid_stratum[uid]
+        for metric in self.metrics:
+            # NaN scores are excluded, as in the (nan)mean of RESULTS.txt
+            self.strata[metric][h].add(score[metric])
+
+    def estimate(self, metric):
+        """Stratified estimate of the mean of `metric` and its standard error.
+
+        Returns:
+            mean (float): NaN if no sample has been scored
+            std_error (float): NaN if the variance of a stratum is unknown
+        """
+        # the weight of each stratum is its (estimated) number of non-NaN scores,
+        # so that the estimate equals the nanmean once all samples are scored
+        weights = {
+            h: s.size * s.n / s.visited
+            for h, s in self.strata[metric].items()
+            if s.n > 0
+        }
+        total = sum(weights.values())
+        if total == 0:
+            return math.nan, math.nan
+        strata = self.strata[metric]
+        mean = sum(w * strata[h].mean for h, w in weights.items()) / total
+        var = 0.0
+        for h, s in strata.items():
+            if s.visited == s.size:
+                continue  # fully scored
+            if s.n < 2:
+                return mean, math.nan
+            w = weights[h] / total
+            var += w * w * (1 - s.visited / s.size) * (s.m2 / (s.n - 1)) / s.n
+        return mean, math.sqrt(var)
+
+    def update(self, uid, score):
+        """Record a newly scored sample.
+
+        Returns:
+            stop (bool): whether scoring should stop
+        """
+        if not self.enabled:
+            return False
+        self.num_new += 1
+        self.add(uid, score)
+        if self.budget_samples is not None and self.num_new >= self.budget_samples:
+            self.stop_reason = "budget_samples"
+        elif (
+            self.budget_seconds is not None
+            and time.perf_counter() - self.start_time >= self.budget_seconds
+        ):
+            self.stop_reason = "budget_seconds"
+        elif (
+            self.tolerance is not None
+            and len(self.scored) + self.num_new >= self.min_samples
+            and all(
+                self.estimate(metric)[1] * self.z <= self.tolerance
+                for metric in self.metrics
+            )
+        ):
+            self.stop_reason = "tolerance"
+        return self.stop_reason is not None
+
+    def mean(self, metric, ret):
+        """Mean score of `metric` given all (uid, score) results of the job."""
+        if not self.enabled:
+            return np.nanmean([score[metric] for uid, score in ret])
+        return self.estimate(metric)[0]
+
+    def finish(self, outdir, suffix=""):
+        """Print and save the estimates (progressive{suffix}.json)."""
+        if not self.enabled:
+            return
+        num_scored = len(self.scored) + self.num_new
+        report = {
+            "num_scored": num_scored,
+            "num_total": self.num_total,
+            "num_new": self.num_new,
+            "stop_reason": self.stop_reason or "exhausted",
+            "confidence": self.confidence,
+            "tolerance": self.tolerance,
+            "stratify": self.stratify,
+            "metrics": {},
+            "strata": {
+                h: {"size": s.size, "scored": s.visited}
+                for h, s in self.strata[self.metrics[0]].items()
+            },
+        }
+        print(
+            f"Progressive evaluation stopped ({report['stop_reason']}) after "
+            f"{num_scored}/{self.num_total} samples:",
+            flush=True,
+        )
+        for metric in self.metrics:
+            mean, std_error = self.estimate(metric)
+            report["metrics"][metric] = {
+                "mean": mean,
+                "std_error": std_error,
+                "half_width": self.z * std_error,
+            }
+            print(
+                f"  {metric}: {mean:.4f} ± {self.z * std_error:.4f} "
+                f"({100 * self.confidence:g}% CI)",
+                flush=True,
+            )
+        with (Path(outdir) / f"progressive{suffix}.json").open("w") as f:
+            json.dump(report, f, indent=2)
+
+
+def add_progressive_arguments(parser):
+    group = parser.add_argument_group("Progressive evaluation related")
+    group.add_argument(
+        "--progressive",
+        type=str2bool,
+        default=False,
+        help="Whether to score the samples in a random order and stop once the "
+        "confidence interval of the mean of each metric is narrow enough",
+    )
+    group.add_argument(
+        "--tolerance",
+        type=float,
+        default=None,
+        help="Stop once the half-width of the confidence interval of all metrics "
+        "is below this value (default: no early stopping)",
+    )
+    group.add_argument(
+        "--confidence",
+        type=float,
+        default=0.95,
+        help="Confidence level of the interval (normal approximation)",
+    )
+    group.add_argument(
+        "--min_samples",
+        type=int,
+        default=30,
+        help="Minimum number of scored samples before stopping on --tolerance",
+    )
+    group.add_argument(
+        "--budget_samples",
+        type=int,
+        default=None,
+        help="Stop after scoring this number of new samples",
+    )
+    group.add_argument(
+        "--budget_seconds",
+        type=float,
+        default=None,
+        help="Stop after this many seconds of scoring",
+    )
+    group.add_argument(
+        "--stratify",
+        type=str,
+        default="none",
+        choices=("none", "duration", "prefix"),
+        help="Sample the strata proportionally: 'duration' (quantile bins of the "
+        "durations) or 'prefix' (part of the uid before --prefix_delimiter)",
+    )
+    group.add_argument(
+        "--num_strata",
+        type=int,
+        default=4,
+        help="Number of duration bins for --stratify duration",
+    )
+    group.add_argument(
+        "--prefix_delimiter",
+        type=str,
+        default="_",
+        help="Delimiter of the uid prefix for --stratify prefix",
+    )
+    group.add_argument("--seed", type=int, default=0, help="Random seed")
+    group.add_argument(
+        "--resume",
+        type=str2bool,
+        default=False,
+        help="Whether to keep the scores in the existing scp files of the output "
+        "directory, and only score (and append) the remaining samples",
+    )
+    return group
@@ -0,0 +1,136 @@
+import http.client
+import json
+import math
+import socket
+from pathlib import Path
+
+import numpy as np
+from tqdm import tqdm
+
+from manifest import add_input_arguments, get_data_pairs
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path, timeout=None):
+        super().__init__("localhost", timeout=timeout)
+        self.unix_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if self.timeout is not None:
+            self.sock.settimeout(self.timeout)
+        self.sock.connect(self.unix_path)
+
+
+def connect(server, timeout=None):
+    """Connect to "unix:/path/to/socket" or "host:port"."""
+    if server.startswith("unix:"):
+        return UnixHTTPConnection(server[len("unix:"):], timeout=timeout)
+    host, port = server.removeprefix("http://").rsplit(":", 1)
+    return http.client.HTTPConnection(host, int(port), timeout=timeout)
+
+
+def request(server, method, path, body=None, timeout=None):
+    conn = connect(server, timeout=timeout)
+    try:
+        payload = None if body is None else json.dumps(body)
+        headers = {} if body is None else {"Content-Type": "application/json"}
+        conn.request(method, path, body=payload, headers=headers)
+        response = conn.getresponse()
+        result = json.loads(response.read())
+    finally:
+        conn.close()
+    if response.status != 200:
+        raise RuntimeError(f"Server error ({response.status}): {result['error']}")
+    return result
+
+
+################################################################
+# Main entry
+################################################################
+def main(args):
+    data_pairs = [
+        (uid, str(Path(audio_path).resolve()))
+        for uid, audio_path in get_data_pairs(args)
+    ]
+
+    metrics = args.metrics or request(args.server, "GET", "/health")["metrics"]
+    outdir = Path(args.output_dir)
+    outdir.mkdir(parents=True, exist_ok=True)
+    writers = {metric: (outdir / f"{metric}.scp").open("w") for metric in metrics}
+
+    ret = []
+    for i in tqdm(range(0, len(data_pairs), args.request_size)):
+        chunk = data_pairs[i : i + args.request_size]
+        result = request(
+            args.server,
+            "POST",
+            "/score",
+            {"data_pairs": chunk, "metrics": metrics},
+            timeout=args.timeout,
+        )
+        scores = result["scores"]
+        for uid, error in result.get("errors", {}).items():
+            print(f"[Warning] Failed to score {uid}: {error}", flush=True)
+            scores[uid] = {metric: None for metric in metrics}
+        for uid, _ in chunk:
+            ret.append((uid, scores[uid]))
+            for metric in metrics:
+                # failed scores are written as None, as in the scripts
+                value = scores[uid][metric]
+                value = None if value is None or math.isnan(value) else value
+                writers[metric].write(f"{uid} {value}\n")
+
+    for metric in metrics:
+        writers[metric].close()
+
+    with (outdir / "RESULTS.txt").open("w") as f:
+        for metric in metrics:
+            mean_score = np.nanmean(
+                [np.nan if s[metric] is None else s[metric] for _, s in ret]
+            )
+            f.write(f"{metric}: {mean_score:.4f}\n")
+    print(f"Overall results have been written in {outdir / 'RESULTS.txt'}", flush=True)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Score samples with a running `scoring_server.py`"
+    )
+    add_input_arguments(parser)
+    parser.add_argument(
+        "--output_dir",
+        type=str,
+        required=True,
+        help="Path to the output directory for writing metrics",
+    )
+    parser.add_argument(
+        "--server",
+        type=str,
+        default="127.0.0.1:8765",
+        help="Address of the server, either 'host:port' or 'unix:/path/to/socket'",
+    )
+    parser.add_argument(
+        "--metrics",
+        type=str,
+        nargs="+",
+        default=None,
+        help="Metrics to be calculated (default: all metrics served)",
+    )
+    parser.add_argument(
+        "--request_size",
+        type=int,
+        default=64,
+        help="Number of samples sent in each request",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=None,
+        help="Timeout (in seconds) of each request",
+    )
+    args = parser.parse_args()
+
+    main(args)
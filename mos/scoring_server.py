@@ -0,0 +1,289 @@
+import json
+import os
+import queue
+import socket
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from metric_registry import METRICS, METRIC_TO_MODEL, add_model_arguments, load_scorers
+
+
+class MicroBatcher:
+    """Gather (uid, path) pairs from concurrent requests into micro-batches.
+
+    A batch is scored as soon as it contains `max_batch_size` pairs, or when the
+    oldest pair in it has waited for `max_wait` seconds.
+
+    Args:
+        scorer (metric_registry.Scorer): the loaded model
+        max_batch_size (int): maximum number of pairs in a batch
+        max_wait (float): latency budget (in seconds) for gathering a batch
+    """
+
+    def __init__(self, scorer, max_batch_size=16, max_wait=0.05):
+        self.scorer = scorer
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def submit(self, data_pair):
+        future = Future()
+        self.queue.put((data_pair, future))
+        return future
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            try:
+                scores = self.scorer.score_batch([pair for pair, _ in batch])
+            except Exception as e:
+                if len(batch) == 1:
+                    batch[0][1].set_exception(e)
+                    continue
+                # the batch may mix pairs of several requests: score them one at
+                # a time, so that only the failing pairs are reported as errors
+                for pair, future in batch:
+                    try:
+                        future.set_result(self.scorer.score_batch([pair])[0])
+                    except Exception as e:
+                        future.set_exception(e)
+                continue
+            for (_, future), score in zip(batch, scores):
+                future.set_result(score)
+
+
+def parse_score_request(body, served_metrics):
+    """Validate the body of a /score request.
+
+    Returns:
+        data_pairs (list): list of (uid, path) pairs
+        metrics (list): requested metrics
+    Raises:
+        ValueError: if the request is malformed
+    """
+    try:
+        request = json.loads(body)
+    except (UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise ValueError(f"Invalid JSON: {e}")
+    if not isinstance(request, dict) or "data_pairs" not in request:
+        raise ValueError("The request must be a JSON object with 'data_pairs'")
+    data_pairs = request["data_pairs"]
+    if not isinstance(data_pairs, list) or not all(
+        isinstance(pair, list)
+        and len(pair) == 2
+        and all(isinstance(x, str) for x in pair)
+        for pair in data_pairs
+    ):
+        raise ValueError("'data_pairs' must be a list of [uid, path] string pairs")
+    counts = Counter(uid for uid, _ in data_pairs)
+    duplicates = sorted(uid for uid, n in counts.items() if n > 1)
+    if duplicates:
+        raise ValueError(f"Duplicate uids in 'data_pairs': {duplicates}")
+    metrics = request.get("metrics") or served_metrics
+    if not isinstance(metrics, list) or not all(isinstance(m, str) for m in metrics):
+        raise ValueError("'metrics' must be a list of metric names")
+    unknown = [m for m in metrics if m not in served_metrics]
+    if unknown:
+        raise ValueError(f"Metrics not loaded by the server: {unknown}")
+    return [tuple(pair) for pair in data_pairs], metrics
+
+
+class ScoringRequestHandler(BaseHTTPRequestHandler):
+    """
+    GET  /health: {"metrics": [...], "queue": {model: num_pending_pairs}}
+    POST /score:  {"data_pairs": [[uid, path], ...], "metrics": [...] (optional)}
+               -> {"scores": {uid: {metric: value}}, "errors": {uid: message}}
+    The samples that could not be scored are only listed in "errors".
+    """
+
+    def address_string(self):
+        # client_address is empty for Unix sockets
+        return str(self.client_address[0]) if self.client_address else "unix"
+
+    def _reply(self, code, obj):
+        body = json.dumps(obj).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path != "/health":
+            return self._reply(404, {"error": f"Unknown path: {self.path}"})
+        self._reply(
+            200,
+            {
+                "metrics": self.server.metrics,
+                "queue": {
+                    name: b.queue.qsize() for name, b in self.server.batchers.items()
+                },
+            },
+        )
+
+    def do_POST(self):
+        if self.path != "/score":
+            return self._reply(404, {"error": f"Unknown path: {self.path}"})
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            data_pairs, metrics = parse_score_request(
+                self.rfile.read(length), self.server.metrics
+            )
+        except ValueError as e:
+            return self._reply(400, {"error": str(e)})
+
+        model_names = list(dict.fromkeys(METRIC_TO_MODEL[m] for m in metrics))
+        futures = [
+            (uid, self.server.batchers[name].submit((uid, path)))
+            for name in model_names
+            for uid, path in data_pairs
+        ]
+        scores = {uid: {} for uid, _ in data_pairs}
+        errors = {}
+        for uid, future in futures:
+            try:
+                result = future.result()
+            except Exception as e:
+                errors[uid] = f"{type(e).__name__}: {e}"
+                continue
+            scores[uid].update({k: v for k, v in result.items() if k in metrics})
+        for uid in errors:
+            del scores[uid]
+        self._reply(200, {"scores": scores, "errors": errors})
+
+
+class ScoringServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, batchers, metrics):
+        self.batchers = batchers
+        self.metrics = list(metrics)
+        super().__init__(address, ScoringRequestHandler)
+
+
+class UnixScoringServer(ScoringServer):
+    address_family = socket.AF_UNIX
+
+    def server_bind(self):
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+        self.socket.bind(self.server_address)
+        self.server_name = "localhost"
+        self.server_port = 0
+
+
+################################################################
+# Main entry
+################################################################
+def main(args):
+    if args.num_threads is not None:
+        import torch
+
+        torch.set_num_threads(args.num_threads)
+
+    start = time.perf_counter()
+    scorers = load_scorers(args.metrics, args)
+    batchers = {
+        name: MicroBatcher(
+            scorer, max_batch_size=args.max_batch_size, max_wait=args.max_wait_ms / 1e3
+        )
+        for name, scorer in scorers.items()
+    }
+    print(
+        f"Loaded {', '.join(scorers.keys())} in {time.perf_counter() - start:.1f}s",
+        flush=True,
+    )
+
+    if args.socket is not None:
+        server = UnixScoringServer(args.socket, batchers, args.metrics)
+        print(f"Serving on unix:{args.socket}", flush=True)
+    else:
+        server = ScoringServer((args.host, args.port), batchers, args.metrics)
+        print(f"Serving on http://{args.host}:{args.port}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if args.socket is not None and os.path.exists(args.socket):
+            os.remove(args.socket)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Keep the metric models loaded and serve scoring requests "
+        "from `scoring_client.py`"
+    )
+    parser.add_argument(
+        "--metrics",
+        type=str,
+        nargs="+",
+        default=["DNSMOSPro"],
+        choices=METRICS,
+        help="Metrics whose models are loaded and served",
+    )
+    parser.add_argument(
+        "--device",
+        type=str,
+        default="cpu",
+        help="Device for running the models",
+    )
+    parser.add_argument(
+        "--num_threads",
+        type=int,
+        default=None,
+        help="Number of threads used by torch (default: torch's default)",
+    )
+    parser.add_argument(
+        "--host",
+        type=str,
+        default="127.0.0.1",
+        help="Host to listen on (ignored if --socket is given)",
+    )
+    parser.add_argument(
+        "--port",
+        type=int,
+        default=8765,
+        help="Port to listen on (ignored if --socket is given)",
+    )
+    parser.add_argument(
+        "--socket",
+        type=str,
+        default=None,
+        help="Path to a Unix socket to listen on instead of a TCP port",
+    )
+
+    group = parser.add_argument_group("Micro-batching related")
+    group.add_argument(
+        "--max_batch_size",
+        type=int,
+        default=16,
+        help="Maximum number of samples scored in one batch",
+    )
+    group.add_argument(
+        "--max_wait_ms",
+        type=float,
+        default=50.0,
+        help="Latency budget (in milliseconds) for gathering samples into a batch",
+    )
+    add_model_arguments(parser)
+    args = parser.parse_args()
+
+    main(args)
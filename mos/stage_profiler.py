@@ -0,0 +1,164 @@
+import contextlib
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+
+
+def str2bool(value: str) -> bool:
+    val = value.lower()
+    if val in ('y', 'yes', 't', 'true', 'on', '1'):
+        return True
+    elif val in ('n', 'no', 'f', 'false', 'off', '0'):
+        return False
+    else:
+        raise ValueError("invalid truth value %r" % (val,))
+
+
+_NULL_STAGE = contextlib.nullcontext()
+
+
+class _Stage:
+    __slots__ = ("profiler", "name", "start")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter_ns()
+        self.profiler.events.append(
+            (
+                self.name,
+                self.start,
+                end - self.start,
+                os.getpid(),
+                threading.get_ident(),
+                self.profiler.uid,
+            )
+        )
+
+
+class StageProfiler:
+    """Lightweight per-stage timer.
+
+    When disabled, `stage()` returns a shared no-op context manager, so that the
+    instrumentation left in the scoring code costs a single attribute lookup.
+
+    Each event is a tuple (stage, start_ns, duration_ns, pid, tid, uid).
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.events = []
+        self.uid = None
+
+    def enable(self):
+        self.enabled = True
+
+    def stage(self, name):
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Stage(self, name)
+
+    def drain(self):
+        events, self.events = self.events, []
+        return events
+
+
+# Global profiler used by all scoring scripts (one per process)
+profiler = StageProfiler()
+
+
+################################################################
+# Reports
+################################################################
+def summarize(events):
+    """Aggregate the events into a per-stage and a per-worker breakdown table."""
+    per_stage = defaultdict(list)
+    per_worker = defaultdict(lambda: defaultdict(int))
+    for name, _, dur, pid, _, _ in events:
+        per_stage[name].append(dur)
+        per_worker[pid][name] += dur
+    grand_total = sum(sum(durs) for durs in per_stage.values()) or 1
+
+    lines = [
+        f"{'stage':<20} {'count':>8} {'total (s)':>12} {'mean (ms)':>12} "
+        f"{'max (ms)':>12} {'share':>8}"
+    ]
+    for name, durs in sorted(per_stage.items(), key=lambda x: -sum(x[1])):
+        total = sum(durs)
+        lines.append(
+            f"{name:<20} {len(durs):>8d} {total / 1e9:>12.3f} "
+            f"{total / len(durs) / 1e6:>12.3f} {max(durs) / 1e6:>12.3f} "
+            f"{100 * total / grand_total:>7.1f}%"
+        )
+
+    if len(per_worker) > 1:
+        stages = list(per_stage.keys())
+        lines.append("")
+        lines.append(
+            f"{'worker (pid)':<14} " + " ".join(f"{name:>12}" for name in stages)
+        )
+        for pid, totals in sorted(per_worker.items()):
+            lines.append(
+                f"{pid:<14d} "
+                + " ".join(f"{totals[name] / 1e9:>11.3f}s" for name in stages)
+            )
+    return "\n".join(lines)
+
+
+def write_chrome_trace(events, path):
+    """Write the events as a Chrome trace (also readable by Perfetto)."""
+    trace = [
+        {
+            "name": name,
+            "ph": "X",
+            "ts": start / 1e3,
+            "dur": dur / 1e3,
+            "pid": pid,
+            "tid": tid,
+            "args": {"uid": uid},
+        }
+        for name, start, dur, pid, tid, uid in events
+    ]
+    with open(path, "w") as f:
+        json.dump({"traceEvents": trace, "displayTimeUnit": "ms"}, f)
+
+
+def write_profile(events, outdir, suffix="", trace=False):
+    """Print and save the breakdown table (and optionally the Chrome trace)."""
+    table = summarize(events)
+    print(table, flush=True)
+    with (outdir / f"profile{suffix}.txt").open("w") as f:
+        f.write(table + "\n")
+    if trace:
+        write_chrome_trace(events, outdir / f"profile_trace{suffix}.json")
+        print(
+            f"Chrome trace has been written in {outdir / f'profile_trace{suffix}.json'}",
+            flush=True,
+        )
+
+
+def add_profiler_arguments(parser):
+    group = parser.add_argument_group("Profiling related")
+    group.add_argument(
+        "--profile",
+        type=str2bool,
+        default=False,
+        help="Whether to time each processing stage and write a breakdown table "
+        "(profile*.txt) in the output directory",
+    )
+    group.add_argument(
+        "--profile_trace",
+        type=str2bool,
+        default=False,
+        help="Whether to additionally write a Chrome trace / Perfetto JSON file "
+        "(profile_trace*.json) in the output directory",
+    )
+    return group
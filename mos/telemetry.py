@@ -0,0 +1,403 @@
+"""Machine-readable progress telemetry of long scoring runs.
+
+When enabled, each job periodically rewrites a small metrics file (atomically,
+via a temporary file and `os.replace`) in either the Prometheus textfile
+collector format (`*.prom`, e.g. for node_exporter's
+`--collector.textfile.directory`) or JSON, with:
+
+    utterances and audio seconds processed (and expected),
+    rolling throughput and ETA, queue depth (utterances not yet scored),
+    NaN / None scores per metric, the job status, and the RSS of the job's
+    process and its worker processes.
+
+`update()` only increments counters, and the file is rewritten at most every
+`interval` seconds, so that the overhead is negligible. The audio seconds are
+counted from the durations passed by the scripts (of the audio they have already
+read), or from the manifest; the audio header is only read again for the samples
+whose audio is decoded inside a library (e.g. `Scoreq.predict`), which can be
+disabled with `--telemetry_read_durations false`.
+"""
+import json
+import os
+import sys
+import time
+from collections import deque
+from pathlib import Path
+
+import soundfile as sf
+
+from manifest import is_manifest, read_manifest
+from stage_profiler import str2bool
+
+
+def _read_rss(pid):
+    """Resident set size (VmRSS) of a process in bytes, 0 if it has exited."""
+    try:
+        with open(f"/proc/{pid}/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+def _children(pid):
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children", "r") as f:
+            return [int(x) for x in f.read().split()]
+    except OSError:
+        return []
+
+
+def process_rss():
+    """RSS of the current process and its (direct) child processes.
+
+    Returns:
+        rss (dict): {pid: (role, rss in bytes)}, empty if /proc is not available
+    """
+    pid = os.getpid()
+    rss = {}
+    main_rss = _read_rss(pid)
+    if main_rss:
+        rss[pid] = ("main", main_rss)
+    for child in _children(pid):
+        child_rss = _read_rss(child)
+        if child_rss:
+            rss[child] = ("worker", child_rss)
+    return rss
+
+
+class _NullTelemetry:
+    """No-op telemetry used when `--telemetry` is disabled."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def update(self, uid, scores, duration=None):
+        pass
+
+
+NULL_TELEMETRY = _NullTelemetry()
+
+
+class Telemetry:
+    """Progress counters of one scoring job, periodically written to a file.
+
+    Use as a context manager, so that the final state (finished or failed) is
+    always written.
+
+    Args:
+        path (str): path to the output file
+        data_pairs (list): (uid, path) pairs to be processed by this job
+        fmt (str): "prom" (Prometheus textfile format) or "json"
+        interval (float): minimum interval between two writes in seconds
+        window (float): time window of the rolling throughput in seconds
+        labels (dict): labels attached to all metrics (e.g. script and job)
+        durations (dict): {uid: duration in seconds}, e.g. from the manifest
+        read_durations (bool): whether to read the duration of the other samples
+            from their audio headers, if not passed to `update` (if False, they
+            do not count in the audio seconds)
+    """
+
+    def __init__(
+        self,
+        path,
+        data_pairs,
+        fmt="prom",
+        interval=10.0,
+        window=60.0,
+        labels=None,
+        durations=None,
+        read_durations=True,
+    ):
+        assert fmt in ("prom", "json"), fmt
+        self.path = Path(path)
+        self.paths = dict(data_pairs)
+        self.fmt = fmt
+        self.interval = interval
+        self.window = window
+        self.labels = labels or {}
+        self.durations = durations or {}
+        self.read_durations = read_durations
+        self.total = len(data_pairs)
+
+        self.utterances = 0
+        self.audio_seconds = 0.0
+        self.nan_scores = {}
+        self.status = "running"
+        self.start_time = time.time()
+        self.history = deque()  # (monotonic time, utterances, audio seconds)
+        self.history.append((time.monotonic(), 0, 0.0))
+        self.next_write = 0.0
+
+    def __enter__(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.write()
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        self.status = "finished" if exc_type is None else "failed"
+        self.write()
+        return False
+
+    def duration(self, uid):
+        if uid in self.durations:
+            return self.durations[uid]
+        if not self.read_durations:
+            return 0.0
+        try:
+            return sf.info(self.paths[uid]).duration
+        except (KeyError, RuntimeError):
+            return 0.0
+
+    def update(self, uid, scores, duration=None):
+        """Record a processed utterance with its scores {metric: value}.
+
+        Args:
+            uid (str): uid of the utterance
+            scores (dict): {metric: value}
+            duration (float): duration of the utterance in seconds, if known
+                (e.g. from the audio read by the script)
+        """
+        self.utterances += 1
+        self.audio_seconds += self.duration(uid) if duration is None else duration
+        for metric, value in scores.items():
+            if value is None or value != value:
+                self.nan_scores[metric] = self.nan_scores.get(metric, 0) + 1
+        if time.monotonic() >= self.next_write:
+            self.write()
+
+    def snapshot(self):
+        now = time.monotonic()
+        self.history.append((now, self.utterances, self.audio_seconds))
+        while len(self.history) > 2 and now - self.history[1][0] >= self.window:
+            self.history.popleft()
+        t0, n0, s0 = self.history[0]
+        elapsed = now - t0
+        utt_rate = (self.utterances - n0) / elapsed if elapsed > 0 else 0.0
+        audio_rate = (self.audio_seconds - s0) / elapsed if elapsed > 0 else 0.0
+        pending = self.total - self.utterances
+        return {
+            "labels": self.labels,
+            "status": self.status,
+            "start_time": self.start_time,
+            "last_update_time": time.time(),
+            "utterances_processed": self.utterances,
+            "utterances_expected": self.total,
+            "audio_seconds_processed": self.audio_seconds,
+            "utterances_per_second": utt_rate,
+            "audio_seconds_per_second": audio_rate,
+            "eta_seconds": pending / utt_rate if utt_rate > 0 else None,
+            "queue_depth": pending,
+            "nan_scores": dict(self.nan_scores),
+            "rss_bytes": {
+                str(pid): {"role": role, "rss": rss}
+                for pid, (role, rss) in process_rss().items()
+            },
+        }
+
+    def write(self):
+        state = self.snapshot()
+        if self.fmt == "json":
+            text = json.dumps(state, indent=2) + "\n"
+        else:
+            text = format_prometheus(state)
+        # atomic update: readers never see a partially written file
+        tmp_path = self.path.with_name(f".{self.path.name}.{os.getpid()}.tmp")
+        with tmp_path.open("w") as f:
+            f.write(text)
+        os.replace(tmp_path, self.path)
+        self.next_write = time.monotonic() + self.interval
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    items = ",".join(
+        '{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"'))
+        for k, v in labels.items()
+    )
+    return "{" + items + "}"
+
+
+def format_prometheus(state):
+    """Format a telemetry snapshot in the Prometheus text exposition format."""
+    labels = state["labels"]
+    lines = []
+
+    def add(name, mtype, help_text, samples):
+        lines.append(f"# HELP scoring_{name} {help_text}")
+        lines.append(f"# TYPE scoring_{name} {mtype}")
+        for extra, value in samples:
+            lines.append(
+                f"scoring_{name}{_format_labels({**labels, **extra})} {value}"
+            )
+
+    add(
+        "utterances_total",
+        "counter",
+        "Number of utterances processed",
+        [({}, state["utterances_processed"])],
+    )
+    add(
+        "utterances_expected",
+        "gauge",
+        "Number of utterances assigned to the job",
+        [({}, state["utterances_expected"])],
+    )
+    add(
+        "audio_seconds_total",
+        "counter",
+        "Duration of the processed audio in seconds",
+        [({}, f"{state['audio_seconds_processed']:.3f}")],
+    )
+    add(
+        "utterances_per_second",
+        "gauge",
+        "Rolling throughput in utterances per second",
+        [({}, f"{state['utterances_per_second']:.4f}")],
+    )
+    add(
+        "audio_seconds_per_second",
+        "gauge",
+        "Rolling throughput in audio seconds per second",
+        [({}, f"{state['audio_seconds_per_second']:.4f}")],
+    )
+    eta = state["eta_seconds"]
+    add(
+        "eta_seconds",
+        "gauge",
+        "Estimated remaining time in seconds",
+        [({}, "NaN" if eta is None else f"{eta:.1f}")],
+    )
+    add(
+        "queue_depth",
+        "gauge",
+        "Number of utterances not yet scored",
+        [({}, state["queue_depth"])],
+    )
+    add(
+        "nan_scores_total",
+        "counter",
+        "Number of NaN or missing scores",
+        [({"metric": m}, n) for m, n in state["nan_scores"].items()],
+    )
+    add(
+        "running",
+        "gauge",
+        "Whether the job is running",
+        [({}, int(state["status"] == "running"))],
+    )
+    add(
+        "failed",
+        "gauge",
+        "Whether the job has terminated with an error",
+        [({}, int(state["status"] == "failed"))],
+    )
+    add(
+        "start_time_seconds",
+        "gauge",
+        "Unix time at which the job started",
+        [({}, f"{state['start_time']:.3f}")],
+    )
+    add(
+        "last_update_time_seconds",
+        "gauge",
+        "Unix time of this update",
+        [({}, f"{state['last_update_time']:.3f}")],
+    )
+    add(
+        "rss_bytes",
+        "gauge",
+        "Resident set size of the job's processes",
+        [
+            ({"pid": pid, "role": v["role"]}, v["rss"])
+            for pid, v in state["rss_bytes"].items()
+        ],
+    )
+    return "\n".join(lines) + "\n"
+
+
+def create_telemetry(args, data_pairs, suffix=""):
+    """Create the telemetry of a scoring job from the command line options.
+
+    Returns:
+        telemetry: a `Telemetry`, or a no-op object if telemetry is disabled
+    """
+    if not args.telemetry:
+        return NULL_TELEMETRY
+    outdir = Path(args.telemetry_dir or args.output_dir)
+    script = Path(sys.argv[0]).stem
+    path = outdir / f"telemetry{suffix}.{args.telemetry_format}"
+    if args.telemetry_dir is not None:
+        # files of different runs may share the textfile collector directory
+        path = outdir / f"{script}{suffix}.{args.telemetry_format}"
+    durations = None
+    if args.manifest is not None and is_manifest(args.manifest):
+        durations = {r["uid"]: r["duration"] for r in read_manifest(args.manifest)}
+    return Telemetry(
+        path,
+        data_pairs,
+        fmt=args.telemetry_format,
+        interval=args.telemetry_interval,
+        window=args.telemetry_window,
+        labels={
+            "script": script,
+            "output_dir": str(Path(args.output_dir).resolve()),
+            "job": args.job,
+            "nsplits": args.nsplits,
+        },
+        durations=durations,
+        read_durations=args.telemetry_read_durations,
+    )
+
+
+def add_telemetry_arguments(parser):
+    group = parser.add_argument_group("Telemetry related")
+    group.add_argument(
+        "--telemetry",
+        type=str2bool,
+        default=False,
+        help="Whether to periodically write the progress, throughput, ETA, NaN "
+        "counts and RSS of the job in a metrics file (telemetry*.prom/json in the "
+        "output directory)",
+    )
+    group.add_argument(
+        "--telemetry_format",
+        type=str,
+        default="prom",
+        choices=("prom", "json"),
+        help="Format of the metrics file: Prometheus textfile collector or JSON",
+    )
+    group.add_argument(
+        "--telemetry_dir",
+        type=str,
+        default=None,
+        help="Directory of the metrics file (e.g. the textfile collector "
+        "directory) instead of the output directory",
+    )
+    group.add_argument(
+        "--telemetry_read_durations",
+        type=str2bool,
+        default=True,
+        help="Whether to read the audio header for the audio seconds, when the "
+        "duration is neither in the manifest nor known from the scoring (e.g. "
+        "SCOREQ without batching)",
+    )
+    group.add_argument(
+        "--telemetry_interval",
+        type=float,
+        default=10.0,
+        help="Minimum interval between two updates of the metrics file in seconds",
+    )
+    group.add_argument(
+        "--telemetry_window",
+        type=float,
+        default=60.0,
+        help="Time window of the rolling throughput in seconds",
+    )
+    return group
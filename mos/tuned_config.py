@@ -0,0 +1,64 @@
+"""Loading the configurations recommended by `autotune.py`.
+
+A tuned configuration is a JSON file of the form
+
+    {
+        "script": "calculate_nonintrusive_dnsmos_pro.py",
+        "args": {"num_threads": 4, ...},   # defaults of the script's options
+        "launch": {"nsplits": 8},          # how to launch the script
+        ...
+    }
+
+`args` replaces the defaults of the script's options, so that options given
+explicitly on the command line still take precedence.
+"""
+import json
+import sys
+from pathlib import Path
+
+
+def add_tuned_config_arguments(parser, num_threads=True):
+    group = parser.add_argument_group("Tuning related")
+    group.add_argument(
+        "--tuned_config",
+        type=str,
+        default=None,
+        help="Path to a configuration recommended by autotune.py, whose settings "
+        "replace the defaults of the corresponding options",
+    )
+    if num_threads:
+        group.add_argument(
+            "--num_threads",
+            type=int,
+            default=None,
+            help="Number of threads used by torch (default: torch's default)",
+        )
+    return group
+
+
+def apply_tuned_config(parser, args, argv=None):
+    """Re-parse the arguments with the defaults given by `args.tuned_config`.
+
+    Returns:
+        args (argparse.Namespace): the updated arguments
+    """
+    if args.tuned_config is None:
+        return args
+    with open(args.tuned_config, "r") as f:
+        config = json.load(f)
+    script = Path(sys.argv[0]).name
+    if config["script"] != script:
+        raise ValueError(
+            f"{args.tuned_config} was tuned for {config['script']}, not {script}"
+        )
+    unknown = [key for key in config["args"] if not hasattr(args, key)]
+    if unknown:
+        raise ValueError(f"Unknown options in {args.tuned_config}: {unknown}")
+    parser.set_defaults(**config["args"])
+    args = parser.parse_args(argv)
+    print(
+        f"Loaded {args.tuned_config}: "
+        + ", ".join(f"--{k} {getattr(args, k)}" for k in config["args"]),
+        flush=True,
+    )
+    return args
@@ -0,0 +1,359 @@
+import sys
+from itertools import combinations
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).resolve().parent.parent / "mos"))
+
+from precision import rankdata
+from stage_profiler import str2bool
+
+
+def read_tags(tags_path):
+    """Read a tag TSV file ("id<TAB>tag1;tag2;...", with a header line).
+
+    Returns:
+        tags (dict): {uid: set of tags}
+    """
+    tags = {}
+    with open(tags_path, "r") as f:
+        header = f.readline().rstrip("\n").split("\t")
+        assert header == ["id", "tags"], header
+        for line in f:
+            if not line.strip():
+                continue
+            uid, tag_str = line.rstrip("\n").split("\t")
+            tags[uid] = {t for t in tag_str.split(";") if t}
+    return tags
+
+
+def read_uid_list(path):
+    """Read uids separated by whitespace and/or commas (e.g. the hard samples)."""
+    with open(path, "r") as f:
+        return {uid for uid in f.read().replace(",", " ").split() if uid}
+
+
+################################################################
+# Loading scores
+################################################################
+def load_scores(args):
+    """Join all score sources on (team, uid).
+
+    The scores without a team (scp files and TSV files without a team column,
+    e.g. the MOS of each uid) are broadcast to all teams that have scores for the
+    same uid.
+
+    Returns:
+        keys (list): list of (team, uid) of all samples
+        metrics (list): names of the metrics
+        scores (np.ndarray): (num_samples, num_metrics), NaN where missing
+    """
+    columns = {}  # metric -> {(team, uid): value}, with team "" if unknown
+    if args.cube_dir is not None:
+        from evaluate_systems import load_cube
+
+        cube, teams, uids, metrics = load_cube(args.cube_dir)
+        for m, metric in enumerate(metrics):
+            columns[metric] = {
+                (team, uid): float(cube[t, u, m])
+                for t, team in enumerate(teams)
+                for u, uid in enumerate(uids)
+            }
+    for path in args.score_tsv:
+        # header: [team] uid metric1 metric2 ...
+        with open(path, "r") as f:
+            header = f.readline().rstrip("\n").split("\t")
+            has_team = header[0] == "team"
+            metrics = header[2:] if has_team else header[1:]
+            for line in f:
+                fields = line.rstrip("\n").split("\t")
+                key = (fields[0], fields[1]) if has_team else ("", fields[0])
+                for metric, value in zip(metrics, fields[len(header) - len(metrics) :]):
+                    columns.setdefault(metric, {})[key] = float(value)
+    for spec in args.score_scp:
+        metric, path = spec.split("=", 1)
+        with open(path, "r") as f:
+            for line in f:
+                uid, value = line.strip().split()
+                columns.setdefault(metric, {})[("", uid)] = float(value)
+
+    metrics = list(columns.keys())
+    teams_of = {}  # uid -> teams with team-specific scores (in order)
+    for col in columns.values():
+        for team, uid in col:
+            if team:
+                teams_of.setdefault(uid, {})[team] = None
+
+    def expand(key):
+        team, uid = key
+        if team or uid not in teams_of:
+            return [key]
+        return [(t, uid) for t in teams_of[uid]]
+
+    keys = list(
+        dict.fromkeys(k for col in columns.values() for key in col for k in expand(key))
+    )
+    index = {key: i for i, key in enumerate(keys)}
+    scores = np.full((len(keys), len(metrics)), np.nan)
+    for m, metric in enumerate(metrics):
+        # team-specific scores take precedence over the broadcast ones
+        items = sorted(columns[metric].items(), key=lambda item: bool(item[0][0]))
+        for key, value in items:
+            for k in expand(key):
+                scores[index[k], m] = value
+    return keys, metrics, scores
+
+
+################################################################
+# Group statistics
+################################################################
+def build_groups(keys, tags, hard_samples=None, tag_pairs=True, min_count=10):
+    """Indicator matrix of the sample groups (all, each tag, tag pairs, hard/other).
+
+    Returns:
+        names (list): group names
+        types (list): group types ("all", "tag", "tag_pair", "hard")
+        indicators (np.ndarray): bool (num_samples, num_groups)
+    """
+    all_tags = sorted({t for ts in tags.values() for t in ts})
+    tag_index = {t: i for i, t in enumerate(all_tags)}
+    tag_matrix = np.zeros((len(keys), len(all_tags)), dtype=bool)
+    for i, (_, uid) in enumerate(keys):
+        for t in tags.get(uid, ()):
+            tag_matrix[i, tag_index[t]] = True
+
+    names, types, columns = ["all"], ["all"], [np.ones(len(keys), dtype=bool)]
+    counts = tag_matrix.sum(axis=0)
+    for t, tag in enumerate(all_tags):
+        if counts[t] >= min_count:
+            names.append(tag)
+            types.append("tag")
+            columns.append(tag_matrix[:, t])
+    if tag_pairs:
+        # co-occurrence counts of all tag pairs with a single matrix product
+        co_counts = tag_matrix.T.astype(np.int64) @ tag_matrix.astype(np.int64)
+        for t1, t2 in combinations(range(len(all_tags)), 2):
+            if co_counts[t1, t2] >= min_count:
+                names.append(f"{all_tags[t1]}&{all_tags[t2]}")
+                types.append("tag_pair")
+                columns.append(tag_matrix[:, t1] & tag_matrix[:, t2])
+    if hard_samples is not None:
+        hard = np.array([uid in hard_samples for _, uid in keys])
+        names += ["hard", "other"]
+        types += ["hard", "hard"]
+        columns += [hard, ~hard]
+    return names, types, np.stack(columns, axis=1)
+
+
+def group_statistics(indicators, scores, ref=None):
+    """Per-group count, mean and std of each metric, and PCC with `ref`.
+
+    All groups are processed at once with (masked) matrix products between the
+    group indicator matrix and the score matrix; NaN scores are ignored.
+
+    Args:
+        indicators (np.ndarray): bool (num_samples, num_groups)
+        scores (np.ndarray): (num_samples, num_metrics)
+        ref (int): column index of the reference metric (e.g. MOS) (optional)
+    Returns:
+        stats (dict): {name: (num_groups, num_metrics) array} for "count",
+            "mean", "std" and "pcc" (if ref is given)
+    """
+    G = indicators.astype(np.float64)
+    valid = ~np.isnan(scores)
+    # centering does not change the statistics but improves numerical stability
+    X = np.where(valid, scores - np.nanmean(scores, axis=0), 0.0)
+    V = valid.astype(np.float64)
+    n = G.T @ V
+    sx = G.T @ X
+    sxx = G.T @ (X * X)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = sx / n
+        stats = {
+            "count": n,
+            "mean": mean + np.nanmean(scores, axis=0),
+            "std": np.sqrt(np.maximum(sxx / n - mean**2, 0.0)),
+        }
+        if ref is not None:
+            # statistics over the samples where both the metric and ref are valid
+            pair = valid & valid[:, [ref]]
+            P = pair.astype(np.float64)
+            Xp = np.where(pair, X, 0.0)
+            Yp = np.where(pair, X[:, [ref]], 0.0)
+            n = G.T @ P
+            sx, sy = G.T @ Xp, G.T @ Yp
+            sxx, syy, sxy = G.T @ (Xp * Xp), G.T @ (Yp * Yp), G.T @ (Xp * Yp)
+            cov = n * sxy - sx * sy
+            stats["pcc"] = cov / np.sqrt((n * sxx - sx**2) * (n * syy - sy**2))
+    return stats
+
+
+def group_srcc(indicators, scores, ref):
+    """Per-group Spearman correlation of each metric with `ref`.
+
+    Unlike the PCC, the ranks depend on the group, so each group is ranked
+    separately.
+    """
+    srcc = np.full((indicators.shape[1], scores.shape[1]), np.nan)
+    for g in range(indicators.shape[1]):
+        sub = scores[indicators[:, g]]
+        for m in range(scores.shape[1]):
+            pair = ~(np.isnan(sub[:, m]) | np.isnan(sub[:, ref]))
+            if pair.sum() < 3:
+                continue
+            rx = rankdata(sub[pair, m])
+            ry = rankdata(sub[pair, ref])
+            srcc[g, m] = np.corrcoef(rx, ry)[0, 1]
+    return srcc
+
+
+################################################################
+# Main entry
+################################################################
+def main(args):
+    keys, metrics, scores = load_scores(args)
+    tags = {}
+    for path in args.tags:
+        tags.update(read_tags(path))
+    hard = read_uid_list(args.hard_samples) if args.hard_samples else None
+    num_tagged = sum(uid in tags for _, uid in keys)
+    print(
+        f"{len(keys)} samples ({num_tagged} with tags) x {len(metrics)} metrics",
+        flush=True,
+    )
+
+    names, types, indicators = build_groups(
+        keys, tags, hard, tag_pairs=args.tag_pairs, min_count=args.min_count
+    )
+    ref = None
+    if args.reference_metric in metrics:
+        ref = metrics.index(args.reference_metric)
+    else:
+        print(
+            f"[Warning] {args.reference_metric} is not found; correlations are skipped",
+            flush=True,
+        )
+    if ref is not None:
+        # metrics without any sample in common with the reference metric (e.g.
+        # scores of other uids) would only get NaN correlations
+        valid = ~np.isnan(scores)
+        disjoint = [
+            metric
+            for m, metric in enumerate(metrics)
+            if m != ref and not np.any(valid[:, m] & valid[:, ref])
+        ]
+        if disjoint and len(disjoint) == len(metrics) - 1:
+            raise ValueError(
+                f"No sample has both {args.reference_metric} and any other metric; "
+                "check that the uids (and teams) of the score files match"
+            )
+        elif disjoint:
+            print(
+                f"[Warning] No sample has both {args.reference_metric} and "
+                f"{', '.join(disjoint)}; their correlations are NaN",
+                flush=True,
+            )
+    stats = group_statistics(indicators, scores, ref)
+    if ref is not None and args.srcc:
+        stats["srcc"] = group_srcc(indicators, scores, ref)
+
+    columns = ["count", "mean", "std"] + [k for k in ("pcc", "srcc") if k in stats]
+    outpath = Path(args.output)
+    outpath.parent.mkdir(parents=True, exist_ok=True)
+    with outpath.open("w") as f:
+        f.write("\t".join(["group", "group_type", "metric"] + columns) + "\n")
+        for g, (name, gtype) in enumerate(zip(names, types)):
+            for m, metric in enumerate(metrics):
+                values = [f"{int(stats['count'][g, m])}"]
+                values += [f"{stats[k][g, m]:.4f}" for k in columns[1:]]
+                f.write("\t".join([name, gtype, metric] + values) + "\n")
+    print(
+        f"Statistics of {len(names)} groups x {len(metrics)} metrics have been "
+        f"written in {outpath}",
+        flush=True,
+    )
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Per-tag (and per-tag-pair) mean scores and correlations with "
+        "MOS, from the tag TSV files and metric scores joined by uid"
+    )
+    parser.add_argument(
+        "--tags",
+        type=str,
+        nargs="+",
+        required=True,
+        help="Paths to the tag TSV files (e.g. blind_test_tags.tsv)",
+    )
+    parser.add_argument(
+        "--output",
+        type=str,
+        required=True,
+        help="Path to the output TSV file (one row per group and metric)",
+    )
+
+    group = parser.add_argument_group(
+        "Scores (joined on team and uid; scores without a team apply to all teams)"
+    )
+    group.add_argument(
+        "--cube_dir",
+        type=str,
+        default=None,
+        help="Output directory of mos/evaluate_systems.py",
+    )
+    group.add_argument(
+        "--score_tsv",
+        type=str,
+        nargs="+",
+        default=[],
+        help="TSV files with a header '[team] uid metric1 metric2 ...' "
+        "(e.g. the MOS labels of each team)",
+    )
+    group.add_argument(
+        "--score_scp",
+        type=str,
+        nargs="+",
+        default=[],
+        help="Scores of a single system as METRIC=path/to/METRIC.scp",
+    )
+
+    group = parser.add_argument_group("Analysis related")
+    group.add_argument(
+        "--reference_metric",
+        type=str,
+        default="MOS",
+        help="Metric with which the other metrics are correlated",
+    )
+    group.add_argument(
+        "--hard_samples",
+        type=str,
+        default=None,
+        help="File listing the uids of the hard samples (separated by whitespace "
+        "or commas), to add the 'hard' and 'other' groups",
+    )
+    group.add_argument(
+        "--tag_pairs",
+        type=str2bool,
+        default=True,
+        help="Whether to also analyze the samples having each pair of tags",
+    )
+    group.add_argument(
+        "--min_count",
+        type=int,
+        default=10,
+        help="Minimum number of samples in a tag (pair) group",
+    )
+    group.add_argument(
+        "--srcc",
+        type=str2bool,
+        default=False,
+        help="Whether to also calculate the Spearman correlation (slower, since "
+        "each group is ranked separately)",
+    )
+    args = parser.parse_args()
+
+    main(args)
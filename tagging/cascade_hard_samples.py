@@ -0,0 +1,385 @@
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import yaml
+
+sys.path.append(str(Path(__file__).resolve().parent.parent / "mos"))
+from evaluate_systems import (
+    build_uid_index,
+    load_cube,
+    read_team_manifest,
+    score_model,
+)
+from metric_registry import METRIC_TO_MODEL, add_model_arguments
+from stage_profiler import str2bool
+
+# margin on the vote bounds, so that floating-point rounding in the partial sums
+# never decides a sample that the full evaluation would decide differently
+EPS = 1e-9
+
+
+def load_config(config_path):
+    """Load the cascade configuration (YAML or JSON).
+
+    Returns:
+        config (dict): with keys
+            "thresholds" ({metric: threshold}),
+            "weights" ({metric: weight}),
+            "higher_is_worse" (metrics that indicate low quality above the
+                threshold, e.g. MCD and LSD),
+            "stages" (list of lists of metrics computed by the cascade, from the
+                cheapest to the most expensive),
+            "min_teams" (number of teams for a sample to be a hard sample)
+    """
+    with open(config_path, "r") as f:
+        config = yaml.safe_load(f)
+    config.setdefault("higher_is_worse", ["MCD", "LSD"])
+    config.setdefault("stages", [])
+    config.setdefault("min_teams", 2)
+    weighted = set(config["weights"])
+    assert weighted <= set(config["thresholds"]), (
+        "Missing thresholds: " + ", ".join(sorted(weighted - set(config["thresholds"])))
+    )
+    staged = [metric for stage in config["stages"] for metric in stage]
+    assert len(staged) == len(set(staged)), "A metric appears in several stages"
+    for metric in staged:
+        assert metric in weighted, f"{metric} is in the stages but has no weight"
+        assert metric in METRIC_TO_MODEL, f"{metric} cannot be computed"
+    return config
+
+
+################################################################
+# Hard sample decision (see README.md)
+################################################################
+def vote_contributions(scores, metrics, config):
+    """Weighted vote of each metric: -weight if low-quality, +weight otherwise
+    and 0 if the score is NaN.
+
+    Args:
+        scores (np.ndarray): (num_teams, num_uids, num_metrics)
+        metrics (list): names of the metrics (last axis)
+        config (dict): see `load_config`
+    Returns:
+        votes (np.ndarray): same shape as `scores`
+    """
+    votes = np.zeros(scores.shape)
+    for m, metric in enumerate(metrics):
+        threshold = config["thresholds"][metric]
+        weight = config["weights"][metric]
+        with np.errstate(invalid="ignore"):
+            if metric in config["higher_is_worse"]:
+                low = scores[..., m] > threshold
+            else:
+                low = scores[..., m] < threshold
+        votes[..., m] = np.where(low, -weight, weight)
+        votes[..., m][np.isnan(scores[..., m])] = 0
+    return votes
+
+
+def vote_sum(votes):
+    """Sum the votes in the metric order (as `sum(vote)` in the reference code)."""
+    total = np.zeros(votes.shape[:-1])
+    for m in range(votes.shape[-1]):
+        total = total + votes[..., m]
+    return total
+
+
+def hard_samples_of(team_hard, uids, min_teams=2):
+    """Samples marked as low-quality for at least `min_teams` teams."""
+    counts = team_hard.sum(axis=0)
+    return [uid for u, uid in enumerate(uids) if counts[u] >= min_teams]
+
+
+def vote_bounds(scores, evaluated, metrics, config):
+    """Range of the final vote of each (team, uid) given the evaluated metrics.
+
+    Each metric that is not evaluated yet can contribute any value within
+    [-weight, weight] (NaN scores contribute 0).
+
+    Returns:
+        lower (np.ndarray): (num_teams, num_uids)
+        upper (np.ndarray): (num_teams, num_uids)
+    """
+    votes = np.where(evaluated, vote_contributions(scores, metrics, config), 0.0)
+    weights = np.array([config["weights"][metric] for metric in metrics])
+    remaining = (~evaluated * weights).sum(axis=-1)
+    partial = vote_sum(votes)
+    return partial - remaining, partial + remaining
+
+
+def undecided_pairs(scores, evaluated, present, metrics, config):
+    """(team, uid) pairs whose hard/not-hard decision may still change.
+
+    A pair with all metrics evaluated is decided by its vote. Otherwise, it is
+    decided if its final vote is surely negative (low-quality) or surely
+    non-negative. A sample is decided if at least `min_teams` of its pairs are
+    surely low-quality, or if too few pairs can still be low-quality; all pairs
+    of a decided sample are decided.
+
+    Returns:
+        undecided (np.ndarray): bool (num_teams, num_uids)
+        surely_hard (np.ndarray): bool (num_teams, num_uids)
+    """
+    lower, upper = vote_bounds(scores, evaluated, metrics, config)
+    complete = evaluated.all(axis=-1)
+    # (lower == upper == the full vote for the complete pairs)
+    surely_hard = present & np.where(complete, upper < 0, upper < -EPS)
+    surely_not_hard = np.where(complete, lower >= 0, lower >= EPS)
+    maybe_hard = present & ~surely_hard & ~surely_not_hard
+    num_hard = surely_hard.sum(axis=0)
+    num_maybe = maybe_hard.sum(axis=0)
+    uid_decided = (num_hard >= config["min_teams"]) | (
+        num_hard + num_maybe < config["min_teams"]
+    )
+    return maybe_hard & ~uid_decided[None, :], surely_hard
+
+
+################################################################
+# Main entry
+################################################################
+def score_pairs(metrics, systems, uid_index, mask, args):
+    """Score the (team, uid) pairs in `mask` with `metrics` (one model at a time).
+
+    Returns:
+        scores (np.ndarray): (num_teams, num_uids, len(metrics))
+        elapsed (dict): {metric: wall time in seconds}
+    """
+    subsystems = {
+        team: [(uid, path) for uid, path in pairs if mask[t, uid_index[uid]]]
+        for t, (team, pairs) in enumerate(systems.items())
+    }
+    scores = np.full(mask.shape + (len(metrics),), np.nan)
+    elapsed = {}
+    model_metrics = {}
+    for metric in metrics:
+        model_metrics.setdefault(METRIC_TO_MODEL[metric], []).append(metric)
+    for model_name, names in model_metrics.items():
+        _, model_scores, seconds = score_model(
+            model_name, names, subsystems, uid_index, args
+        )
+        for j, metric in enumerate(names):
+            scores[..., metrics.index(metric)] = model_scores[..., j]
+            elapsed[metric] = seconds / len(names)
+    return scores, elapsed
+
+
+def main(args):
+    config = load_config(args.config)
+    metrics = list(config["weights"].keys())
+    staged = [metric for stage in config["stages"] for metric in stage]
+
+    systems = read_team_manifest(args.manifest)
+    uid_index = build_uid_index(systems)
+    teams, uids = list(systems.keys()), list(uid_index.keys())
+    present = np.zeros((len(teams), len(uids)), dtype=bool)
+    for t, pairs in enumerate(systems.values()):
+        for uid, _ in pairs:
+            present[t, uid_index[uid]] = True
+
+    scores = np.full((len(teams), len(uids), len(metrics)), np.nan)
+    evaluated = np.zeros(scores.shape, dtype=bool)
+    # metrics that are not computed by the cascade are read from existing cubes
+    precomputed = set()
+    for cube_dir in args.precomputed:
+        cube, cube_teams, cube_uids, cube_metrics = load_cube(cube_dir)
+        team_idx = {team: i for i, team in enumerate(cube_teams)}
+        uid_idx = {uid: i for i, uid in enumerate(cube_uids)}
+        u_src = np.array([uid_idx.get(uid, -1) for uid in uids])
+        for m, metric in enumerate(metrics):
+            if metric in staged or metric not in cube_metrics:
+                continue
+            values = cube[..., cube_metrics.index(metric)]
+            for t, team in enumerate(teams):
+                if team in team_idx:
+                    scores[t, u_src >= 0, m] = values[team_idx[team], u_src[u_src >= 0]]
+            # samples missing from the cube are NaN, as in the full evaluation
+            evaluated[..., m] = True
+            precomputed.add(metric)
+    missing = [m for m in metrics if m not in staged and m not in precomputed]
+    assert not missing, f"Metrics neither in the stages nor precomputed: {missing}"
+    print(
+        f"{len(teams)} teams x {len(uids)} samples; {len(metrics) - len(staged)} "
+        f"precomputed metrics, {len(config['stages'])} stages: "
+        + " -> ".join("+".join(stage) for stage in config["stages"]),
+        flush=True,
+    )
+
+    num_total = int(present.sum())
+    stats = []
+    for s, stage in enumerate(config["stages"]):
+        mask, _ = undecided_pairs(scores, evaluated, present, metrics, config)
+        num_pairs = int(mask.sum())
+        print(
+            f"[Stage {s + 1}] {'+'.join(stage)} on {num_pairs}/{num_total} pairs "
+            f"({int(mask.any(axis=0).sum())} undecided samples)",
+            flush=True,
+        )
+        idx = [metrics.index(metric) for metric in stage]
+        elapsed = {}
+        if num_pairs > 0:
+            stage_scores, elapsed = score_pairs(stage, systems, uid_index, mask, args)
+            scores[..., idx] = np.where(mask[..., None], stage_scores, np.nan)
+        evaluated[..., idx] = mask[..., None]
+        for metric in stage:
+            stats.append(
+                {
+                    "stage": s + 1,
+                    "metric": metric,
+                    "evaluated": num_pairs,
+                    "total": num_total,
+                    "seconds": elapsed.get(metric, 0.0),
+                }
+            )
+
+    # all undecided pairs have been evaluated with all metrics at this point
+    undecided, team_hard = undecided_pairs(scores, evaluated, present, metrics, config)
+    assert not undecided.any()
+    hard_samples = hard_samples_of(team_hard, uids, config["min_teams"])
+
+    outdir = Path(args.output_dir)
+    outdir.mkdir(parents=True, exist_ok=True)
+    with (outdir / "hard_samples.txt").open("w") as f:
+        for uid in hard_samples:
+            f.write(f"{uid}\n")
+    np.save(outdir / "scores.npy", scores.astype(np.float32))
+    np.save(outdir / "evaluated.npy", evaluated)
+    for name, values in (("teams", teams), ("uids", uids), ("metrics", metrics)):
+        with (outdir / f"{name}.txt").open("w") as f:
+            for value in values:
+                f.write(f"{value}\n")
+
+    lines = [
+        f"{'stage':>5} {'metric':<12} {'evaluated':>16} {'saved':>8} "
+        f"{'time (s)':>10} {'est. full (s)':>14}"
+    ]
+    spent = full = 0.0
+    for st in stats:
+        spent += st["seconds"]
+        # the time of the full evaluation is extrapolated from the evaluated pairs
+        est = "-"
+        if st["evaluated"]:
+            full += st["seconds"] / st["evaluated"] * st["total"]
+            est = f"{st['seconds'] / st['evaluated'] * st['total']:.1f}"
+        lines.append(
+            f"{st['stage']:>5d} {st['metric']:<12} "
+            f"{st['evaluated']:>7d}/{st['total']:<8d} "
+            f"{100 * (1 - st['evaluated'] / max(st['total'], 1)):>7.1f}% "
+            f"{st['seconds']:>10.1f} {est:>14}"
+        )
+    evals = sum(st["evaluated"] for st in stats)
+    total_evals = sum(st["total"] for st in stats)
+    lines.append(
+        f"Model evaluations: {evals}/{total_evals} "
+        f"({100 * (1 - evals / max(total_evals, 1)):.1f}% saved); "
+        f"time: {spent:.1f}s vs. ~{full:.1f}s for the full evaluation"
+    )
+    if any(st["evaluated"] == 0 for st in stats):
+        lines[-1] += " (excluding the metrics that were never evaluated)"
+    lines.append(f"Hard samples: {len(hard_samples)}/{len(uids)}")
+
+    if args.verify:
+        # evaluate the remaining pairs and apply the reference algorithm
+        start = time.perf_counter()
+        for s, stage in enumerate(config["stages"]):
+            idx = [metrics.index(metric) for metric in stage]
+            mask = present & ~evaluated[..., idx[0]]
+            if mask.any():
+                stage_scores, _ = score_pairs(stage, systems, uid_index, mask, args)
+                scores[..., idx] = np.where(
+                    mask[..., None], stage_scores, scores[..., idx]
+                )
+        full_hard = hard_samples_of(
+            present & (vote_sum(vote_contributions(scores, metrics, config)) < 0),
+            uids,
+            config["min_teams"],
+        )
+        with (outdir / "hard_samples_full.txt").open("w") as f:
+            for uid in full_hard:
+                f.write(f"{uid}\n")
+        diff = set(hard_samples) ^ set(full_hard)
+        lines.append(
+            f"Verification ({time.perf_counter() - start:.1f}s): "
+            + (
+                f"identical to the full evaluation ({len(full_hard)} hard samples)"
+                if not diff
+                else f"{len(diff)} samples differ: {sorted(diff)}"
+            )
+        )
+
+    report = "\n".join(lines)
+    print(report, flush=True)
+    with (outdir / "RESULTS.txt").open("w") as f:
+        f.write(report + "\n")
+    print(f"Hard samples have been written in {outdir / 'hard_samples.txt'}", flush=True)
+    if args.verify and diff:
+        raise RuntimeError("The cascade disagrees with the full evaluation")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Detect hard samples (see README.md) with a cascade: cheap "
+        "metrics are computed for all samples, and more expensive metrics only "
+        "for the samples whose hard/not-hard decision can still change. "
+        "Run from the mos/ folder (for the relative model paths)."
+    )
+    parser.add_argument(
+        "--manifest",
+        type=str,
+        required=True,
+        help="Path to the manifest of systems, containing one "
+        "'<team> <path to the scp file of enhanced signals>' per line",
+    )
+    parser.add_argument(
+        "--config",
+        type=str,
+        required=True,
+        help="Path to the YAML/JSON file with the thresholds, weights and stages",
+    )
+    parser.add_argument(
+        "--output_dir",
+        type=str,
+        required=True,
+        help="Path to the output directory for writing hard_samples.txt, the "
+        "computed scores and RESULTS.txt",
+    )
+    parser.add_argument(
+        "--precomputed",
+        type=str,
+        nargs="+",
+        default=[],
+        help="Output directories of mos/evaluate_systems.py with the scores of "
+        "the weighted metrics that are not in the stages (e.g. intrusive metrics)",
+    )
+    parser.add_argument(
+        "--verify",
+        type=str2bool,
+        default=False,
+        help="Whether to also run the full evaluation, and check that the hard "
+        "samples are identical",
+    )
+    parser.add_argument(
+        "--device",
+        type=str,
+        default="cpu",
+        help="Device for running the models",
+    )
+    parser.add_argument(
+        "--num_threads",
+        type=int,
+        default=None,
+        help="Number of threads used by torch (default: torch's default)",
+    )
+    parser.add_argument(
+        "--chunk_size",
+        type=int,
+        default=64,
+        help="Number of samples passed to a model at a time",
+    )
+    add_model_arguments(parser)
+    args = parser.parse_args()
+
+    main(args)
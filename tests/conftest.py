@@ -0,0 +1,7 @@
+import sys
+from pathlib import Path
+
+# the scripts import each other as top-level modules
+REPO_DIR = Path(__file__).resolve().parent.parent
+for subdir in ("mos", "wada_snr", "tagging"):
+    sys.path.insert(0, str(REPO_DIR / subdir))
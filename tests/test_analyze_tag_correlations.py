@@ -0,0 +1,105 @@
+import argparse
+
+import numpy as np
+import pytest
+
+from analyze_tag_correlations import (
+    build_groups,
+    group_srcc,
+    group_statistics,
+    load_scores,
+)
+
+
+@pytest.fixture
+def data():
+    rng = np.random.default_rng(0)
+    num_samples = 500
+    keys = [("team", f"u{i}") for i in range(num_samples)]
+    tag_names = ["noise", "reverb", "music"]
+    tags = {
+        uid: {t for t in tag_names if rng.random() < 0.4}
+        for _, uid in keys
+        if rng.random() < 0.9
+    }
+    mos = rng.normal(3, 1, num_samples)
+    scores = np.stack(
+        [
+            mos,
+            mos + rng.normal(0, 0.5, num_samples),
+            100 + rng.normal(0, 10, num_samples),
+        ],
+        axis=1,
+    )
+    scores[rng.random(scores.shape) < 0.05] = np.nan
+    return keys, tags, scores
+
+
+def naive_statistics(mask, x, y=None):
+    valid = mask & ~np.isnan(x)
+    stats = {"count": valid.sum(), "mean": np.mean(x[valid]), "std": np.std(x[valid])}
+    if y is not None:
+        pair = valid & ~np.isnan(y)
+        stats["pcc"] = np.corrcoef(x[pair], y[pair])[0, 1]
+    return stats
+
+
+def test_group_statistics_match_per_group_loop(data):
+    keys, tags, scores = data
+    hard = {uid for _, uid in keys[::7]}
+    names, types, indicators = build_groups(keys, tags, hard, min_count=10)
+    stats = group_statistics(indicators, scores, ref=0)
+    for g in range(len(names)):
+        for m in range(scores.shape[1]):
+            expected = naive_statistics(indicators[:, g], scores[:, m], scores[:, 0])
+            for key, value in expected.items():
+                assert stats[key][g, m] == pytest.approx(value, abs=1e-9), (
+                    names[g],
+                    m,
+                    key,
+                )
+
+
+def test_build_groups(data):
+    keys, tags, scores = data
+    names, types, indicators = build_groups(keys, tags, min_count=10)
+    assert names[0] == "all" and indicators[:, 0].all()
+    assert "noise&reverb" in names
+    g = names.index("noise&reverb")
+    assert types[g] == "tag_pair"
+    expected = [{"noise", "reverb"} <= tags.get(uid, set()) for _, uid in keys]
+    np.testing.assert_array_equal(indicators[:, g], expected)
+    # groups smaller than min_count are dropped
+    names, _, _ = build_groups(keys, tags, min_count=len(keys) + 1)
+    assert names == ["all"]
+
+
+def test_group_srcc(data):
+    keys, tags, scores = data
+    _, _, indicators = build_groups(keys, tags, min_count=10)
+    srcc = group_srcc(indicators, scores, ref=0)
+    np.testing.assert_allclose(srcc[:, 0], 1.0)
+    assert np.all(srcc[:, 1] > 0.5)
+
+
+def make_args(tmp_path, tsv_lines, scp_lines):
+    tsv, scp = tmp_path / "scores.tsv", tmp_path / "MOS.scp"
+    tsv.write_text("".join(line + "\n" for line in tsv_lines))
+    scp.write_text("".join(line + "\n" for line in scp_lines))
+    return argparse.Namespace(
+        cube_dir=None, score_tsv=[str(tsv)], score_scp=[f"MOS={scp}"]
+    )
+
+
+def test_load_scores_broadcasts_team_less_scores(tmp_path):
+    args = make_args(
+        tmp_path,
+        ["team\tuid\tM1", "A\tu1\t1.0", "B\tu1\t2.0", "A\tu2\t3.0"],
+        ["u1 4.0", "u2 5.0", "u3 6.0"],
+    )
+    keys, metrics, scores = load_scores(args)
+    assert metrics == ["M1", "MOS"]
+    assert keys == [("A", "u1"), ("B", "u1"), ("A", "u2"), ("", "u3")]
+    np.testing.assert_array_equal(
+        scores, [[1.0, 4.0], [2.0, 4.0], [3.0, 5.0], [np.nan, 6.0]]
+    )
@@ -0,0 +1,95 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from cascade_hard_samples import (
+    hard_samples_of,
+    load_config,
+    undecided_pairs,
+    vote_bounds,
+    vote_contributions,
+    vote_sum,
+)
+
+CONFIG_PATH = Path(__file__).resolve().parent.parent / "tagging" / "cascade_config.yaml"
+METRICS = ["A", "B", "C", "D", "MCD"]
+CONFIG = {
+    "thresholds": {"A": 0.0, "B": 0.0, "C": 0.0, "D": 0.0, "MCD": 0.0},
+    "weights": {"A": 0.1, "B": 0.2, "C": 0.3, "D": 0.15, "MCD": 0.25},
+    "higher_is_worse": ["MCD"],
+    "stages": [["A", "B"], ["C"], ["D", "MCD"]],
+    "min_teams": 2,
+}
+
+
+def random_cube(seed, num_teams=6, num_uids=300, nan_ratio=0.05):
+    rng = np.random.default_rng(seed)
+    scores = rng.normal(0, 1, (num_teams, num_uids, len(METRICS)))
+    scores[rng.random(scores.shape) < nan_ratio] = np.nan
+    present = rng.random((num_teams, num_uids)) > 0.1
+    return scores, present
+
+
+def full_decision(scores, present):
+    votes = vote_sum(vote_contributions(scores, METRICS, CONFIG))
+    return present & (votes < 0)
+
+
+def test_vote_contributions():
+    scores = np.array([[[-1.0, 1.0, np.nan, 0.0, 1.0]]])
+    votes = vote_contributions(scores, METRICS, CONFIG)
+    # below the threshold (above for MCD) is low-quality; NaN does not vote
+    np.testing.assert_allclose(votes[0, 0], [-0.1, 0.2, 0.0, 0.15, -0.25])
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_vote_bounds_contain_full_vote(seed):
+    scores, _ = random_cube(seed)
+    full = vote_sum(vote_contributions(scores, METRICS, CONFIG))
+    rng = np.random.default_rng(seed + 100)
+    evaluated = rng.random(scores.shape) < 0.5
+    lower, upper = vote_bounds(scores, evaluated, METRICS, CONFIG)
+    assert np.all(lower <= full + 1e-12)
+    assert np.all(full <= upper + 1e-12)
+    # the bounds collapse to the full vote once all metrics are evaluated
+    lower, upper = vote_bounds(scores, np.ones_like(evaluated), METRICS, CONFIG)
+    np.testing.assert_array_equal(lower, full)
+    np.testing.assert_array_equal(upper, full)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_cascade_matches_full_evaluation(seed):
+    scores, present = random_cube(seed)
+    uids = [f"u{u}" for u in range(scores.shape[1])]
+    expected = hard_samples_of(full_decision(scores, present), uids, 2)
+
+    # run the stages on the undecided pairs only, as in main()
+    cascade = np.full(scores.shape, np.nan)
+    evaluated = np.zeros(scores.shape, dtype=bool)
+    num_evaluated = []
+    for stage in CONFIG["stages"]:
+        mask, surely_hard = undecided_pairs(
+            cascade, evaluated, present, METRICS, CONFIG
+        )
+        # the pairs already known to be low-quality stay low-quality
+        assert not np.any(surely_hard & ~full_decision(scores, present))
+        idx = [METRICS.index(metric) for metric in stage]
+        cascade[..., idx] = np.where(mask[..., None], scores[..., idx], np.nan)
+        evaluated[..., idx] = mask[..., None]
+        num_evaluated.append(int(mask.sum()))
+    undecided, team_hard = undecided_pairs(
+        cascade, evaluated, present, METRICS, CONFIG
+    )
+    assert not undecided.any()
+    assert hard_samples_of(team_hard, uids, 2) == expected
+    # the later stages only see the undecided pairs
+    assert num_evaluated[0] == present.sum()
+    assert num_evaluated[-1] < num_evaluated[0]
+
+
+def test_load_config():
+    config = load_config(CONFIG_PATH)
+    assert config["min_teams"] == 2
+    staged = [metric for stage in config["stages"] for metric in stage]
+    assert set(staged) <= set(config["weights"])
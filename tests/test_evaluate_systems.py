@@ -0,0 +1,66 @@
+import argparse
+import os
+import uuid
+
+import numpy as np
+import pytest
+
+from evaluate_systems import build_uid_index, read_team_manifest, score_systems
+from metric_registry import Scorer
+
+METRICS = ["DNSMOSPro", "UTMOS", "WADASNR"]
+TEAMS = {"team_a": 1, "team_b": 2, "team_c": 3}
+NUM_UIDS = 20
+
+
+def stand_in_score(metric, path):
+    # e.g. "/team_b/u07.wav" -> 100 * 2 + 7 (+ 1000 * metric index)
+    team, name = path.strip("/").split("/")
+    return 1000 * METRICS.index(metric) + 100 * TEAMS[team] + int(name[1:3])
+
+
+def stand_in_loader(model_name, args):
+    """Stand-in for `load_scorer`, recording each load in `args.load_dir`."""
+    (args.load_dir / f"{model_name}.{os.getpid()}.{uuid.uuid4().hex}").touch()
+    return Scorer(
+        (model_name,),
+        lambda pair: (pair[0], {model_name: stand_in_score(model_name, pair[1])}),
+    )
+
+
+@pytest.fixture
+def systems(tmp_path):
+    lines = []
+    for team in TEAMS:
+        # team_c misses the last samples
+        num_uids = NUM_UIDS - 5 if team == "team_c" else NUM_UIDS
+        scp = tmp_path / f"{team}.scp"
+        scp.write_text(
+            "".join(f"u{u:02d} /{team}/u{u:02d}.wav\n" for u in range(num_uids))
+        )
+        lines.append(f"{team} {scp}\n")
+    manifest = tmp_path / "systems.txt"
+    manifest.write_text("# team scp\n" + "".join(lines))
+    return read_team_manifest(manifest)
+
+
+@pytest.mark.parametrize("nj", [1, 2, 4])
+def test_score_systems(tmp_path, systems, nj):
+    load_dir = tmp_path / "loads"
+    load_dir.mkdir()
+    args = argparse.Namespace(nj=nj, num_threads=None, chunk_size=8, load_dir=load_dir)
+    uid_index = build_uid_index(systems)
+    cube = score_systems(METRICS, systems, uid_index, args, loader=stand_in_loader)
+
+    assert cube.shape == (len(TEAMS), NUM_UIDS, len(METRICS))
+    for t, team in enumerate(TEAMS):
+        for uid, u in uid_index.items():
+            for m, metric in enumerate(METRICS):
+                if team == "team_c" and u >= NUM_UIDS - 5:
+                    assert np.isnan(cube[t, u, m])
+                else:
+                    path = f"/{team}/{uid}.wav"
+                    assert cube[t, u, m] == stand_in_score(metric, path)
+    # each model is loaded exactly once, whatever the number of workers
+    loads = [name.split(".")[0] for name in os.listdir(load_dir)]
+    assert sorted(loads) == sorted(METRICS)
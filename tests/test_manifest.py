@@ -0,0 +1,83 @@
+import pytest
+
+from manifest import (
+    MANIFEST_FIELDS,
+    is_manifest,
+    load_data_pairs,
+    read_manifest,
+    read_scp,
+    write_manifest,
+)
+
+
+def make_row(uid, path):
+    return {
+        "uid": uid,
+        "path": path,
+        "sample_rate": 16000,
+        "channels": 1,
+        "frames": 32000,
+        "duration": "2.0000",
+    }
+
+
+def test_read_scp_keeps_spaces_in_paths(tmp_path):
+    scp = tmp_path / "wav.scp"
+    scp.write_text(
+        "u1 /data/a b/c.wav\n"
+        "u2\t/data/trailing .wav \n"
+        "\n"
+        "u3   /data/d.wav\r\n"
+        "u4 /data/last.wav"
+    )
+    assert read_scp(scp) == [
+        ("u1", "/data/a b/c.wav"),
+        ("u2", "/data/trailing .wav "),
+        ("u3", "/data/d.wav"),
+        ("u4", "/data/last.wav"),
+    ]
+
+
+def test_manifest_roundtrip(tmp_path):
+    rows = [make_row("u1", "/data/a b/c.wav"), make_row("u2", "/data/d.wav ")]
+    path = tmp_path / "sub" / "manifest.tsv"
+    write_manifest(rows, path)
+    assert is_manifest(path)
+    loaded = read_manifest(path)
+    assert [tuple(r.keys()) for r in loaded] == [MANIFEST_FIELDS] * 2
+    assert [(r["uid"], r["path"]) for r in loaded] == [
+        ("u1", "/data/a b/c.wav"),
+        ("u2", "/data/d.wav "),
+    ]
+    assert loaded[0]["sample_rate"] == 16000
+    assert loaded[0]["duration"] == 2.0
+    assert load_data_pairs(path) == [(r["uid"], r["path"]) for r in loaded]
+
+
+def test_scp_is_not_a_manifest(tmp_path):
+    scp = tmp_path / "wav.scp"
+    scp.write_text("u1 /data/a.wav\n")
+    assert not is_manifest(scp)
+    assert load_data_pairs(scp) == [("u1", "/data/a.wav")]
+
+
+@pytest.mark.parametrize("path", ["/data/a\tb.wav", "/data/a\nb.wav"])
+def test_write_manifest_rejects_tabs_and_line_breaks(tmp_path, path):
+    out = tmp_path / "manifest.tsv"
+    with pytest.raises(ValueError, match="path"):
+        write_manifest([make_row("u1", "/data/ok.wav"), make_row("u2", path)], out)
+    assert not out.exists()
+
+
+@pytest.mark.parametrize(
+    "content, message",
+    [
+        ("u1 /data/a.wav\nu2\n", r"wav.scp:2: expected '<uid> <path>'"),
+        ("u1 /data/a.wav\n\nu1 /data/b.wav\n", r"wav.scp:3: duplicate uid 'u1' .*1"),
+    ],
+)
+def test_read_scp_rejects_malformed_lines(tmp_path, content, message):
+    scp = tmp_path / "wav.scp"
+    scp.write_text(content)
+    with pytest.raises(ValueError, match=message):
+        read_scp(scp)
@@ -0,0 +1,69 @@
+import math
+
+import numpy as np
+import pytest
+import torch
+
+from precision import (
+    compare_scores,
+    reduce_precision,
+    report_deviation,
+    spearman_correlation,
+)
+
+
+def test_compare_scores():
+    ref = [{"A": 1.0, "B": 3.0}, {"A": 2.0, "B": np.nan}, {"A": 3.0, "B": 1.0}]
+    test = [{"A": 1.1, "B": 3.0}, {"A": 1.95, "B": 2.0}, {"A": 3.0, "B": 1.5}]
+    report = compare_scores(ref, test)
+    assert report["A"]["num"] == 3
+    assert report["A"]["max_abs_dev"] == pytest.approx(0.1)
+    assert report["A"]["mean_abs_dev"] == pytest.approx(0.05)
+    assert report["A"]["srcc"] == pytest.approx(1.0)
+    # NaN scores are ignored
+    assert report["B"]["num"] == 2
+    assert report["B"]["max_abs_dev"] == pytest.approx(0.5)
+
+
+def test_compare_scores_all_nan():
+    report = compare_scores([{"A": np.nan}], [{"A": 1.0}])
+    assert report["A"]["num"] == 0
+    assert math.isnan(report["A"]["max_abs_dev"])
+
+
+def test_spearman_correlation_with_ties():
+    assert spearman_correlation(np.array([1, 2, 2, 3]), np.array([1, 2, 2, 3])) == (
+        pytest.approx(1.0)
+    )
+    assert spearman_correlation(np.array([1, 2, 3]), np.array([3, 2, 1])) == (
+        pytest.approx(-1.0)
+    )
+    assert math.isnan(spearman_correlation(np.ones(3), np.arange(3)))
+
+
+def test_report_deviation():
+    report = {"A": {"num": 2, "max_abs_dev": 0.2, "mean_abs_dev": 0.1, "srcc": 1.0}}
+    report_deviation(report, "bf16", max_abs_dev=0.5, on_fail="error")
+    with pytest.warns(UserWarning):
+        report_deviation(report, "bf16", max_abs_dev=0.1, on_fail="warn")
+    with pytest.raises(RuntimeError, match="A"):
+        report_deviation(report, "bf16", max_abs_dev=0.1, on_fail="error")
+
+
+def test_reduce_precision_int8():
+    model = torch.nn.Sequential(torch.nn.Conv1d(1, 4, 3), torch.nn.Linear(2, 1))
+    qmodel = reduce_precision(model, "int8")
+    assert isinstance(qmodel[1], torch.ao.nn.quantized.dynamic.Linear)
+    # the fp32 model is left untouched
+    assert type(model[1]) is torch.nn.Linear
+    assert reduce_precision(model, "bf16") is model
+
+
+def test_reduce_precision_int8_skips_non_modules():
+    class Wrapper:
+        def predict(self, path):
+            return 3.0
+
+    wrapper = Wrapper()
+    with pytest.warns(UserWarning, match="not a torch.nn.Module"):
+        assert reduce_precision(wrapper, "int8") is wrapper
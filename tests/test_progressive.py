@@ -0,0 +1,179 @@
+import argparse
+import math
+
+import numpy as np
+import pytest
+
+from manifest import write_manifest
+from progressive import (
+    ProgressiveEvaluation,
+    add_progressive_arguments,
+    assign_strata,
+    progressive_order,
+    read_scored,
+)
+
+NUM_SAMPLES = 200
+
+
+def parse_args(*argv):
+    parser = argparse.ArgumentParser()
+    add_progressive_arguments(parser)
+    parser.add_argument("--manifest", default=None)
+    return parser.parse_args(list(argv))
+
+
+@pytest.fixture
+def data():
+    # two datasets, with a trend in the data order (so that a prefix is biased)
+    pairs = [
+        (f"{'a' if i < 100 else 'b'}_{i:03d}", f"{i}.wav") for i in range(NUM_SAMPLES)
+    ]
+    scores = {uid: {"M1": i / 10, "M2": -i / 10} for i, (uid, _) in enumerate(pairs)}
+    return pairs, scores
+
+
+def write_scp(path, items):
+    with path.open("w") as f:
+        for uid, value in items:
+            f.write(f"{uid} {value}\n")
+
+
+def test_read_scored_keeps_complete_lines(tmp_path):
+    write_scp(tmp_path / "M1.scp", [("u1", 1.0), ("u2", 2.0), ("u3", 3.0)])
+    write_scp(tmp_path / "M2.scp", [("u1", -1.0), ("u2", -2.0)])
+    with (tmp_path / "M2.scp").open("a") as f:
+        f.write("u3 -3")  # truncated by a killed run
+    scored = read_scored(tmp_path, ["M1", "M2"])
+    assert scored == {"u1": {"M1": 1.0, "M2": -1.0}, "u2": {"M1": 2.0, "M2": -2.0}}
+    # the files are rewritten without the incomplete samples
+    assert (tmp_path / "M1.scp").read_text() == "u1 1.0\nu2 2.0\n"
+    assert (tmp_path / "M2.scp").read_text() == "u1 -1.0\nu2 -2.0\n"
+
+
+def test_read_scored_parses_none_as_nan(tmp_path):
+    write_scp(tmp_path / "M1.scp", [("u1", 1.0), ("u2", None)])
+    scored = read_scored(tmp_path, ["M1"])
+    assert scored["u1"] == {"M1": 1.0}
+    assert math.isnan(scored["u2"]["M1"])
+    # the None entries are kept as they are
+    assert (tmp_path / "M1.scp").read_text() == "u1 1.0\nu2 None\n"
+
+
+def test_read_scored_without_files(tmp_path):
+    assert read_scored(tmp_path, ["M1", "M2"]) == {}
+
+
+def test_read_scored_missing_metric_file(tmp_path):
+    write_scp(tmp_path / "M1.scp", [("u1", 1.0), ("u2", 2.0)])
+    before = (tmp_path / "M1.scp").read_text()
+    with pytest.raises(FileNotFoundError, match="M2.scp"):
+        read_scored(tmp_path, ["M1", "M2"])
+    # the existing file is not truncated
+    assert (tmp_path / "M1.scp").read_text() == before
+
+
+def test_duration_strata_with_equal_quantiles(tmp_path):
+    # most samples have the same duration, so that several quantiles are equal
+    durations = [2.0] * 80 + [1.0] * 10 + [5.0] * 10
+    rows = [
+        {
+            "uid": f"u{i}",
+            "path": f"{i}.wav",
+            "sample_rate": 16000,
+            "channels": 1,
+            "frames": int(d * 16000),
+            "duration": f"{d:.4f}",
+        }
+        for i, d in enumerate(durations)
+    ]
+    manifest = tmp_path / "manifest.tsv"
+    write_manifest(rows, manifest)
+    args = parse_args(
+        "--stratify", "duration", "--num_strata", "5", "--manifest", str(manifest)
+    )
+    strata = assign_strata([(r["uid"], r["path"]) for r in rows], args)
+    # the equal quantiles give a single edge, and no empty strata
+    assert {h: strata.count(h) for h in strata} == {"[2.00s, )": 90, "[, 2.00s)": 10}
+
+
+def test_progressive_order_is_proportional():
+    strata = ["a"] * 300 + ["b"] * 100
+    order = progressive_order(range(400), strata, seed=0)
+    assert sorted(order) == list(range(400))
+    for n in (40, 100, 200):
+        num_a = sum(strata[i] == "a" for i in order[:n])
+        assert abs(num_a - 0.75 * n) <= 1
+    assert order == progressive_order(range(400), strata, seed=0)
+    assert order != progressive_order(range(400), strata, seed=1)
+
+
+def run(evaluation, scores, num=None):
+    """Score the next `num` pending samples (all if None)."""
+    start = evaluation.num_new
+    end = None if num is None else start + num
+    for uid, _ in evaluation.pending[start:end]:
+        if evaluation.update(uid, scores[uid]):
+            break
+
+
+def test_estimate_is_exact_when_exhausted(tmp_path, data):
+    pairs, scores = data
+    args = parse_args("--progressive", "true", "--stratify", "prefix")
+    evaluation = ProgressiveEvaluation(args, pairs, ["M1", "M2"], tmp_path)
+    run(evaluation, scores)
+    for metric in ("M1", "M2"):
+        mean, std_error = evaluation.estimate(metric)
+        assert mean == pytest.approx(np.mean([s[metric] for s in scores.values()]))
+        assert std_error == 0
+
+
+def test_resume_progressive_run(tmp_path, data):
+    pairs, scores = data
+    argv = ["--progressive", "true", "--stratify", "prefix", "--seed", "3"]
+    first = ProgressiveEvaluation(parse_args(*argv), pairs, ["M1", "M2"], tmp_path)
+    visited = [uid for uid, _ in first.pending[:50]]
+    for metric in ("M1", "M2"):
+        write_scp(tmp_path / f"{metric}.scp", [(u, scores[u][metric]) for u in visited])
+    run(first, scores, 50)
+
+    resumed = ProgressiveEvaluation(
+        parse_args(*argv, "--resume", "true"), pairs, ["M1", "M2"], tmp_path
+    )
+    # the samples of a progressive run are a prefix of the order: they are
+    # pooled with the new samples, which continue in the same order
+    assert {uid for uid, _ in resumed.scored} == set(visited)
+    assert set(resumed.strata["M1"]) == {"a", "b"}
+    assert resumed.pending == first.pending[50:]
+    for metric in ("M1", "M2"):
+        assert resumed.estimate(metric) == pytest.approx(first.estimate(metric))
+
+
+def test_resume_non_progressive_run(tmp_path, data, capsys):
+    pairs, scores = data
+    # an interrupted full run has scored the first samples in data order
+    for metric in ("M1", "M2"):
+        write_scp(
+            tmp_path / f"{metric}.scp", [(u, scores[u][metric]) for u, _ in pairs[:60]]
+        )
+    args = parse_args(
+        "--progressive", "true", "--stratify", "prefix", "--resume", "true"
+    )
+    evaluation = ProgressiveEvaluation(args, pairs, ["M1", "M2"], tmp_path)
+    assert "not in the progressive order" in capsys.readouterr().out
+    assert len(evaluation.pending) == NUM_SAMPLES - 60
+    resumed_strata = {
+        h: s for h, s in evaluation.strata["M1"].items() if h.endswith("(resumed)")
+    }
+    # fully scored, so that they add no variance
+    assert all(s.visited == s.size for s in resumed_strata.values())
+    assert sum(s.size for s in resumed_strata.values()) > 0
+
+    true_mean = np.mean([s["M1"] for s in scores.values()])
+    run(evaluation, scores, 40)
+    mean, std_error = evaluation.estimate("M1")
+    assert not math.isnan(std_error)
+    # the biased prefix (mean 2.95 vs 9.95) does not pull the estimate
+    assert abs(mean - true_mean) < 4 * std_error
+    run(evaluation, scores)
+    assert evaluation.estimate("M1") == pytest.approx((true_mean, 0.0))
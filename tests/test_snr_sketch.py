@@ -0,0 +1,125 @@
+import math
+
+import numpy as np
+import pytest
+
+from snr_sketch import (
+    Histogram,
+    ScoreSketch,
+    TDigest,
+    load_sketches,
+    merge_sketches,
+    save_sketches,
+)
+
+
+@pytest.fixture
+def values():
+    rng = np.random.default_rng(0)
+    return np.concatenate([rng.normal(20, 10, 20000), rng.normal(60, 5, 5000)])
+
+
+def test_histogram_moments_and_counts(values):
+    hist = Histogram()
+    hist.update(np.concatenate([values, [np.nan, -50.0, 150.0]]))
+    valid = np.concatenate([values, [-50.0, 150.0]])
+    assert hist.count == len(valid)
+    assert hist.num_nan == 1
+    assert hist.underflow == int((valid < -20).sum())
+    assert hist.overflow == int((valid >= 100).sum())
+    assert hist.mean() == pytest.approx(valid.mean())
+    assert hist.std() == pytest.approx(valid.std())
+    assert (hist.min, hist.max) == (-50.0, 150.0)
+    assert hist.cdf()[-1] == pytest.approx(1 - hist.overflow / hist.count)
+
+
+def test_histogram_merge_equals_single_pass(values):
+    full = Histogram()
+    full.update(values)
+    merged = Histogram()
+    for part in np.array_split(values, 7):
+        hist = Histogram()
+        hist.update(part)
+        merged.merge(hist)
+    np.testing.assert_array_equal(merged.counts, full.counts)
+    assert merged.count == full.count
+    assert merged.mean() == pytest.approx(full.mean())
+    assert merged.std() == pytest.approx(full.std())
+
+
+def test_histogram_merge_rejects_different_bins():
+    with pytest.raises(ValueError):
+        Histogram(num_bins=10).merge(Histogram(num_bins=20))
+
+
+@pytest.mark.parametrize("q", [0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99])
+def test_tdigest_quantiles(values, q):
+    digest = TDigest()
+    digest.update(values)
+    # rank error well below 1% (even in the tails)
+    rank = np.mean(values <= digest.quantile(q))
+    assert rank == pytest.approx(q, abs=0.005)
+
+
+def test_tdigest_merge(values):
+    merged = TDigest()
+    for part in np.array_split(values, 10):
+        digest = TDigest()
+        digest.update(part)
+        merged.merge(digest)
+    assert merged.count == len(values)
+    assert len(merged.weights) <= merged.compression
+    assert merged.quantile(0.0) == values.min()
+    assert merged.quantile(1.0) == values.max()
+    for q in (0.05, 0.5, 0.95):
+        assert np.mean(values <= merged.quantile(q)) == pytest.approx(q, abs=0.005)
+
+
+def test_tdigest_empty():
+    assert math.isnan(TDigest().quantile(0.5))
+
+
+def test_sketches_roundtrip_and_merge(tmp_path, values):
+    parts = []
+    for i, part in enumerate(np.array_split(values, 3)):
+        sketch = ScoreSketch()
+        sketch.update(part)
+        sketches = {"all": sketch}
+        if i == 0:
+            sketches["only_first"] = ScoreSketch()
+            sketches["only_first"].update(part[:10])
+        path = tmp_path / f"WADASNR_sketch.{i + 1}.json"
+        save_sketches(sketches, path, "WADASNR")
+        parts.append(path)
+
+    loaded = [load_sketches(path) for path in parts]
+    assert {metric for metric, _ in loaded} == {"WADASNR"}
+    merged = merge_sketches([sketches for _, sketches in loaded])
+    assert set(merged) == {"all", "only_first"}
+    assert merged["all"].histogram.count == len(values)
+    assert merged["only_first"].histogram.count == 10
+    assert merged["all"].histogram.mean() == pytest.approx(values.mean())
+    assert merged["all"].tdigest.quantile(0.5) == pytest.approx(
+        np.median(values), abs=0.5
+    )
+    # written atomically: no temporary file is left behind
+    assert sorted(p.name for p in tmp_path.iterdir()) == sorted(p.name for p in parts)
+
+
+def test_sketch_tool_merge_into_an_input(tmp_path, values):
+    import argparse
+
+    import sketch_tool
+
+    paths = []
+    for i, part in enumerate(np.array_split(values, 2)):
+        sketch = ScoreSketch()
+        sketch.update(part)
+        paths.append(tmp_path / f"WADASNR_sketch.{i + 1}.json")
+        save_sketches({"all": sketch}, paths[-1], "WADASNR")
+    args = argparse.Namespace(
+        command="merge", inputs=[str(p) for p in paths], output=str(paths[0])
+    )
+    sketch_tool.main(args)
+    _, merged = load_sketches(paths[0])
+    assert merged["all"].histogram.count == len(values)
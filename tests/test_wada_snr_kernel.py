@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+
+from calculate_wada_snr import wada_snr
+from wada_snr_kernel import numba, wada_stats
+
+BACKENDS = ["numpy"] + (["numba"] if numba is not None else [])
+
+
+def reference_stats(audio, min_val=1e-10):
+    audio = audio.astype(np.float64)
+    a = np.clip(np.abs(audio / np.max(np.abs(audio))), min_val, None)
+    return np.mean(a, axis=0), np.mean(np.log(a), axis=0), np.sum(a**2, axis=0)
+
+
+def assert_close(stats, ref_stats):
+    # the blocks of float32 signals are reduced in float32 before being
+    # accumulated in float64
+    for x, ref in zip(stats, ref_stats):
+        np.testing.assert_allclose(x, ref, rtol=1e-5, atol=1e-7)
+
+
+def speech_like(num_samples, snr_db=20.0, seed=0, dtype=np.float32):
+    rng = np.random.default_rng(seed)
+    # Gamma-distributed amplitudes (as assumed by WADA) with a random sign
+    clean = rng.gamma(0.4, 1.0, num_samples) * rng.choice([-1, 1], num_samples)
+    noise = rng.normal(0, 1, num_samples)
+    noise *= np.sqrt(np.mean(clean**2) / np.mean(noise**2) / 10 ** (snr_db / 10))
+    return (0.1 * (clean + noise)).astype(dtype)
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+@pytest.mark.parametrize("num_samples", [1, 100, 16384, 16384 * 3 + 7])
+def test_matches_reference(backend, num_samples):
+    audio = speech_like(num_samples)
+    assert_close(wada_stats(audio, backend=backend), reference_stats(audio))
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_multichannel(backend):
+    audio = np.stack([speech_like(20000, seed=s) for s in range(3)], axis=1)
+    audio[:, 2] *= 0.01
+    stats = wada_stats(audio, backend=backend)
+    assert all(x.shape == (3,) for x in stats)
+    assert_close(stats, reference_stats(audio))
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_zeros_are_clipped(backend):
+    # digital silence (exact zeros) is clipped to min_val * max|x|
+    audio = speech_like(40000)
+    audio[1000:9000] = 0
+    assert_close(wada_stats(audio, backend=backend), reference_stats(audio))
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_second_pass_below_threshold(backend):
+    # non-zero samples below min_val * max|x| need the clipped second pass
+    audio = speech_like(30000, dtype=np.float64)
+    audio[::100] = 1e-14
+    for min_val in (1e-10, 1e-3):
+        assert_close(
+            wada_stats(audio, min_val=min_val, backend=backend),
+            reference_stats(audio, min_val=min_val),
+        )
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_silent_and_empty_signals(backend):
+    for audio in (np.zeros(1000, dtype=np.float32), np.zeros(0, dtype=np.float32)):
+        assert all(np.isnan(x).all() for x in wada_stats(audio, backend=backend))
+
+
+@pytest.mark.parametrize("snr_db", [0.0, 10.0, 30.0])
+def test_wada_snr_fused_matches_unfused(snr_db):
+    audio = speech_like(48000, snr_db=snr_db)
+    assert wada_snr(audio, fused=True) == pytest.approx(
+        wada_snr(audio, fused=False), abs=1e-3
+    )
@@ -1,8 +1,25 @@
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from pathlib import Path
 
 import numpy as np
 import soundfile as sf
-from tqdm.contrib.concurrent import process_map
+from tqdm import tqdm
+
+sys.path.append(str(Path(__file__).resolve().parent.parent / "mos"))
+from manifest import add_input_arguments, get_data_pairs
+from stage_profiler import add_profiler_arguments, profiler, str2bool, write_profile
+from telemetry import add_telemetry_arguments, create_telemetry
+from tuned_config import add_tuned_config_arguments, apply_tuned_config
+from snr_sketch import (
+    ScoreSketch,
+    dataset_of,
+    merge_sketches,
+    read_dataset_map,
+    save_sketches,
+)
+from wada_snr_kernel import wada_stats
 
 
 METRICS = ("WADASNR",)
@@ -135,7 +152,7 @@ dbvals = np.array([float(x.split()[0]) for x in integral_lookup_table.keys()])
 Gvals = np.array(list(integral_lookup_table.values()))
 
 
-def wada_snr(audio, min_val=1e-10):
+def wada_snr(audio, min_val=1e-10, fused=True):
     """WADA-SNR (Waveform Amplitude Distribution Analysis) algorithm.
 
     Assume that the amplitude distribution of clean speech can be approximated by
@@ -152,21 +169,26 @@ def wada_snr(audio, min_val=1e-10):
     Args:
         audio (np.ndarray): input audio signal (time, [channels])
         min_val (float): minimum value
+        fused (bool): whether to compute the statistics below with the fused
+            kernel in wada_snr_kernel.py instead of full-length temporaries
     Returns:
         snr (list): estimated SNR (length = audio.shape[1])
     """
-    audio = audio / np.max(np.abs(audio))
-    audio = np.abs(audio)
-    np.clip(audio, min_val, None, out=audio)
-    # E[|z|]
-    mean = np.mean(audio, axis=0)
-    # E[log|z|]
-    logmean = np.mean(np.log(audio), axis=0)
+    if fused:
+        # E[|z|], E[log|z|] and sum(|z|^2) of the normalized amplitude z
+        mean, logmean, dNoisyEng = wada_stats(audio, min_val)
+    else:
+        audio = audio / np.max(np.abs(audio))
+        audio = np.abs(audio)
+        np.clip(audio, min_val, None, out=audio)
+        # E[|z|]
+        mean = np.mean(audio, axis=0)
+        # E[log|z|]
+        logmean = np.mean(np.log(audio), axis=0)
+        dNoisyEng = np.sum(audio**2, axis=0)
     # log(E[|z|]) - E[log(|z|)]
     diff = np.atleast_1d(np.log(mean) - logmean)
 
-    dNoisyEng = np.sum(audio**2, axis=0)
-
     # Table interpolation
     snr = []
     # for ch in range(diff.shape[0]):
@@ -206,48 +228,151 @@ def wada_snr(audio, min_val=1e-10):
 # Main entry
 ################################################################
 def main(args):
-    data_pairs = []
-    with open(args.inf_scp, "r") as f:
-        for line in f:
-            uid, audio_path = line.strip().split()
-            data_pairs.append((uid, audio_path))
-
-    ret = process_map(
-        process_one_pair,
-        data_pairs,
-        max_workers=args.nj,
-        chunksize=args.chunksize,
+    data_pairs = get_data_pairs(args)
+
+    size = len(data_pairs)
+    assert 1 <= args.job <= args.nsplits <= size
+    interval = size // args.nsplits
+    start = (args.job - 1) * interval
+    end = size if args.job == args.nsplits else start + interval
+    data_pairs = data_pairs[start:end]
+    print(
+        f"[Job {args.job}/{args.nsplits}] Processing ({len(data_pairs)}/{size}) samples",
+        flush=True,
     )
+    suffix = "" if args.nsplits == args.job == 1 else f".{args.job}"
+
+    datasets = None
+    if args.sketch:
+        # per-dataset histograms and quantile sketches (see sketch_tool.py), built
+        # by the workers on each chunk and merged here
+        dataset_map = None
+        if args.dataset_map is not None:
+            dataset_map = read_dataset_map(args.dataset_map)
+        datasets = [
+            dataset_of(uid, dataset_map, args.dataset_delimiter)
+            for uid, _ in data_pairs
+        ]
+    starts = range(0, len(data_pairs), args.chunksize)
+    pair_chunks = [data_pairs[i : i + args.chunksize] for i in starts]
+    dataset_chunks = [
+        None if datasets is None else datasets[i : i + args.chunksize]
+        for i in starts
+    ]
+
+    events = []
+    if args.profile:
+        profiler.enable()
+    telemetry = create_telemetry(args, data_pairs, suffix)
+    ret = []
+    sketches = {metric: {} for metric in METRICS}
+    # the results are consumed (in order) as they are completed, to track progress
+    with telemetry, ProcessPoolExecutor(max_workers=args.nj) as executor:
+        results = executor.map(
+            partial(score_chunk, profile=args.profile), pair_chunks, dataset_chunks
+        )
+        with tqdm(total=len(data_pairs)) as pbar:
+            for chunk_ret, durations, chunk_sketches, evts in results:
+                events.extend(evts)
+                for (uid, score), duration in zip(chunk_ret, durations):
+                    ret.append((uid, score))
+                    telemetry.update(uid, score, duration=duration)
+                if chunk_sketches is not None:
+                    for metric in METRICS:
+                        sketches[metric] = merge_sketches(
+                            [sketches[metric], chunk_sketches[metric]]
+                        )
+                pbar.update(len(chunk_ret))
 
     outdir = Path(args.output_dir)
     outdir.mkdir(parents=True, exist_ok=True)
-    writers = {metric: (outdir / f"{metric}.scp").open("w") for metric in METRICS}
+    writers = {
+        metric: (outdir / f"{metric}{suffix}.scp").open("w") for metric in METRICS
+    }
 
     for uid, score in ret:
-        for metric, value in score.items():
-            writers[metric].write(f"{uid} {value}\n")
+        profiler.uid = uid
+        with profiler.stage("write"):
+            for metric, value in score.items():
+                writers[metric].write(f"{uid} {value}\n")
 
     for metric in METRICS:
         writers[metric].close()
+    if args.profile:
+        write_profile(
+            events + profiler.drain(), outdir, suffix, trace=args.profile_trace
+        )
 
-    with (outdir / "RESULTS.txt").open("w") as f:
+    if args.sketch:
         for metric in METRICS:
-            mean_score = np.nanmean([score[metric] for uid, score in ret])
-            f.write(f"{metric}: {mean_score:.4f}\n")
-    print(f"Overall results have been written in {outdir / 'RESULTS.txt'}", flush=True)
+            save_sketches(
+                sketches[metric], outdir / f"{metric}_sketch{suffix}.json", metric
+            )
+
+    if args.nsplits == args.job == 1:
+        with (outdir / "RESULTS.txt").open("w") as f:
+            for metric in METRICS:
+                mean_score = np.nanmean([score[metric] for uid, score in ret])
+                f.write(f"{metric}: {mean_score:.4f}\n")
+        print(
+            f"Overall results have been written in {outdir / 'RESULTS.txt'}", flush=True
+        )
 
 
-def process_one_pair(data_pair):
+def score_chunk(data_pairs, datasets=None, profile=False):
+    """Score a chunk of samples in a worker process.
+
+    Args:
+        data_pairs (list): (uid, path) pairs of the chunk
+        datasets (list): dataset of each pair (optional). If given, the
+            sketches of the chunk are built here, so that only their bounded
+            state is sent back to the main process.
+        profile (bool): whether to record the profiling events of the chunk
+    Returns:
+        results (list): (uid, scores) of each pair
+        durations (list): duration of each pair in seconds
+        sketches (dict): {metric: {dataset: ScoreSketch}}, or None
+        events (list): the profiling events recorded in the chunk
+    """
+    if profile:
+        profiler.enable()
+    results, durations = [], []
+    for pair in data_pairs:
+        uid, scores, duration = process_one_pair(pair, return_duration=True)
+        results.append((uid, scores))
+        durations.append(duration)
+    events = profiler.drain() if profile else []
+    if datasets is None:
+        return results, durations, None, events
+    sketches = {}
+    for metric in METRICS:
+        values = {"all": []}
+        for (uid, score), dataset in zip(results, datasets):
+            values.setdefault(dataset, []).append(score[metric])
+            values["all"].append(score[metric])
+        sketches[metric] = {}
+        for dataset, vals in values.items():
+            sketches[metric][dataset] = ScoreSketch()
+            sketches[metric][dataset].update(vals)
+    return results, durations, sketches, events
+
+
+def process_one_pair(data_pair, return_duration=False):
     uid, inf_path = data_pair
-    audio, fs = sf.read(inf_path, dtype="float32")
+    profiler.uid = uid
+    with profiler.stage("read"):
+        audio, fs = sf.read(inf_path, dtype="float32")
 
     scores = {}
     for metric in METRICS:
         if metric == "WADASNR":
-            scores[metric] = wada_snr(audio)
+            with profiler.stage("wada_snr"):
+                scores[metric] = wada_snr(audio)
         else:
             raise NotImplementedError(metric)
 
+    if return_duration:
+        return uid, scores, len(audio) / fs
     return uid, scores
 
 
@@ -255,12 +380,7 @@ if __name__ == "__main__":
     import argparse
 
     parser = argparse.ArgumentParser()
-    parser.add_argument(
-        "--inf_scp",
-        type=str,
-        required=True,
-        help="Path to the scp file containing enhanced signals",
-    )
+    add_input_arguments(parser)
     parser.add_argument(
         "--output_dir",
         type=str,
@@ -277,8 +397,46 @@ if __name__ == "__main__":
         "--chunksize",
         type=int,
         default=1000,
-        help="Chunk size used in process_map",
+        help="Chunk size of the samples sent to each worker",
+    )
+    parser.add_argument(
+        "--nsplits",
+        type=int,
+        default=1,
+        help="Total number of computing nodes to speed up evaluation",
+    )
+    parser.add_argument(
+        "--job",
+        type=int,
+        default=1,
+        help="Index of the current node (starting from 1)",
+    )
+
+    group = parser.add_argument_group("Distribution sketch related")
+    group.add_argument(
+        "--sketch",
+        type=str2bool,
+        default=False,
+        help="Whether to save a histogram and a quantile sketch of the scores of "
+        "each dataset in WADASNR_sketch.json (mergeable with sketch_tool.py)",
+    )
+    group.add_argument(
+        "--dataset_map",
+        type=str,
+        default=None,
+        help="Path to a file with one '<uid> <dataset>' per line. If not given, "
+        "the dataset of each sample is the prefix of its uid.",
+    )
+    group.add_argument(
+        "--dataset_delimiter",
+        type=str,
+        default="_",
+        help="The dataset is the part of the uid before the first delimiter",
     )
+    add_profiler_arguments(parser)
+    add_telemetry_arguments(parser)
+    add_tuned_config_arguments(parser, num_threads=False)
     args = parser.parse_args()
+    args = apply_tuned_config(parser, args)
 
     main(args)
@@ -0,0 +1,138 @@
+import os
+import sys
+from pathlib import Path
+
+import numpy as np
+
+from snr_sketch import load_sketches, merge_sketches, save_sketches
+
+
+QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+
+
+def summarize(sketch):
+    """Count, mean, std and quantiles of one ScoreSketch."""
+    hist = sketch.histogram
+    summary = {"count": hist.count, "mean": hist.mean(), "std": hist.std()}
+    for q in QUANTILES:
+        summary[f"p{round(q * 100)}"] = sketch.tdigest.quantile(q)
+    return summary
+
+
+def distribution_distances(sketch1, sketch2):
+    """Distances between the histograms of two ScoreSketch's with the same bins.
+
+    Returns:
+        ks (float): Kolmogorov-Smirnov statistic (max difference of the CDFs)
+        w1 (float): 1-Wasserstein distance (area between the CDFs, in score units)
+    """
+    hist1, hist2 = sketch1.histogram, sketch2.histogram
+    if (hist1.low, hist1.high, hist1.num_bins) != (
+        hist2.low,
+        hist2.high,
+        hist2.num_bins,
+    ):
+        raise ValueError("Cannot compare histograms with different bins")
+    diff = np.abs(hist1.cdf() - hist2.cdf())
+    width = (hist1.high - hist1.low) / hist1.num_bins
+    return float(diff.max()), float(diff[:-1].sum() * width)
+
+
+def write_table(rows, out):
+    header = list(rows[0].keys())
+    out.write("\t".join(header) + "\n")
+    for row in rows:
+        out.write(
+            "\t".join(
+                f"{v:.4f}" if isinstance(v, float) else str(v) for v in row.values()
+            )
+            + "\n"
+        )
+
+
+def save_table(rows, path=None):
+    """Write the rows to stdout, or atomically to `path` (via a temporary file)."""
+    if path is None:
+        write_table(rows, sys.stdout)
+        return
+    path = Path(path)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with tmp_path.open("w") as f:
+        write_table(rows, f)
+    os.replace(tmp_path, path)
+
+
+################################################################
+# Main entry
+################################################################
+def main(args):
+    # the output is only written once all inputs are loaded, so that it can
+    # safely be one of the inputs
+    if args.command == "merge":
+        metrics, sketches_list = zip(*[load_sketches(path) for path in args.inputs])
+        assert len(set(metrics)) == 1, f"Different metrics: {set(metrics)}"
+        save_sketches(merge_sketches(sketches_list), args.output, metrics[0])
+        print(f"Merged {len(args.inputs)} files into {args.output}")
+    elif args.command == "summary":
+        metric, sketches = load_sketches(args.input)
+        rows = [
+            {"metric": metric, "dataset": name, **summarize(sketch)}
+            for name, sketch in sketches.items()
+        ]
+        save_table(rows, args.output)
+    elif args.command == "compare":
+        metric1, sketches1 = load_sketches(args.input1)
+        metric2, sketches2 = load_sketches(args.input2)
+        assert metric1 == metric2, (metric1, metric2)
+        rows = []
+        for name in sketches1:
+            if name not in sketches2:
+                continue
+            s1, s2 = summarize(sketches1[name]), summarize(sketches2[name])
+            ks, w1 = distribution_distances(sketches1[name], sketches2[name])
+            row = {"metric": metric1, "dataset": name}
+            row.update({f"{k}_1": v for k, v in s1.items()})
+            row.update({f"{k}_2": v for k, v in s2.items()})
+            row["delta_mean"] = s2["mean"] - s1["mean"]
+            row["delta_p50"] = s2["p50"] - s1["p50"]
+            row["ks"] = ks
+            row["w1"] = w1
+            rows.append(row)
+        save_table(rows, args.output)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Merge, summarize or compare the distribution sketches saved by "
+        "`calculate_wada_snr.py --sketch true`"
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    p = subparsers.add_parser("merge", help="Merge sketches, e.g. of --nsplits jobs")
+    p.add_argument("inputs", type=str, nargs="+", help="Paths to the sketch files")
+    p.add_argument(
+        "--output", type=str, required=True, help="Path to the merged sketch file"
+    )
+
+    p = subparsers.add_parser(
+        "summary", help="Print the count, mean, std and quantiles of each dataset"
+    )
+    p.add_argument("input", type=str, help="Path to the sketch file")
+    p.add_argument(
+        "--output", type=str, default=None, help="Path to the output TSV file"
+    )
+
+    p = subparsers.add_parser(
+        "compare",
+        help="Compare two sketch files (e.g. original vs. enhanced) per dataset",
+    )
+    p.add_argument("input1", type=str, help="Path to the first sketch file")
+    p.add_argument("input2", type=str, help="Path to the second sketch file")
+    p.add_argument(
+        "--output", type=str, default=None, help="Path to the output TSV file"
+    )
+    args = parser.parse_args()
+
+    main(args)
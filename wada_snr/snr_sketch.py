@@ -0,0 +1,334 @@
+"""Mergeable summaries of score distributions (histograms and quantile sketches).
+
+Both summaries only keep a bounded amount of state regardless of the number of
+scores, can be merged across workers / jobs, and are serialized as JSON.
+"""
+import json
+import math
+import os
+from pathlib import Path
+
+import numpy as np
+
+
+class Histogram:
+    """Fixed-bin histogram with underflow / overflow counts and moments.
+
+    Args:
+        low (float): lower edge of the first bin
+        high (float): upper edge of the last bin
+        num_bins (int): number of bins of equal width
+    """
+
+    def __init__(self, low=-20.0, high=100.0, num_bins=240):
+        self.low = float(low)
+        self.high = float(high)
+        self.num_bins = int(num_bins)
+        self.counts = np.zeros(self.num_bins, dtype=np.int64)
+        self.underflow = 0
+        self.overflow = 0
+        self.num_nan = 0
+        self.total = 0.0
+        self.total_sq = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    @property
+    def edges(self):
+        return np.linspace(self.low, self.high, self.num_bins + 1)
+
+    @property
+    def count(self):
+        """Number of (non-NaN) values."""
+        return int(self.counts.sum()) + self.underflow + self.overflow
+
+    def update(self, values):
+        values = np.atleast_1d(np.asarray(values, dtype=np.float64))
+        nan = np.isnan(values)
+        self.num_nan += int(nan.sum())
+        values = values[~nan]
+        if len(values) == 0:
+            return
+        self.underflow += int((values < self.low).sum())
+        self.overflow += int((values >= self.high).sum())
+        inside = values[(values >= self.low) & (values < self.high)]
+        idx = ((inside - self.low) / (self.high - self.low) * self.num_bins).astype(int)
+        self.counts += np.bincount(
+            np.minimum(idx, self.num_bins - 1), minlength=self.num_bins
+        )
+        self.total += float(values.sum())
+        self.total_sq += float(np.square(values).sum())
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+
+    def merge(self, other):
+        if (self.low, self.high, self.num_bins) != (
+            other.low,
+            other.high,
+            other.num_bins,
+        ):
+            raise ValueError("Cannot merge histograms with different bins")
+        self.counts += other.counts
+        self.underflow += other.underflow
+        self.overflow += other.overflow
+        self.num_nan += other.num_nan
+        self.total += other.total
+        self.total_sq += other.total_sq
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    def mean(self):
+        return self.total / self.count if self.count else math.nan
+
+    def std(self):
+        if not self.count:
+            return math.nan
+        return math.sqrt(max(self.total_sq / self.count - self.mean() ** 2, 0.0))
+
+    def cdf(self):
+        """Cumulative ratio of values below each edge (len = num_bins + 1)."""
+        cum = self.underflow + np.concatenate([[0], np.cumsum(self.counts)])
+        return cum / max(self.count, 1)
+
+    def to_dict(self):
+        return {
+            "low": self.low,
+            "high": self.high,
+            "num_bins": self.num_bins,
+            "counts": self.counts.tolist(),
+            "underflow": self.underflow,
+            "overflow": self.overflow,
+            "num_nan": self.num_nan,
+            "total": self.total,
+            "total_sq": self.total_sq,
+            "min": self.min if self.count else None,
+            "max": self.max if self.count else None,
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+        hist = cls(d["low"], d["high"], d["num_bins"])
+        hist.counts = np.asarray(d["counts"], dtype=np.int64)
+        hist.underflow = d["underflow"]
+        hist.overflow = d["overflow"]
+        hist.num_nan = d["num_nan"]
+        hist.total = d["total"]
+        hist.total_sq = d["total_sq"]
+        hist.min = math.inf if d["min"] is None else d["min"]
+        hist.max = -math.inf if d["max"] is None else d["max"]
+        return hist
+
+
+class TDigest:
+    """Merging t-digest for estimating quantiles with bounded memory.
+
+    Values are buffered and periodically compressed into at most ~`compression`
+    weighted centroids, using the arcsine scale function so that the tails
+    (e.g. the 1st / 99th percentiles) are kept at a finer resolution.
+
+    Reference:
+        Ted Dunning and Otmar Ertl. Computing Extremely Accurate Quantiles Using
+        t-Digests. arXiv:1902.04023, 2019.
+
+    Args:
+        compression (float): accuracy parameter (larger is more accurate)
+        buffer_size (int): number of values buffered before compressing
+    """
+
+    def __init__(self, compression=200, buffer_size=2000):
+        self.compression = float(compression)
+        self.buffer_size = int(buffer_size)
+        self.means = np.zeros(0)
+        self.weights = np.zeros(0)
+        self._buffer = []
+        self.min = math.inf
+        self.max = -math.inf
+
+    @property
+    def count(self):
+        self._compress()
+        return float(self.weights.sum())
+
+    def _k(self, q):
+        return self.compression / (2 * math.pi) * math.asin(2 * q - 1)
+
+    def update(self, values):
+        values = np.atleast_1d(np.asarray(values, dtype=np.float64))
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        self._buffer.append(values)
+        if sum(len(b) for b in self._buffer) >= self.buffer_size:
+            self._compress()
+
+    def _compress(self, means=None, weights=None):
+        if means is None:
+            if not self._buffer:
+                return
+            new = np.concatenate(self._buffer)
+            means, weights = new, np.ones_like(new)
+            self._buffer = []
+        means = np.concatenate([self.means, means])
+        weights = np.concatenate([self.weights, weights])
+        order = np.argsort(means, kind="stable")
+        means, weights = means[order], weights[order]
+
+        total = weights.sum()
+        new_means, new_weights = [], []
+        cur_mean, cur_weight = means[0], weights[0]
+        weight_so_far = 0.0
+        k_low = self._k(0.0)
+        for mean, weight in zip(means[1:], weights[1:]):
+            q = (weight_so_far + cur_weight + weight) / total
+            if self._k(min(q, 1.0)) - k_low <= 1.0:
+                cur_weight += weight
+                cur_mean += (mean - cur_mean) * weight / cur_weight
+            else:
+                new_means.append(cur_mean)
+                new_weights.append(cur_weight)
+                weight_so_far += cur_weight
+                k_low = self._k(weight_so_far / total)
+                cur_mean, cur_weight = mean, weight
+        new_means.append(cur_mean)
+        new_weights.append(cur_weight)
+        self.means = np.asarray(new_means)
+        self.weights = np.asarray(new_weights)
+
+    def merge(self, other):
+        other._compress()
+        self._compress()
+        if len(other.weights):
+            self._compress(other.means.copy(), other.weights.copy())
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    def quantile(self, q):
+        """Estimate the q-th quantile (0 <= q <= 1)."""
+        self._compress()
+        if not len(self.weights):
+            return math.nan
+        if len(self.weights) == 1:
+            return float(self.means[0])
+        # each centroid is centered at the middle of its cumulative weight
+        centers = np.cumsum(self.weights) - self.weights / 2
+        xp = np.concatenate([[0.0], centers, [self.weights.sum()]])
+        fp = np.concatenate([[self.min], self.means, [self.max]])
+        return float(np.interp(q * self.weights.sum(), xp, fp))
+
+    def to_dict(self):
+        self._compress()
+        return {
+            "compression": self.compression,
+            "means": self.means.tolist(),
+            "weights": self.weights.tolist(),
+            "min": self.min if len(self.weights) else None,
+            "max": self.max if len(self.weights) else None,
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+        digest = cls(d["compression"])
+        digest.means = np.asarray(d["means"], dtype=np.float64)
+        digest.weights = np.asarray(d["weights"], dtype=np.float64)
+        digest.min = math.inf if d["min"] is None else d["min"]
+        digest.max = -math.inf if d["max"] is None else d["max"]
+        return digest
+
+
+class ScoreSketch:
+    """Histogram + quantile sketch of the scores of one dataset."""
+
+    def __init__(self, histogram=None, tdigest=None, **hist_kwargs):
+        self.histogram = histogram or Histogram(**hist_kwargs)
+        self.tdigest = tdigest or TDigest()
+
+    def update(self, values):
+        self.histogram.update(values)
+        self.tdigest.update(values)
+
+    def merge(self, other):
+        self.histogram.merge(other.histogram)
+        self.tdigest.merge(other.tdigest)
+        return self
+
+    def to_dict(self):
+        return {
+            "histogram": self.histogram.to_dict(),
+            "tdigest": self.tdigest.to_dict(),
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(
+            Histogram.from_dict(d["histogram"]), TDigest.from_dict(d["tdigest"])
+        )
+
+
+################################################################
+# Per-dataset sketches
+################################################################
+def dataset_of(uid, dataset_map=None, delimiter="_"):
+    """Dataset of `uid`, from `dataset_map` if given, else the uid prefix."""
+    if dataset_map is not None:
+        return dataset_map.get(uid, "unknown")
+    return uid.split(delimiter, 1)[0]
+
+
+def read_dataset_map(path):
+    """Read a mapping file with one "<uid> <dataset>" per line."""
+    dataset_map = {}
+    with open(path, "r") as f:
+        for line in f:
+            uid, dataset = line.strip().split(maxsplit=1)
+            dataset_map[uid] = dataset
+    return dataset_map
+
+
+def save_sketches(sketches, path, metric):
+    """Save {dataset: ScoreSketch} of `metric` as a JSON file.
+
+    The file is written atomically (via a temporary file and `os.replace`), so
+    that an existing file (e.g. one of the inputs of `sketch_tool.py merge`) is
+    never left truncated.
+    """
+    path = Path(path)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with tmp_path.open("w") as f:
+        json.dump(
+            {
+                "metric": metric,
+                "datasets": {name: s.to_dict() for name, s in sketches.items()},
+            },
+            f,
+        )
+    os.replace(tmp_path, path)
+
+
+def load_sketches(path):
+    """Load the output of `save_sketches`.
+
+    Returns:
+        metric (str): name of the metric
+        sketches (dict): {dataset: ScoreSketch}
+    """
+    with Path(path).open("r") as f:
+        d = json.load(f)
+    return d["metric"], {
+        name: ScoreSketch.from_dict(s) for name, s in d["datasets"].items()
+    }
+
+
+def merge_sketches(sketches_list):
+    """Merge several {dataset: ScoreSketch} dicts (e.g. from `--nsplits` jobs)."""
+    merged = {}
+    for sketches in sketches_list:
+        for name, sketch in sketches.items():
+            if name in merged:
+                merged[name].merge(sketch)
+            else:
+                merged[name] = sketch
+    return merged
@@ -0,0 +1,177 @@
+"""Fused computation of the signal statistics used by WADA-SNR.
+
+`wada_snr()` needs, for the normalized and clipped amplitude
+a = max(|x| / max|x|, min_val), the per-channel E[a], E[log a] and sum(a^2).
+Since the clipping threshold depends on max|x|, these statistics are computed
+from a single pass over |x| that accumulates
+
+    max|x|, sum |x|, sum log|x|, sum |x|^2 (over non-zero samples),
+    the number of zero samples and the smallest non-zero |x|,
+
+and the normalization / clipping is applied afterwards. This is exact as long
+as no non-zero sample falls below min_val * max|x| (always the case for audio
+decoded from 16/24-bit PCM); otherwise a second pass with the known threshold
+is made. Per-block sums are accumulated in float64 and no full-length temporary
+is made.
+
+A Numba kernel is used when Numba is installed, and a blockwise NumPy
+implementation (with fixed-size buffers) otherwise.
+"""
+import math
+
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+BLOCK_SIZE = 1 << 14
+
+
+################################################################
+# NumPy implementation (blockwise)
+################################################################
+def _fused_pass_numpy(x, block_size=BLOCK_SIZE):
+    num_channels = x.shape[1]
+    tiny = np.finfo(x.dtype).tiny
+    peak = 0.0
+    min_nonzero = math.inf
+    s1 = np.zeros(num_channels)
+    slog = np.zeros(num_channels)
+    s2 = np.zeros(num_channels)
+    num_zeros = np.zeros(num_channels, dtype=np.int64)
+    buf = np.empty((min(block_size, len(x)), num_channels), dtype=x.dtype)
+    for start in range(0, len(x), block_size):
+        block = x[start : start + block_size]
+        a = buf[: len(block)]
+        np.abs(block, out=a)
+        peak = max(peak, float(a.max()))
+        a_min = float(a.min())
+        if a_min == 0:
+            num_zeros += len(a) - np.count_nonzero(a, axis=0)
+            min_nonzero = min(min_nonzero, float(a.min(where=a > 0, initial=np.inf)))
+        else:
+            min_nonzero = min(min_nonzero, a_min)
+        # block sums (pairwise in the input precision), accumulated in float64
+        s1 += a.sum(axis=0)
+        s2 += np.einsum("ij,ij->j", a, a)
+        if a_min < tiny:
+            # log(tiny) is subtracted for each zero sample afterwards
+            np.maximum(a, tiny, out=a)
+        np.log(a, out=a)
+        # (the sum of logs is sensitive to rounding at high SNRs)
+        slog += a.sum(axis=0, dtype=np.float64)
+    slog -= num_zeros * math.log(tiny)
+    # values below `tiny` other than zeros are not exact (see `wada_stats`)
+    min_nonzero = min_nonzero if min_nonzero >= tiny else 0.0
+    return peak, s1, slog, s2, num_zeros, min_nonzero
+
+
+def _clipped_pass_numpy(x, threshold, block_size=BLOCK_SIZE):
+    num_channels = x.shape[1]
+    s1 = np.zeros(num_channels)
+    slog = np.zeros(num_channels)
+    s2 = np.zeros(num_channels)
+    buf = np.empty((min(block_size, len(x)), num_channels), dtype=np.float64)
+    for start in range(0, len(x), block_size):
+        block = x[start : start + block_size]
+        a = buf[: len(block)]
+        np.abs(block, out=a)
+        np.maximum(a, threshold, out=a)
+        s1 += a.sum(axis=0)
+        s2 += np.einsum("ij,ij->j", a, a)
+        np.log(a, out=a)
+        slog += a.sum(axis=0)
+    return s1, slog, s2
+
+
+################################################################
+# Numba implementation
+################################################################
+if numba is not None:
+
+    @numba.njit(cache=True, nogil=True)
+    def _fused_pass_numba(x):
+        num_samples, num_channels = x.shape
+        peak = 0.0
+        min_nonzero = np.inf
+        s1 = np.zeros(num_channels)
+        slog = np.zeros(num_channels)
+        s2 = np.zeros(num_channels)
+        num_zeros = np.zeros(num_channels, dtype=np.int64)
+        for t in range(num_samples):
+            for c in range(num_channels):
+                a = abs(np.float64(x[t, c]))
+                if a > peak:
+                    peak = a
+                if a == 0.0:
+                    num_zeros[c] += 1
+                    continue
+                if a < min_nonzero:
+                    min_nonzero = a
+                s1[c] += a
+                slog[c] += np.log(a)
+                s2[c] += a * a
+        return peak, s1, slog, s2, num_zeros, min_nonzero
+
+    @numba.njit(cache=True, nogil=True)
+    def _clipped_pass_numba(x, threshold):
+        num_samples, num_channels = x.shape
+        s1 = np.zeros(num_channels)
+        slog = np.zeros(num_channels)
+        s2 = np.zeros(num_channels)
+        for t in range(num_samples):
+            for c in range(num_channels):
+                a = max(abs(np.float64(x[t, c])), threshold)
+                s1[c] += a
+                slog[c] += np.log(a)
+                s2[c] += a * a
+        return s1, slog, s2
+
+
+def wada_stats(audio, min_val=1e-10, backend=None):
+    """Statistics of the normalized and clipped amplitude of each channel.
+
+    Equivalent to (up to floating-point rounding):
+        a = np.clip(np.abs(audio / np.max(np.abs(audio))), min_val, None)
+        return np.mean(a, axis=0), np.mean(np.log(a), axis=0), np.sum(a**2, axis=0)
+
+    Args:
+        audio (np.ndarray): input audio signal (time, [channels])
+        min_val (float): minimum value of the normalized amplitude
+        backend (str): "numba" or "numpy" (default: "numba" if installed)
+    Returns:
+        mean (np.ndarray): E[a] of each channel
+        logmean (np.ndarray): E[log a] of each channel
+        energy (np.ndarray): sum(a^2) of each channel
+    """
+    if backend is None:
+        backend = "numba" if numba is not None else "numpy"
+    if backend == "numba" and numba is None:
+        raise ImportError("Numba is not installed")
+    x = np.ascontiguousarray(audio)
+    x = x[:, None] if x.ndim == 1 else x.reshape(len(x), -1)
+    num_samples, num_channels = x.shape
+    if num_samples == 0:
+        return (np.full(num_channels, np.nan),) * 3
+    fused_pass = _fused_pass_numba if backend == "numba" else _fused_pass_numpy
+    peak, s1, slog, s2, num_zeros, min_nonzero = fused_pass(x)
+    if not (0 < peak < math.inf):
+        # all-zero or non-finite signals (NaN in the original implementation)
+        return (np.full(num_channels, np.nan),) * 3
+
+    threshold = min_val * peak
+    if min_nonzero >= threshold:
+        # only the zero samples are clipped
+        s1 = s1 + num_zeros * threshold
+        slog = slog + num_zeros * math.log(threshold)
+        s2 = s2 + num_zeros * threshold**2
+    else:
+        clipped_pass = _clipped_pass_numba if backend == "numba" else _clipped_pass_numpy
+        s1, slog, s2 = clipped_pass(x, threshold)
+    mean = s1 / (num_samples * peak)
+    logmean = slog / num_samples - math.log(peak)
+    energy = s2 / peak**2
+    return mean, logmean, energy